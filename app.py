@@ -54,7 +54,7 @@ from ui import (
 )
 
 # Import metric computation functions (NO Streamlit UI dependencies)
-from metrics import compute_mastery, decay_factor, compute_readiness
+from metrics import compute_mastery_bulk, decay_factor, compute_readiness
 
 
 def generate_recommendations(topics_scored: pd.DataFrame, upcoming_lectures: pd.DataFrame, days_left: int, today: date, is_retake: bool = False) -> list:
@@ -432,7 +432,7 @@ def show_auth_page():
                                 st.session_state.user_id = -1  # Special admin ID
                                 st.session_state.user_email = admin_username
                                 st.session_state.is_admin = True
-                                log_event(None, "admin_login", f'{{"username": "{admin_username}"}}')
+                                log_event(None, "admin_login", {"username": admin_username})
                                 st.success("Admin login successful!")
                                 st.rerun()
                             else:
@@ -450,12 +450,21 @@ if st.session_state.user_id is None:
     st.stop()
 
 # ============ ADMIN DASHBOARD ============
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_admin_stats() -> dict:
+    """Admin counters, reused across reruns for up to a minute."""
+    return get_admin_stats()
+
 if st.session_state.is_admin:
     st.title("👑 Admin Dashboard")
-    st.caption("System usage metrics and analytics.")
+    st.caption("System usage metrics and analytics (refreshed every minute).")
     
+    col_logout, col_refresh, _ = st.columns([1, 1, 4])
+    if col_refresh.button("🔄 Refresh"):
+        _cached_admin_stats.clear()
+
     # Logout button
-    if st.button("🚪 Logout"):
+    if col_logout.button("🚪 Logout"):
         # Revoke token and clear cookie (for regular users, admin doesn't use persistent tokens)
         if HAS_COOKIE_MANAGER:
             auth_token = cookie_manager.get("auth_token")
@@ -474,7 +483,7 @@ if st.session_state.is_admin:
     st.divider()
     
     # Get admin stats
-    stats = get_admin_stats()
+    stats = _cached_admin_stats()
     
     # Live users section
     st.subheader("🟢 Live Users")
@@ -1926,9 +1935,10 @@ with tabs[0]:
 
                 # ============ COMPUTE TOPICS_SCORED FOR RECOMMENDATIONS/STUDY PLAN ============
                 # We still need topics_scored for the recommendation engine and study plan
+                mastery_by_topic = compute_mastery_bulk(course_id, today, is_retake)
                 mastery_data = []
                 for _, row in topics_df.iterrows():
-                    m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = compute_mastery(int(row["id"]), today, is_retake)
+                    m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = mastery_by_topic[int(row["id"])]
                     mastery_data.append({
                         "id": row["id"],
                         "topic_name": row["topic_name"],
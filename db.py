@@ -16,13 +16,19 @@ Usage:
     init_db()  # Runs migrations, validates schema
 """
 
+import json
 import os
 import sqlite3
+import sys
+import threading
+import time
+import uuid
 from contextlib import contextmanager
-from datetime import datetime
+from functools import lru_cache
+from datetime import date, datetime
 from pathlib import Path
 from typing import Optional, Dict
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, quote
 import pandas as pd
 
 # Try to import bcrypt for password hashing
@@ -41,11 +47,20 @@ except ImportError:
 
 try:
     import psycopg2
+    import psycopg2.pool
+    from psycopg2.extensions import connection as _PgConnectionBase
     from psycopg2.extras import RealDictCursor
     HAS_PSYCOPG2 = True
 except ImportError:
     HAS_PSYCOPG2 = False
 
+# Optional: connectorx reads Postgres results straight into Arrow-backed DataFrames
+try:
+    import connectorx as cx
+    HAS_CONNECTORX = True
+except ImportError:
+    HAS_CONNECTORX = False
+
 # ============ CONNECTION CONFIG ============
 
 # Database file lives in the same directory as this module
@@ -203,34 +218,197 @@ def is_postgres() -> bool:
 
 # ============ CONNECTION HELPERS ============
 
+# SQLite files already switched to WAL in this process (journal_mode is persistent)
+_sqlite_wal_paths = set()
+
+
+def _sqlite_lower(value):
+    """Unicode-aware replacement for SQLite's ASCII-only lower()."""
+    return value.lower() if isinstance(value, str) else value
+
+
+def _connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite connection with performance PRAGMAs applied.
+
+    WAL lets readers run alongside the writer and avoids an fsync per commit;
+    mmap and a larger page cache cut read syscalls. journal_mode is stored in
+    the database file, so it is only set once per path per process.
+
+    lower() is overridden with Python's str.lower so the topic-link triggers
+    (migration 023) fold non-ASCII names like "Ökonomie" the same way the
+    Python-side matching always did.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=128)
+    conn.create_function("lower", 1, _sqlite_lower, deterministic=True)
+    if path not in _sqlite_wal_paths:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        _sqlite_wal_paths.add(path)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA mmap_size=268435456;")
+    conn.execute("PRAGMA cache_size=-64000;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+
+if HAS_PSYCOPG2:
+    class _PgConnection(_PgConnectionBase):
+        """psycopg2 connection that remembers which statements it has PREPAREd."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+
+
+# Postgres connection pool (created on first use; config is resolved lazily)
+_pg_pool = None
+PG_POOL_MIN = 1
+PG_POOL_MAX = 10
+
+
+def _pg_connect_kwargs() -> Dict:
+    """psycopg2.connect keyword arguments for the current config."""
+    config = _get_db_config()
+    return {
+        'host': config['host'],
+        'port': config['port'],
+        'database': config['database'],
+        'user': config['user'],
+        'password': config['password'],
+        'connection_factory': _PgConnection,
+    }
+
+
+def _connect_postgres():
+    """Open a new (unpooled) Postgres connection."""
+    return psycopg2.connect(**_pg_connect_kwargs())
+
+
+def _get_pg_pool():
+    """Return the process-wide Postgres connection pool, creating it if needed."""
+    global _pg_pool
+    if _pg_pool is None:
+        _pg_pool = psycopg2.pool.ThreadedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, **_pg_connect_kwargs())
+    return _pg_pool
+
+
+# Connection of the transaction() / shared_connection() block open on this thread, if any
+_tx_state = threading.local()
+
+# Parsed and planned but returns no rows and reads nothing (valid on both backends)
+_PROBE_SQL = "SELECT 1 WHERE 1 = 0"
+
+
 @contextmanager
 def get_conn():
     """
     Get a database connection (Postgres or SQLite).
     Use as context manager: with get_conn() as conn: ...
+    Inside a transaction() or shared_connection() block this yields that block's connection.
     """
+    tx_conn = getattr(_tx_state, "conn", None) or getattr(_tx_state, "shared", None)
+    if tx_conn is not None:
+        yield tx_conn
+        return
     config = _get_db_config()
     if config['type'] == 'postgres':
-        conn = psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            database=config['database'],
-            user=config['user'],
-            password=config['password'],
-        )
+        pool = _get_pg_pool()
+        try:
+            conn = pool.getconn()
+        except psycopg2.pool.PoolError:
+            # Pool exhausted (e.g. nested get_conn calls) - use a one-off connection
+            conn = None
+        if conn is None:
+            conn = _connect_postgres()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
         try:
             yield conn
         finally:
-            conn.close()
+            # putconn rolls back any uncommitted transaction before reuse
+            pool.putconn(conn, close=bool(conn.closed))
     else:
-        conn = sqlite3.connect(config['path'], check_same_thread=False)
-        conn.execute("PRAGMA foreign_keys = ON;")
+        conn = _connect_sqlite(config['path'])
         try:
             yield conn
         finally:
             conn.close()
 
 
+def _commit(conn) -> None:
+    """Commit, unless conn belongs to an open transaction() block (it commits at exit)."""
+    if getattr(_tx_state, "conn", None) is not conn:
+        conn.commit()
+
+
+@contextmanager
+def transaction():
+    """
+    Run several helper calls as one transaction: with transaction(): ...
+    execute() / fetchone() / etc. inside the block share one connection and
+    skip their per-statement commit; the block commits once on exit and
+    rolls back if it raises. Nested blocks join the outer transaction.
+    SQLite takes the write lock up front (BEGIN IMMEDIATE).
+    """
+    if getattr(_tx_state, "conn", None) is not None:
+        yield _tx_state.conn
+        return
+    with get_conn() as conn:
+        if not is_postgres():
+            conn.execute("BEGIN IMMEDIATE")
+        _tx_state.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _tx_state.conn = None
+
+
+def _probe(conn) -> bool:
+    """True if conn answers a zero-row query."""
+    try:
+        cur = conn.cursor()
+        cur.execute(_PROBE_SQL)
+        cur.fetchall()
+        return True
+    except Exception:
+        return False
+
+
+@contextmanager
+def shared_connection():
+    """
+    Route every get_conn() on this thread to one connection for the block,
+    e.g. startup's migrate + repair + validate. Unlike transaction(), helpers
+    still commit per call; this only saves the connect / pool checkout per call.
+    The connection is probed first: a pooled Postgres connection the server
+    dropped is discarded by the pool and replaced once. Nested blocks join.
+    """
+    if getattr(_tx_state, "conn", None) is not None or getattr(_tx_state, "shared", None) is not None:
+        yield
+        return
+    for attempt in range(2):
+        with get_conn() as conn:
+            if attempt == 0 and not _probe(conn):
+                continue
+            _tx_state.shared = conn
+            try:
+                yield conn
+            finally:
+                _tx_state.shared = None
+            return
+
+
 def get_conn_raw():
     """
     Get a raw connection (not context manager).
@@ -238,21 +416,19 @@ def get_conn_raw():
     """
     config = _get_db_config()
     if config['type'] == 'postgres':
-        return psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            database=config['database'],
-            user=config['user'],
-            password=config['password'],
-        )
+        return _connect_postgres()
     else:
-        conn = sqlite3.connect(config['path'], check_same_thread=False)
-        conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+        return _connect_sqlite(config['path'])
 
 # ============ QUERY HELPERS ============
 
-def execute(query: str, params: tuple = None, commit: bool = True):
+@lru_cache(maxsize=256)
+def _pg_query(query: str) -> str:
+    """Convert SQLite ? placeholders to Postgres %s (cached per query string)."""
+    return query.replace("?", "%s")
+
+
+def _execute_sqlite(query: str, params: tuple = None, commit: bool = True):
     """
     Execute a query with optional parameters.
     Returns the cursor (useful for lastrowid).
@@ -260,44 +436,92 @@ def execute(query: str, params: tuple = None, commit: bool = True):
     with get_conn() as conn:
         cur = conn.cursor()
         if params:
-            # Convert SQLite ? placeholders to Postgres %s if needed
-            if is_postgres():
-                query = query.replace("?", "%s")
             cur.execute(query, params)
         else:
             cur.execute(query)
         if commit:
-            conn.commit()
+            _commit(conn)
+        return cur
+
+
+def _execute_pg(query: str, params: tuple = None, commit: bool = True):
+    """Postgres execute(): converts ? placeholders when params are given."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if params:
+            cur.execute(_pg_query(query), params)
+        else:
+            cur.execute(query)
+        if commit:
+            _commit(conn)
         return cur
 
-def execute_returning(query: str, params: tuple = None) -> int:
+
+def _execute_returning_sqlite(query: str, params: tuple = None) -> int:
     """
-    Execute an INSERT query and return the inserted ID.
-    Handles both SQLite (lastrowid) and Postgres (RETURNING id).
+    Execute an INSERT query and return the inserted ID (cursor.lastrowid).
     """
     with get_conn() as conn:
         cur = conn.cursor()
-        if is_postgres():
-            # Add RETURNING id if not present
-            query = query.replace("?", "%s")
-            if "RETURNING" not in query.upper():
-                query = query.rstrip(";").rstrip(")") + ") RETURNING id"
-            cur.execute(query, params)
-            result = cur.fetchone()
-            conn.commit()
-            return result[0] if result else None
-        else:
-            cur.execute(query, params)
-            conn.commit()
-            return cur.lastrowid
+        cur.execute(query, params)
+        _commit(conn)
+        return cur.lastrowid
+
 
-def read_sql(query: str, params: tuple = None) -> pd.DataFrame:
+@lru_cache(maxsize=256)
+def _pg_returning_query(query: str) -> str:
+    """Convert placeholders and append RETURNING id if not present."""
+    query = _pg_query(query)
+    if "RETURNING" not in query.upper():
+        query = query.rstrip(";").rstrip(")") + ") RETURNING id"
+    return query
+
+
+def _execute_returning_pg(query: str, params: tuple = None) -> int:
+    """Postgres execute_returning(): appends RETURNING id and fetches it."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_pg_returning_query(query), params)
+        result = cur.fetchone()
+        _commit(conn)
+        return result[0] if result else None
+
+def _postgres_uri() -> str:
+    """Build a postgresql:// URI from the current config (for connectorx)."""
+    config = _get_db_config()
+    return (
+        f"postgresql://{quote(str(config['user']), safe='')}:{quote(str(config['password']), safe='')}"
+        f"@{config['host']}:{config['port']}/{config['database']}"
+    )
+
+
+def _bind_postgres_params(query: str, params: tuple) -> str:
+    """
+    Inline parameters into a %s-style query using psycopg2's adapters.
+    connectorx has no bind-parameter API, so values are quoted client-side
+    exactly as psycopg2 would quote them.
+    """
+    from psycopg2.extensions import adapt
+    quoted = []
+    for value in params:
+        adapted = adapt(value)
+        if hasattr(adapted, "encoding"):
+            adapted.encoding = "utf8"
+        quoted.append(adapted.getquoted().decode("utf-8"))
+    return query % tuple(quoted)
+
+
+def _read_sql_connectorx(query: str, params: tuple = None) -> pd.DataFrame:
+    """Read a Postgres query via connectorx's binary protocol into pandas."""
+    if params:
+        query = _bind_postgres_params(query, params)
+    return cx.read_sql(_postgres_uri(), query, return_type="pandas", protocol="binary")
+
+
+def _read_sql_pandas(query: str, params: tuple = None) -> pd.DataFrame:
     """
     Execute a SELECT query and return a pandas DataFrame.
     """
-    if is_postgres():
-        query = query.replace("?", "%s")
-    
     conn = get_conn_raw()
     try:
         df = pd.read_sql_query(query, conn, params=params)
@@ -305,67 +529,274 @@ def read_sql(query: str, params: tuple = None) -> pd.DataFrame:
     finally:
         conn.close()
 
-def fetchone(query: str, params: tuple = None):
+
+def _read_sql_pg(query: str, params: tuple = None) -> pd.DataFrame:
+    """Postgres read_sql()."""
+    return _read_sql_pandas(_pg_query(query), params)
+
+
+# With PG_READ_CONNECTORX=1 (and connectorx installed) read_sql_bulk() reads
+# Postgres results over connectorx's binary protocol. Opt-in: each read opens
+# its own connection outside the pool and ignores any open transaction.
+PG_READ_CONNECTORX = os.environ.get("PG_READ_CONNECTORX", "0") == "1"
+
+
+def read_sql_bulk(query: str, params: tuple = None) -> pd.DataFrame:
+    """
+    read_sql() for large result sets. On Postgres with PG_READ_CONNECTORX=1
+    the rows are read over the binary protocol straight into Arrow, skipping
+    pandas.read_sql_query's per-row tuples.
+
+    That result differs from read_sql(): DATE columns come back as
+    datetime64 rather than datetime.date and nullable integers as
+    Int64/float. Use it only where the caller normalizes dates and reads
+    NOT NULL integers.
+    """
+    if PG_READ_CONNECTORX and HAS_CONNECTORX and is_postgres():
+        return _read_sql_connectorx(_pg_query(query), params)
+    return read_sql(query, params)
+
+def read_sql_iter(query: str, params: tuple = None, chunksize: int = 10_000):
+    """
+    Execute a SELECT query and yield DataFrames of up to `chunksize` rows.
+    Postgres uses a named (server-side) cursor and SQLite uses fetchmany,
+    so only one chunk is held in memory at a time.
+    """
+    with get_conn() as conn:
+        if is_postgres():
+            query = _pg_query(query)
+            # Unique name: two iterators open on one (shared) connection must not collide
+            cur = conn.cursor(name=f"read_sql_iter_{uuid.uuid4().hex}")
+            cur.itersize = chunksize
+        else:
+            cur = conn.cursor()
+            cur.arraysize = chunksize
+        try:
+            cur.execute(query, params if params else ())
+            columns = None
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if columns is None:
+                    columns = [d[0] for d in cur.description]
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=columns)
+        finally:
+            cur.close()
+
+def _fetchone_sqlite(query: str, params: tuple = None):
     """
     Execute a query and return one row.
     """
     with get_conn() as conn:
         cur = conn.cursor()
-        if is_postgres():
-            query = query.replace("?", "%s")
         cur.execute(query, params if params else ())
         return cur.fetchone()
 
-def fetchall(query: str, params: tuple = None):
+
+def _fetchone_pg(query: str, params: tuple = None):
+    """Postgres fetchone()."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_pg_query(query), params if params else ())
+        return cur.fetchone()
+
+def fetchone_dict(query: str, params: tuple = None) -> Optional[Dict]:
+    """
+    Execute a query and return one row as a dict keyed by column name.
+    Rows are built by the driver (RealDictCursor / sqlite3.Row) rather
+    than by positional indexing.
+    """
+    with get_conn() as conn:
+        if is_postgres():
+            query = _pg_query(query)
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        else:
+            cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
+        cur.execute(query, params if params else ())
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+# Statements issued on every login / page refresh. With PG_PREPARE_STATEMENTS=1
+# each pooled Postgres connection PREPAREs them once and then only sends
+# EXECUTE, skipping parse + plan; SQLite already caches them via
+# cached_statements. Opt-in: named prepared statements live on one server
+# session, so they break behind pgbouncer / transaction-mode poolers.
+PG_PREPARE_STATEMENTS = os.environ.get("PG_PREPARE_STATEMENTS", "0") == "1"
+
+PREPARED_STATEMENTS: Dict[str, str] = {
+    "user_id_by_email": "SELECT id FROM users WHERE email=?",
+    "user_id_by_username": "SELECT id FROM users WHERE username=?",
+    "user_by_email": (
+        "SELECT id, email, username, password_hash, created_at, last_login_at "
+        "FROM users WHERE email=?"
+    ),
+    # Admin dashboard counters (the page reruns on every interaction)
+    "total_users": "SELECT COUNT(*) FROM users",
+    "users_created_since": "SELECT COUNT(*) FROM users WHERE created_at_epoch >= ?",
+    "event_count": "SELECT COUNT(*) FROM events WHERE event_name=?",
+    "event_count_since": "SELECT COUNT(*) FROM events WHERE event_name=? AND event_time_epoch >= ?",
+    "event_users": "SELECT COUNT(DISTINCT user_id) FROM events WHERE event_name=?",
+    "event_users_since": (
+        "SELECT COUNT(DISTINCT user_id) FROM events WHERE event_name=? AND event_time_epoch >= ?"
+    ),
+    "upsert_session": (
+        "INSERT INTO sessions(user_id, session_id, last_seen_at, last_seen_epoch) VALUES(?,?,?,?) "
+        "ON CONFLICT(user_id, session_id) DO UPDATE "
+        "SET last_seen_at=excluded.last_seen_at, last_seen_epoch=excluded.last_seen_epoch"
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _pg_numbered(query: str) -> str:
+    """Convert ? placeholders to PREPARE-style $1, $2, ..."""
+    parts = query.split("?")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+
+
+def _execute_prepared(conn, cur, name: str, params: tuple):
+    """Run a PREPARED_STATEMENTS entry on cur, preparing it on conn if needed."""
+    query = PREPARED_STATEMENTS[name]
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None or not PG_PREPARE_STATEMENTS:
+        # SQLite, a foreign Postgres connection or PREPARE disabled: plain execute
+        cur.execute(_pg_query(query) if is_postgres() else query, params)
+        return
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {_pg_numbered(query)}")
+        prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+def fetchone_prepared(name: str, params: tuple, as_dict: bool = False):
+    """Execute a PREPARED_STATEMENTS entry and return one row (optionally as a dict)."""
+    with get_conn() as conn:
+        if not as_dict:
+            cur = conn.cursor()
+        elif is_postgres():
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        else:
+            cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
+        _execute_prepared(conn, cur, name, params)
+        row = cur.fetchone()
+        if as_dict:
+            return dict(row) if row else None
+        return row
+
+
+def execute_prepared(name: str, params: tuple):
+    """Execute a PREPARED_STATEMENTS entry and commit. Returns the cursor."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        _execute_prepared(conn, cur, name, params)
+        _commit(conn)
+        return cur
+
+
+def _fetchall_sqlite(query: str, params: tuple = None):
     """
     Execute a query and return all rows.
     """
     with get_conn() as conn:
         cur = conn.cursor()
-        if is_postgres():
-            query = query.replace("?", "%s")
         cur.execute(query, params if params else ())
         return cur.fetchall()
 
+
+def _fetchall_pg(query: str, params: tuple = None):
+    """Postgres fetchall()."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_pg_query(query), params if params else ())
+        return cur.fetchall()
+
+
+def _specialize_backend():
+    """
+    Bind execute / execute_returning / read_sql / fetchone / fetchall to the
+    implementation for the configured backend. The backend cannot change
+    while the app runs, so the per-call is_postgres() branch is resolved
+    once here (at import). Call again only if the config cache is replaced.
+    """
+    global execute, execute_returning, read_sql, fetchone, fetchall
+    if is_postgres():
+        execute, execute_returning = _execute_pg, _execute_returning_pg
+        read_sql, fetchone, fetchall = _read_sql_pg, _fetchone_pg, _fetchall_pg
+    else:
+        execute, execute_returning = _execute_sqlite, _execute_returning_sqlite
+        read_sql, fetchone, fetchall = _read_sql_pandas, _fetchone_sqlite, _fetchall_sqlite
+    # The migrations runner caches the dialect too
+    runner = sys.modules.get("migrations.runner")
+    if runner is not None:
+        runner._is_postgres.cache_clear()
+
+
+_specialize_backend()
+
 # ============ SCHEMA HELPERS ============
 
+# {table: frozenset(columns)} for the whole database, read in one query on
+# first use. Schema changes (migrations, repairs, legacy init) call
+# invalidate_schema_cache() so the next lookup re-reads it.
+_schema_cache: Optional[Dict[str, frozenset]] = None
+# The same snapshot as (table, column) pairs
+_schema_pairs_cache: Optional[frozenset] = None
+
+
+def get_schema() -> Dict[str, frozenset]:
+    """Return the cached {table: frozenset(columns)} snapshot of the database."""
+    global _schema_cache, _schema_pairs_cache
+    if _schema_cache is None:
+        if is_postgres():
+            # pg_catalog directly: information_schema.columns is a view over
+            # the same catalogs plus privilege checks, several times slower
+            rows = fetchall(
+                """SELECT c.relname, a.attname FROM pg_catalog.pg_attribute a
+                   JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+                   JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                   WHERE c.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+                     AND n.nspname = ANY(current_schemas(false))"""
+            )
+        else:
+            rows = fetchall(
+                """SELECT m.name, p.name FROM sqlite_master m
+                   JOIN pragma_table_info(m.name) p
+                   WHERE m.type = 'table'"""
+            )
+        _schema_pairs_cache = frozenset((table, column) for table, column in rows)
+        schema: Dict[str, set] = {}
+        for table, column in _schema_pairs_cache:
+            schema.setdefault(table, set()).add(column)
+        _schema_cache = {table: frozenset(columns) for table, columns in schema.items()}
+    return _schema_cache
+
+
+def get_schema_pairs() -> frozenset:
+    """The same snapshot as a frozenset of (table, column) pairs, for set-difference diffs."""
+    get_schema()
+    return _schema_pairs_cache
+
+
+def invalidate_schema_cache() -> None:
+    """Drop the schema snapshot; call after any DDL."""
+    global _schema_cache, _schema_pairs_cache
+    _schema_cache = None
+    _schema_pairs_cache = None
+
+
 def table_exists(table: str) -> bool:
     """Check if a table exists."""
-    if is_postgres():
-        row = fetchone(
-            "SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = %s)",
-            (table,)
-        )
-        return row[0] if row else False
-    else:
-        row = fetchone(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-            (table,)
-        )
-        return row is not None
+    return table in get_schema()
 
 def column_exists(table: str, column: str) -> bool:
     """Check if a column exists in a table."""
-    if is_postgres():
-        row = fetchone(
-            """SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = %s
-            )""",
-            (table, column)
-        )
-        return row[0] if row else False
-    else:
-        from security import validate_table_name
-        # Validate table name to prevent SQL injection in PRAGMA
-        try:
-            validated_table = validate_table_name(table)
-        except ValueError:
-            return False
-        with get_conn() as conn:
-            cur = conn.execute(f"PRAGMA table_info({validated_table})")
-            columns = [r[1] for r in cur.fetchall()]
-            return column in columns
+    return column in get_schema().get(table, ())
 
 # ============ INIT DB ============
 
@@ -374,11 +805,13 @@ def init_db(validate: bool = True, verbose: bool = False):
     Initialize database schema using migrations system.
 
     This function:
+    0. Returns immediately if the stored schema fingerprint matches this build
     1. Runs all pending migrations in order (with auto-repair for SQLite)
     2. Validates schema matches expected structure (prevents missing column bugs)
     3. Auto-repairs missing tables and columns
     4. Logs issues to stderr for Streamlit Cloud visibility
     5. Does NOT crash the app - logs warnings and continues
+    6. Records the fingerprint once the schema validates clean
 
     Args:
         validate: If True (default), validate schema after migrations.
@@ -395,32 +828,48 @@ def init_db(validate: bool = True, verbose: bool = False):
         # Verbose mode for debugging
         init_db(verbose=True)
     """
-    import sys
-    from migrations import run_migrations, validate_schema, repair_schema, SchemaError
+    from migrations import (
+        run_migrations, validate_schema, repair_schema, SchemaError,
+        schema_is_current, record_schema_fingerprint,
+    )
+
+    # The database (path or backend) may have changed since the last snapshot
+    invalidate_schema_cache()
 
     try:
-        # Run all pending migrations (includes auto-repair)
-        applied = run_migrations(verbose=verbose, auto_repair=True)
-
-        # Validate schema to catch missing columns BEFORE app runs
-        # validate_schema also attempts auto-repair before failing
-        if validate:
-            # Don't raise on error - we want to log and continue
-            issues = validate_schema(raise_on_error=False, auto_repair=True)
-
-            if issues:
-                # Log detailed issues to stderr (visible in Streamlit Cloud logs)
-                print(f"[db] WARNING: Schema validation found issues after auto-repair:", file=sys.stderr)
-                for table, cols in issues.items():
-                    if cols == ["TABLE_MISSING"]:
-                        print(f"[db]   - Missing table: {table}", file=sys.stderr)
-                    else:
-                        print(f"[db]   - Table '{table}' missing columns: {cols}", file=sys.stderr)
-                print(f"[db] The app will continue but some features may not work.", file=sys.stderr)
-                print(f"[db] Database: {get_database_url()}", file=sys.stderr)
-
-        if verbose:
-            print(f"[db] Initialized. Using: {get_database_url()}")
+        # One connection for migrate + repair + validate
+        with shared_connection():
+            # Same schema and migration list as the last clean start: nothing to do
+            if schema_is_current():
+                if verbose:
+                    print(f"[db] Schema up to date (fingerprint match). Using: {get_database_url()}")
+                return
+
+            # Run all pending migrations (includes auto-repair)
+            applied = run_migrations(verbose=verbose, auto_repair=True)
+
+            # Validate schema to catch missing columns BEFORE app runs
+            # validate_schema also attempts auto-repair before failing
+            if validate:
+                # Don't raise on error - we want to log and continue
+                issues = validate_schema(raise_on_error=False, auto_repair=True)
+
+                if issues:
+                    # Log detailed issues to stderr (visible in Streamlit Cloud logs)
+                    print(f"[db] WARNING: Schema validation found issues after auto-repair:", file=sys.stderr)
+                    for table, cols in issues.items():
+                        if cols == ["TABLE_MISSING"]:
+                            print(f"[db]   - Missing table: {table}", file=sys.stderr)
+                        else:
+                            print(f"[db]   - Table '{table}' missing columns: {cols}", file=sys.stderr)
+                    print(f"[db] The app will continue but some features may not work.", file=sys.stderr)
+                    print(f"[db] Database: {get_database_url()}", file=sys.stderr)
+                else:
+                    # Clean: later starts can skip straight past this block
+                    record_schema_fingerprint()
+
+            if verbose:
+                print(f"[db] Initialized. Using: {get_database_url()}")
 
     except SchemaError as e:
         # SchemaError shouldn't be raised anymore with raise_on_error=False,
@@ -439,6 +888,188 @@ def init_db(validate: bool = True, verbose: bool = False):
         # Don't re-raise - let the app try to run
 
 
+# Single table descriptor for the legacy inline schema, rendered into one DDL
+# script per dialect at import. A spec is either shared SQL or a
+# {dialect: SQL} dict where the original SQLite schema was looser than the
+# Postgres one; "pk" renders the dialect's primary key.
+LEGACY_TABLES = [
+    ("users", [
+        ("id", "pk"),
+        ("email", "TEXT UNIQUE NOT NULL"),
+        ("username", "TEXT UNIQUE"),
+        ("password_hash", {"sqlite": "TEXT DEFAULT ''", "postgres": "TEXT NOT NULL DEFAULT ''"}),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("last_login_at", "TIMESTAMP"),
+    ]),
+    ("courses", [
+        ("id", "pk"),
+        ("user_id", {"sqlite": "INTEGER REFERENCES users(id)", "postgres": "INTEGER NOT NULL REFERENCES users(id)"}),
+        ("course_name", "TEXT NOT NULL"),
+        ("total_marks", {"sqlite": "INTEGER DEFAULT 120", "postgres": "INTEGER NOT NULL DEFAULT 120"}),
+        ("target_marks", {"sqlite": "INTEGER DEFAULT 90", "postgres": "INTEGER NOT NULL DEFAULT 90"}),
+    ]),
+    ("exams", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("course_id", "INTEGER NOT NULL REFERENCES courses(id)"),
+        ("exam_name", "TEXT NOT NULL"),
+        ("exam_date", "DATE NOT NULL"),
+        ("marks", "INTEGER DEFAULT 100"),
+        ("actual_marks", "INTEGER"),
+        ("is_retake", "INTEGER DEFAULT 0"),
+    ]),
+    ("topics", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("course_id", "INTEGER NOT NULL REFERENCES courses(id)"),
+        ("topic_name", "TEXT NOT NULL"),
+        ("weight_points", "REAL DEFAULT 0"),
+        ("notes", "TEXT"),
+    ]),
+    ("study_sessions", [
+        ("id", "pk"),
+        ("topic_id", "INTEGER NOT NULL REFERENCES topics(id)"),
+        ("session_date", "DATE NOT NULL"),
+        ("duration_mins", "INTEGER DEFAULT 30"),
+        ("quality", "INTEGER DEFAULT 3"),
+        ("notes", "TEXT"),
+    ]),
+    ("exercises", [
+        ("id", "pk"),
+        ("topic_id", "INTEGER NOT NULL REFERENCES topics(id)"),
+        ("exercise_date", "DATE NOT NULL"),
+        ("total_questions", "INTEGER NOT NULL"),
+        ("correct_answers", "INTEGER NOT NULL"),
+        ("source", "TEXT"),
+        ("notes", "TEXT"),
+    ]),
+    ("scheduled_lectures", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("course_id", "INTEGER NOT NULL REFERENCES courses(id)"),
+        ("lecture_date", "DATE NOT NULL"),
+        ("lecture_time", "TEXT"),
+        ("topics_planned", "TEXT"),
+        ("attended", "INTEGER"),
+        ("notes", "TEXT"),
+    ]),
+    ("timed_attempts", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("course_id", "INTEGER NOT NULL REFERENCES courses(id)"),
+        ("attempt_date", "DATE NOT NULL"),
+        ("source", "TEXT"),
+        ("minutes", "INTEGER NOT NULL"),
+        ("score_pct", "REAL NOT NULL"),
+        ("topics", "TEXT"),
+        ("notes", "TEXT"),
+    ]),
+    ("assessments", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("course_id", "INTEGER NOT NULL REFERENCES courses(id)"),
+        ("assessment_name", "TEXT NOT NULL"),
+        ("assessment_type", "TEXT NOT NULL"),
+        ("marks", "INTEGER NOT NULL"),
+        ("actual_marks", "INTEGER"),
+        ("progress_pct", "INTEGER DEFAULT 0"),
+        ("due_date", "DATE"),
+        ("is_timed", "INTEGER DEFAULT 1"),
+        ("notes", "TEXT"),
+    ]),
+    ("assignment_work", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("assessment_id", "INTEGER NOT NULL REFERENCES assessments(id)"),
+        ("work_date", "DATE NOT NULL"),
+        ("duration_mins", "INTEGER DEFAULT 30"),
+        ("work_type", "TEXT DEFAULT 'research'"),
+        ("description", "TEXT"),
+        ("progress_added", "INTEGER DEFAULT 0"),
+    ]),
+    ("sessions", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("session_id", "TEXT NOT NULL"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("last_seen_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+    ]),
+    ("events", [
+        ("id", "pk"),
+        ("user_id", "INTEGER REFERENCES users(id)"),
+        ("event_name", "TEXT NOT NULL"),
+        ("event_time", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("metadata", "TEXT"),
+    ]),
+    ("auth_tokens", [
+        ("id", "pk"),
+        ("user_id", "INTEGER NOT NULL REFERENCES users(id)"),
+        ("token_hash", "TEXT NOT NULL"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("expires_at", "TIMESTAMP NOT NULL"),
+        ("last_used_at", "TIMESTAMP"),
+        ("user_agent", "TEXT"),
+        ("revoked_at", "TIMESTAMP"),
+    ]),
+]
+
+LEGACY_INDEXES = {
+    "sqlite": ["CREATE INDEX IF NOT EXISTS idx_auth_tokens_hash ON auth_tokens(token_hash)"],
+    "postgres": ["CREATE INDEX IF NOT EXISTS idx_auth_tokens_hash ON auth_tokens(token_hash) WHERE revoked_at IS NULL"],
+}
+
+# Columns that pre-migration databases may lack, added in place by init_db_legacy()
+LEGACY_ADDED_COLUMNS = {
+    "sqlite": {"users": ("username", "password_hash", "last_login_at")},
+    "postgres": {
+        "users": ("username", "password_hash", "last_login_at"),
+        "courses": ("user_id",),
+    },
+}
+
+_PK_SQL = {
+    "sqlite": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "postgres": "SERIAL PRIMARY KEY",
+}
+
+
+def _column_spec(dialect: str, spec) -> str:
+    """A LEGACY_TABLES column spec resolved for one dialect."""
+    if isinstance(spec, dict):
+        spec = spec[dialect]
+    return _PK_SQL[dialect] if spec == "pk" else spec
+
+
+def _render_column(dialect: str, name: str, spec) -> str:
+    return f"{name} {_column_spec(dialect, spec)}"
+
+
+def _render(dialect: str, tables) -> str:
+    """Render the full CREATE TABLE / CREATE INDEX script for one dialect."""
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {table} (\n    "
+        + ",\n    ".join(_render_column(dialect, name, spec) for name, spec in columns)
+        + "\n)"
+        for table, columns in tables
+    ]
+    statements.extend(LEGACY_INDEXES[dialect])
+    return ";\n".join(statements) + ";\n"
+
+
+def _legacy_add_column_sql(dialect: str, table: str, column: str) -> str:
+    """ALTER TABLE ... ADD COLUMN for a LEGACY_TABLES column on an existing table."""
+    spec = _column_spec(dialect, dict(dict(LEGACY_TABLES)[table])[column])
+    # Existing rows have no value for the new column, and SQLite can't add UNIQUE columns
+    if "NOT NULL" in spec and "DEFAULT" not in spec:
+        spec = spec.replace(" NOT NULL", "")
+    if dialect == "sqlite":
+        spec = spec.replace(" UNIQUE", "")
+    return f"ALTER TABLE {table} ADD COLUMN {column} {spec}"
+
+
+LEGACY_DDL = {dialect: _render(dialect, LEGACY_TABLES) for dialect in _PK_SQL}
+
+
 def init_db_legacy():
     """
     Legacy init_db implementation (inline schema creation).
@@ -447,193 +1078,55 @@ def init_db_legacy():
     This function is kept for backward compatibility but will be removed
     in a future version. It handles schema creation without migrations tracking.
     """
-    with get_conn() as conn:
-        cur = conn.cursor()
+    dialect = "postgres" if is_postgres() else "sqlite"
 
-        if is_postgres():
-            # Users table
-            if not table_exists("users"):
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    email TEXT UNIQUE NOT NULL,
-                    username TEXT UNIQUE,
-                    password_hash TEXT NOT NULL DEFAULT '',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login_at TIMESTAMP
-                );
-                """)
-            else:
-                if not column_exists("users", "username"):
-                    cur.execute("ALTER TABLE users ADD COLUMN username TEXT UNIQUE")
-                if not column_exists("users", "password_hash"):
-                    cur.execute("ALTER TABLE users ADD COLUMN password_hash TEXT NOT NULL DEFAULT ''")
-                if not column_exists("users", "last_login_at"):
-                    cur.execute("ALTER TABLE users ADD COLUMN last_login_at TIMESTAMP")
-
-            # Courses table
-            if not table_exists("courses"):
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS courses (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    course_name TEXT NOT NULL,
-                    total_marks INTEGER NOT NULL DEFAULT 120,
-                    target_marks INTEGER NOT NULL DEFAULT 90
-                );
-                """)
-            elif not column_exists("courses", "user_id"):
-                cur.execute("ALTER TABLE courses ADD COLUMN user_id INTEGER REFERENCES users(id)")
-
-            # Core tables (idempotent)
-            cur.execute("""CREATE TABLE IF NOT EXISTS exams (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                course_id INTEGER NOT NULL REFERENCES courses(id), exam_name TEXT NOT NULL,
-                exam_date DATE NOT NULL, marks INTEGER DEFAULT 100, actual_marks INTEGER,
-                is_retake INTEGER DEFAULT 0);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS topics (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                course_id INTEGER NOT NULL REFERENCES courses(id), topic_name TEXT NOT NULL,
-                weight_points REAL DEFAULT 0, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS study_sessions (
-                id SERIAL PRIMARY KEY, topic_id INTEGER NOT NULL REFERENCES topics(id),
-                session_date DATE NOT NULL, duration_mins INTEGER DEFAULT 30,
-                quality INTEGER DEFAULT 3, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS exercises (
-                id SERIAL PRIMARY KEY, topic_id INTEGER NOT NULL REFERENCES topics(id),
-                exercise_date DATE NOT NULL, total_questions INTEGER NOT NULL,
-                correct_answers INTEGER NOT NULL, source TEXT, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS scheduled_lectures (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                course_id INTEGER NOT NULL REFERENCES courses(id), lecture_date DATE NOT NULL,
-                lecture_time TEXT, topics_planned TEXT, attended INTEGER, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS timed_attempts (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                course_id INTEGER NOT NULL REFERENCES courses(id), attempt_date DATE NOT NULL,
-                source TEXT, minutes INTEGER NOT NULL, score_pct REAL NOT NULL,
-                topics TEXT, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS assessments (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                course_id INTEGER NOT NULL REFERENCES courses(id), assessment_name TEXT NOT NULL,
-                assessment_type TEXT NOT NULL, marks INTEGER NOT NULL, actual_marks INTEGER,
-                progress_pct INTEGER DEFAULT 0, due_date DATE, is_timed INTEGER DEFAULT 1, notes TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS assignment_work (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                assessment_id INTEGER NOT NULL REFERENCES assessments(id), work_date DATE NOT NULL,
-                duration_mins INTEGER DEFAULT 30, work_type TEXT DEFAULT 'research',
-                description TEXT, progress_added INTEGER DEFAULT 0);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS sessions (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                session_id TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS events (
-                id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id),
-                event_name TEXT NOT NULL, event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT);""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS auth_tokens (
-                id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id),
-                token_hash TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL, last_used_at TIMESTAMP,
-                user_agent TEXT, revoked_at TIMESTAMP);""")
-            cur.execute("""CREATE INDEX IF NOT EXISTS idx_auth_tokens_hash
-                ON auth_tokens(token_hash) WHERE revoked_at IS NULL;""")
+    # Bring pre-existing tables up to date before the create script runs
+    alters = [
+        _legacy_add_column_sql(dialect, table, column)
+        for table, columns in LEGACY_ADDED_COLUMNS[dialect].items()
+        if table_exists(table)
+        for column in columns
+        if not column_exists(table, column)
+    ]
 
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for sql in alters:
+            cur.execute(sql)
+        if dialect == "postgres":
+            cur.execute(LEGACY_DDL[dialect])
         else:
-            # SQLite schema (simplified)
-            if not table_exists("users"):
-                cur.execute("""CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL,
-                    username TEXT UNIQUE, password_hash TEXT DEFAULT '',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_login_at TIMESTAMP);""")
-            else:
-                if not column_exists("users", "username"):
-                    cur.execute("ALTER TABLE users ADD COLUMN username TEXT")
-                if not column_exists("users", "password_hash"):
-                    cur.execute("ALTER TABLE users ADD COLUMN password_hash TEXT DEFAULT ''")
-                if not column_exists("users", "last_login_at"):
-                    cur.execute("ALTER TABLE users ADD COLUMN last_login_at TIMESTAMP")
-
-            # Core tables
-            cur.execute("""CREATE TABLE IF NOT EXISTS courses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_name TEXT NOT NULL, total_marks INTEGER DEFAULT 120,
-                target_marks INTEGER DEFAULT 90, FOREIGN KEY (user_id) REFERENCES users(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS exams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_id INTEGER NOT NULL, exam_name TEXT NOT NULL, exam_date DATE NOT NULL,
-                marks INTEGER DEFAULT 100, actual_marks INTEGER, is_retake INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(id), FOREIGN KEY (course_id) REFERENCES courses(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS topics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_id INTEGER NOT NULL, topic_name TEXT NOT NULL,
-                weight_points REAL DEFAULT 0, notes TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id), FOREIGN KEY (course_id) REFERENCES courses(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS study_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, topic_id INTEGER NOT NULL,
-                session_date DATE NOT NULL, duration_mins INTEGER DEFAULT 30,
-                quality INTEGER DEFAULT 3, notes TEXT, FOREIGN KEY (topic_id) REFERENCES topics(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS exercises (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, topic_id INTEGER NOT NULL,
-                exercise_date DATE NOT NULL, total_questions INTEGER NOT NULL,
-                correct_answers INTEGER NOT NULL, source TEXT, notes TEXT,
-                FOREIGN KEY (topic_id) REFERENCES topics(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS scheduled_lectures (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_id INTEGER NOT NULL, lecture_date DATE NOT NULL,
-                lecture_time TEXT, topics_planned TEXT, attended INTEGER, notes TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id), FOREIGN KEY (course_id) REFERENCES courses(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS timed_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_id INTEGER NOT NULL, attempt_date DATE NOT NULL,
-                source TEXT, minutes INTEGER NOT NULL, score_pct REAL NOT NULL,
-                topics TEXT, notes TEXT, FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (course_id) REFERENCES courses(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS assessments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                course_id INTEGER NOT NULL, assessment_name TEXT NOT NULL,
-                assessment_type TEXT NOT NULL, marks INTEGER NOT NULL, actual_marks INTEGER,
-                progress_pct INTEGER DEFAULT 0, due_date DATE, is_timed INTEGER DEFAULT 1, notes TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id), FOREIGN KEY (course_id) REFERENCES courses(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS assignment_work (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                assessment_id INTEGER NOT NULL, work_date DATE NOT NULL,
-                duration_mins INTEGER DEFAULT 30, work_type TEXT DEFAULT 'research',
-                description TEXT, progress_added INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(id), FOREIGN KEY (assessment_id) REFERENCES assessments(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                session_id TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
-                event_name TEXT NOT NULL, event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT, FOREIGN KEY (user_id) REFERENCES users(id));""")
-            cur.execute("""CREATE TABLE IF NOT EXISTS auth_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
-                token_hash TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL, last_used_at TIMESTAMP,
-                user_agent TEXT, revoked_at TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users(id));""")
-            cur.execute("""CREATE INDEX IF NOT EXISTS idx_auth_tokens_hash ON auth_tokens(token_hash);""")
-
+            conn.commit()
+            cur.executescript(LEGACY_DDL[dialect])
         conn.commit()
+    invalidate_schema_cache()
 
 # ============ PASSWORD HELPERS (bcrypt) ============
 
-def hash_password(plain: str) -> str:
-    """Hash a password using bcrypt. Returns the hash as a string."""
+# bcrypt cost factor for new hashes (existing hashes keep their own cost)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+
+def _to_bytes(value) -> bytes:
+    """Encode str as UTF-8; pass bytes through untouched."""
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def hash_password(plain) -> str:
+    """Hash a password (str or bytes) using bcrypt. Returns the hash as a string."""
     if not HAS_BCRYPT:
         raise ImportError("bcrypt is required for password hashing. Install with: pip install bcrypt")
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(plain.encode('utf-8'), salt).decode('utf-8')
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(_to_bytes(plain), salt).decode('utf-8')
 
-def verify_password(plain: str, hashed: str) -> bool:
-    """Verify a plain password against a bcrypt hash. Returns True if match."""
+def verify_password(plain, hashed) -> bool:
+    """Verify a plain password against a bcrypt hash (str or bytes). Returns True if match."""
     if not HAS_BCRYPT:
         return False
     if not hashed:
         return False
     try:
-        return bcrypt.checkpw(plain.encode('utf-8'), hashed.encode('utf-8'))
+        return bcrypt.checkpw(_to_bytes(plain), _to_bytes(hashed))
     except Exception:
         return False
 
@@ -716,14 +1209,11 @@ def revoke_token(raw_token: str) -> bool:
     now = datetime.now().isoformat()
 
     # Mark as revoked
-    execute(
+    cur = execute(
         "UPDATE auth_tokens SET revoked_at = ? WHERE token_hash = ? AND revoked_at IS NULL",
         (now, token_hash)
     )
-
-    # Check if any rows were affected
-    row = fetchone("SELECT changes()" if not is_postgres() else "SELECT 1")
-    return (row[0] if row else 0) > 0
+    return cur.rowcount > 0
 
 def revoke_all_user_tokens(user_id: int) -> int:
     """
@@ -732,22 +1222,11 @@ def revoke_all_user_tokens(user_id: int) -> int:
     """
     now = datetime.now().isoformat()
 
-    execute(
+    cur = execute(
         "UPDATE auth_tokens SET revoked_at = ? WHERE user_id = ? AND revoked_at IS NULL",
         (now, user_id)
     )
-
-    # Get count of revoked tokens
-    if is_postgres():
-        # Postgres doesn't have changes(), use a count query
-        row = fetchone(
-            "SELECT COUNT(*) FROM auth_tokens WHERE user_id = ? AND revoked_at = ?",
-            (user_id, now)
-        )
-    else:
-        row = fetchone("SELECT changes()")
-
-    return row[0] if row else 0
+    return cur.rowcount
 
 def cleanup_expired_tokens(days_old: int = 90) -> int:
     """
@@ -758,32 +1237,28 @@ def cleanup_expired_tokens(days_old: int = 90) -> int:
     cutoff = (datetime.now() - timedelta(days=days_old)).isoformat()
 
     # Delete tokens that are either expired or revoked and old
-    execute(
+    cur = execute(
         """DELETE FROM auth_tokens
            WHERE expires_at < ? OR (revoked_at IS NOT NULL AND revoked_at < ?)""",
         (cutoff, cutoff)
     )
-
-    # Get count of deleted tokens
-    if is_postgres():
-        # Can't get deleted count easily in Postgres, return 0
-        return 0
-    else:
-        row = fetchone("SELECT changes()")
-        return row[0] if row else 0
+    return cur.rowcount
 
 # ============ USER HELPERS ============
 
 def get_or_create_user(email: str) -> int:
     """Get existing user by email or create new one (legacy, no password)."""
     email = email.lower().strip()
-    row = fetchone("SELECT id FROM users WHERE email=?", (email,))
+    row = fetchone_prepared("user_id_by_email", (email,))
     if row:
         return row[0]
     else:
         # Provide empty password_hash for backward compatibility
         # Users created this way should set a password later
-        return execute_returning("INSERT INTO users(email, password_hash) VALUES(?,?)", (email, ""))
+        return execute_returning(
+            "INSERT INTO users(email, password_hash, created_at_epoch) VALUES(?,?,?)",
+            (email, "", int(time.time()))
+        )
 
 def create_user(email: str, username: str, plain_password: str) -> int:
     """
@@ -792,24 +1267,24 @@ def create_user(email: str, username: str, plain_password: str) -> int:
     Raises ValueError if email or username already exists.
     """
     email = email.lower().strip()
-    
+
     # Check if email already exists
-    existing = fetchone("SELECT id FROM users WHERE email=?", (email,))
+    existing = fetchone_prepared("user_id_by_email", (email,))
     if existing:
         raise ValueError("Email already registered.")
     
     # Check if username already exists (if provided)
     if username:
         username = username.strip()
-        existing_username = fetchone("SELECT id FROM users WHERE username=?", (username,))
+        existing_username = fetchone_prepared("user_id_by_username", (username,))
         if existing_username:
             raise ValueError("Username already taken.")
     
-    # Hash password and create user
+    # Hash password (only once the checks passed: bcrypt is the slow part) and create user
     password_hash = hash_password(plain_password)
     user_id = execute_returning(
-        "INSERT INTO users(email, username, password_hash) VALUES(?,?,?)",
-        (email, username if username else None, password_hash)
+        "INSERT INTO users(email, username, password_hash, created_at_epoch) VALUES(?,?,?,?)",
+        (email, username if username else None, password_hash, int(time.time()))
     )
     return user_id
 
@@ -818,25 +1293,22 @@ def get_user_by_email(email: str) -> dict:
     Get user by email. Returns dict with user info or None if not found.
     """
     email = email.lower().strip()
-    row = fetchone(
-        "SELECT id, email, username, password_hash, created_at, last_login_at FROM users WHERE email=?",
-        (email,)
-    )
-    if row:
-        return {
-            "id": row[0],
-            "email": row[1],
-            "username": row[2],
-            "password_hash": row[3],
-            "created_at": row[4],
-            "last_login_at": row[5]
-        }
-    return None
+    return fetchone_prepared("user_by_email", (email,), as_dict=True)
+
+def _now_local_and_epoch() -> tuple:
+    """
+    One clock reading as (local ISO text, unix seconds). The text columns the
+    app writes hold local time, as they always have; the epoch is what
+    queries compare against.
+    """
+    now = time.time()
+    return datetime.fromtimestamp(now).isoformat(), int(now)
+
 
 def update_last_login(user_id: int) -> None:
-    """Update the last_login_at timestamp for a user."""
-    now = datetime.now().isoformat()
-    execute("UPDATE users SET last_login_at=? WHERE id=?", (now, user_id))
+    """Update the last_login_at timestamp (and last_login_epoch) for a user."""
+    now, epoch = _now_local_and_epoch()
+    execute("UPDATE users SET last_login_at=?, last_login_epoch=? WHERE id=?", (now, epoch, user_id))
 
 # ============ SESSION TRACKING ============
 
@@ -844,27 +1316,12 @@ def upsert_session(user_id: int, session_id: str) -> None:
     """
     Create or update a session record.
     Updates last_seen_at on each app refresh.
+    Single round trip via the unique (user_id, session_id) index (migration 018).
+    last_seen_epoch (integer seconds) is what queries compare against;
+    last_seen_at (local time, for display) comes from the same clock reading.
     """
-    now = datetime.now().isoformat()
-    
-    # Check if session exists
-    existing = fetchone(
-        "SELECT id FROM sessions WHERE user_id=? AND session_id=?",
-        (user_id, session_id)
-    )
-    
-    if existing:
-        # Update last_seen_at
-        execute(
-            "UPDATE sessions SET last_seen_at=? WHERE user_id=? AND session_id=?",
-            (now, user_id, session_id)
-        )
-    else:
-        # Create new session
-        execute_returning(
-            "INSERT INTO sessions(user_id, session_id, last_seen_at) VALUES(?,?,?)",
-            (user_id, session_id, now)
-        )
+    now, epoch = _now_local_and_epoch()
+    execute_prepared("upsert_session", (user_id, session_id, now, epoch))
 
 def end_session(user_id: int, session_id: str) -> None:
     """Delete a session record (on logout)."""
@@ -874,11 +1331,11 @@ def get_live_users_count(minutes: int = 10) -> int:
     """
     Get count of distinct users active in the last N minutes.
     'Live' is defined as last_seen_at within the specified minutes.
+    Compares the indexed integer last_seen_epoch column.
     """
-    from datetime import timedelta
-    cutoff = (datetime.now() - timedelta(minutes=minutes)).isoformat()
+    cutoff = int(time.time()) - minutes * 60
     row = fetchone(
-        "SELECT COUNT(DISTINCT user_id) FROM sessions WHERE last_seen_at >= ?",
+        "SELECT COUNT(DISTINCT user_id) FROM sessions WHERE last_seen_epoch >= ?",
         (cutoff,)
     )
     return row[0] if row else 0
@@ -888,49 +1345,100 @@ def cleanup_old_sessions(hours: int = 24) -> int:
     Delete sessions older than the specified hours.
     Returns count of deleted sessions.
     """
-    from datetime import timedelta
-    cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
-    execute("DELETE FROM sessions WHERE last_seen_at < ?", (cutoff,))
-    row = fetchone("SELECT changes()")
-    return row[0] if row else 0
+    cutoff = int(time.time()) - hours * 3600
+    cur = execute("DELETE FROM sessions WHERE last_seen_epoch < ?", (cutoff,))
+    return cur.rowcount
 
 # ============ EVENT LOGGING ============
 
-def log_event(user_id: int, event_name: str, metadata: str = None) -> None:
-    """Log an event for analytics."""
+def _event_metadata(metadata) -> Optional[str]:
+    """Serialize event metadata: dicts become compact JSON, strings pass through."""
+    if metadata is None or isinstance(metadata, str):
+        return metadata
+    return json.dumps(metadata, separators=(",", ":"))
+
+def log_event(user_id: int, event_name: str, metadata=None) -> None:
+    """Log an event for analytics. metadata may be a dict (stored as JSON) or a string."""
     execute_returning(
-        "INSERT INTO events(user_id, event_name, metadata) VALUES(?,?,?)",
-        (user_id, event_name, metadata)
+        "INSERT INTO events(user_id, event_name, metadata, event_time_epoch) VALUES(?,?,?,?)",
+        (user_id, event_name, _event_metadata(metadata), int(time.time()))
     )
 
+def log_events(rows: list) -> int:
+    """
+    Log many events in one transaction.
+    rows: list of (user_id, event_name, metadata) tuples; metadata as for log_event.
+    Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    now = int(time.time())
+    rows = [
+        (user_id, event_name, _event_metadata(metadata), now)
+        for user_id, event_name, metadata in rows
+    ]
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if is_postgres():
+            from psycopg2.extras import execute_values
+            execute_values(
+                cur,
+                "INSERT INTO events(user_id, event_name, metadata, event_time_epoch) VALUES %s",
+                rows,
+                page_size=500,
+            )
+        else:
+            cur.executemany(
+                "INSERT INTO events(user_id, event_name, metadata, event_time_epoch) VALUES(?,?,?,?)",
+                rows,
+            )
+        _commit(conn)
+    return len(rows)
+
 def get_event_count(event_name: str, days: int = None) -> int:
     """Get count of events, optionally filtered by days."""
-    from datetime import timedelta
     if days:
-        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-        row = fetchone(
-            "SELECT COUNT(*) FROM events WHERE event_name=? AND event_time >= ?",
-            (event_name, cutoff)
-        )
+        cutoff = int(time.time()) - days * 86400
+        row = fetchone_prepared("event_count_since", (event_name, cutoff))
     else:
-        row = fetchone("SELECT COUNT(*) FROM events WHERE event_name=?", (event_name,))
+        row = fetchone_prepared("event_count", (event_name,))
     return row[0] if row else 0
 
 def get_unique_users_for_event(event_name: str, days: int = None) -> int:
     """Get count of unique users who triggered an event."""
-    from datetime import timedelta
     if days:
-        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-        row = fetchone(
-            "SELECT COUNT(DISTINCT user_id) FROM events WHERE event_name=? AND event_time >= ?",
-            (event_name, cutoff)
-        )
+        cutoff = int(time.time()) - days * 86400
+        row = fetchone_prepared("event_users_since", (event_name, cutoff))
     else:
-        row = fetchone("SELECT COUNT(DISTINCT user_id) FROM events WHERE event_name=?", (event_name,))
+        row = fetchone_prepared("event_users", (event_name,))
     return row[0] if row else 0
 
 # ============ ADMIN HELPERS ============
 
+# Successful admin bcrypt checks, keyed by (username, sha256(password), stored hash).
+# Streamlit reruns the admin page on every interaction; this skips the repeat KDF.
+# Failures are never cached, so guessing still pays full bcrypt cost per attempt.
+ADMIN_VERIFY_TTL = 300
+ADMIN_VERIFY_CACHE_MAX = 64
+_admin_verify_cache: Dict[tuple, float] = {}
+
+
+def _verify_admin_hash(username: str, password: str, admin_password_hash: str) -> bool:
+    """verify_password() for the admin login, remembering successes for ADMIN_VERIFY_TTL seconds."""
+    key = (username, hash_token(password), admin_password_hash)
+    now = time.monotonic()
+    expires = _admin_verify_cache.get(key)
+    if expires is not None and expires > now:
+        return True
+    if not verify_password(password, admin_password_hash):
+        _admin_verify_cache.pop(key, None)
+        return False
+    if len(_admin_verify_cache) >= ADMIN_VERIFY_CACHE_MAX:
+        _admin_verify_cache.clear()
+    _admin_verify_cache[key] = now + ADMIN_VERIFY_TTL
+    return True
+
+
 def verify_admin(username: str, password: str) -> bool:
     """Verify admin credentials against Streamlit secrets.
 
@@ -961,7 +1469,7 @@ def verify_admin(username: str, password: str) -> bool:
         # Mode A: bcrypt hash (preferred, more secure)
         if admin_password_hash:
             # Note: bcrypt hash comparison doesn't need strip as hash won't have whitespace
-            return verify_password(password, admin_password_hash)
+            return _verify_admin_hash(username, password, admin_password_hash)
 
         # Mode B: plaintext password (fallback for dev/testing)
         elif admin_password_plain:
@@ -977,62 +1485,162 @@ def verify_admin(username: str, password: str) -> bool:
 
 def get_total_users() -> int:
     """Get total number of registered users."""
-    row = fetchone("SELECT COUNT(*) FROM users")
+    row = fetchone_prepared("total_users", ())
     return row[0] if row else 0
 
 def get_users_created_since(days: int) -> int:
     """Get count of users created in the last N days."""
-    from datetime import timedelta
-    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-    row = fetchone("SELECT COUNT(*) FROM users WHERE created_at >= ?", (cutoff,))
+    cutoff = int(time.time()) - days * 86400
+    row = fetchone_prepared("users_created_since", (cutoff,))
     return row[0] if row else 0
 
+# All admin dashboard counters in one round trip, read from the daily rollups
+# (migration 024) so the cost is bounded by the 30-day window, not by history.
+# Windows are exact (now - N days .. now): whole days after the one holding the
+# cutoff come from the rollups, the partial cutoff day from users / events
+# (an index range over less than a day). For the distinct-user counts every
+# row carries a time t (the start of a rollup day, or the event time) and a
+# window counts the users with t >= its cutoff; a user seen twice is still one.
+_ADMIN_STATS_SQL = """
+SELECT
+    (SELECT COUNT(DISTINCT user_id) FROM sessions WHERE last_seen_epoch >= ?) AS live_users,
+    (SELECT COUNT(*) FROM users) AS total_users,
+    u.users_day + (SELECT COUNT(*) FROM users WHERE created_at_epoch >= ? AND created_at_epoch < ?),
+    u.users_week + (SELECT COUNT(*) FROM users WHERE created_at_epoch >= ? AND created_at_epoch < ?),
+    u.users_month + (SELECT COUNT(*) FROM users WHERE created_at_epoch >= ? AND created_at_epoch < ?),
+    c.course_creators_day, c.course_creators_week, c.course_creators_month,
+    (SELECT SUM(event_count) FROM stats_daily_events WHERE event_name = ?) AS total_courses_created
+FROM (
+    SELECT COALESCE(SUM(CASE WHEN day > ? THEN new_users END), 0) AS users_day,
+           COALESCE(SUM(CASE WHEN day > ? THEN new_users END), 0) AS users_week,
+           COALESCE(SUM(new_users), 0) AS users_month
+    FROM stats_daily_signups
+    WHERE day > ?
+) u
+CROSS JOIN (
+    SELECT COUNT(DISTINCT CASE WHEN t >= ? THEN user_id END) AS course_creators_day,
+           COUNT(DISTINCT CASE WHEN t >= ? THEN user_id END) AS course_creators_week,
+           COUNT(DISTINCT user_id) AS course_creators_month
+    FROM (
+        SELECT user_id, day * 86400 AS t FROM stats_daily_event_users
+        WHERE event_name = ? AND day > ?
+        UNION ALL
+        SELECT user_id, event_time_epoch FROM events
+        WHERE event_name = ? AND user_id IS NOT NULL AND event_time_epoch >= ? AND event_time_epoch < ?
+        UNION ALL
+        SELECT user_id, event_time_epoch FROM events
+        WHERE event_name = ? AND user_id IS NOT NULL AND event_time_epoch >= ? AND event_time_epoch < ?
+        UNION ALL
+        SELECT user_id, event_time_epoch FROM events
+        WHERE event_name = ? AND user_id IS NOT NULL AND event_time_epoch >= ? AND event_time_epoch < ?
+    ) r
+) c
+"""
+
+_ADMIN_STATS_KEYS = (
+    "live_users", "total_users", "users_day", "users_week", "users_month",
+    "course_creators_day", "course_creators_week", "course_creators_month",
+    "total_courses_created",
+)
+PREPARED_STATEMENTS["admin_stats"] = _ADMIN_STATS_SQL
+
+
 def get_admin_stats() -> dict:
-    """Get comprehensive admin statistics."""
-    return {
-        "live_users": get_live_users_count(10),
-        "total_users": get_total_users(),
-        "users_day": get_users_created_since(1),
-        "users_week": get_users_created_since(7),
-        "users_month": get_users_created_since(30),
-        "course_creators_day": get_unique_users_for_event("course_created", 1),
-        "course_creators_week": get_unique_users_for_event("course_created", 7),
-        "course_creators_month": get_unique_users_for_event("course_created", 30),
-        "total_courses_created": get_event_count("course_created"),
-    }
+    """Get comprehensive admin statistics (single query over the daily rollups)."""
+    now = int(time.time())
+    cutoffs = [now - days * 86400 for days in (1, 7, 30)]
+    # (cutoff, end of the day holding it): the partial day read from the base tables
+    partial = [(cutoff, (cutoff // 86400 + 1) * 86400) for cutoff in cutoffs]
+    day, week, month = (cutoff // 86400 for cutoff in cutoffs)
+    event = "course_created"
+    row = fetchone_prepared(
+        "admin_stats",
+        (now - 10 * 60,
+         *partial[0], *partial[1], *partial[2],
+         event,
+         day, week, month,
+         cutoffs[0], cutoffs[1],
+         event, month,
+         event, *partial[0],
+         event, *partial[1],
+         event, *partial[2]),
+    )
+    if not row:
+        return dict.fromkeys(_ADMIN_STATS_KEYS, 0)
+    return {key: int(value or 0) for key, value in zip(_ADMIN_STATS_KEYS, row)}
+
+
+def rebuild_stats_daily() -> None:
+    """
+    Recompute the daily rollups from events and users.
+    The insert triggers keep them current; run this to reconcile after
+    rows are deleted or edited (e.g. from a nightly job).
+    events is scanned once: its (day, event, user) grouping is staged in a
+    temp table that both event rollups are derived from.
+    """
+    with transaction():
+        execute("DROP TABLE IF EXISTS tmp_event_rollup")
+        execute("""
+            CREATE TEMP TABLE tmp_event_rollup AS
+            SELECT event_time_epoch / 86400 AS day, event_name, user_id, COUNT(*) AS n
+            FROM events WHERE event_time_epoch IS NOT NULL
+            GROUP BY event_time_epoch / 86400, event_name, user_id
+        """)
+        execute("DELETE FROM stats_daily_events")
+        execute("DELETE FROM stats_daily_event_users")
+        execute("DELETE FROM stats_daily_signups")
+        execute("""
+            INSERT INTO stats_daily_events(day, event_name, event_count)
+            SELECT day, event_name, SUM(n) FROM tmp_event_rollup GROUP BY day, event_name
+        """)
+        execute("""
+            INSERT INTO stats_daily_event_users(day, event_name, user_id)
+            SELECT day, event_name, user_id FROM tmp_event_rollup WHERE user_id IS NOT NULL
+        """)
+        execute("""
+            INSERT INTO stats_daily_signups(day, new_users)
+            SELECT created_at_epoch / 86400, COUNT(*) FROM users
+            WHERE created_at_epoch IS NOT NULL GROUP BY created_at_epoch / 86400
+        """)
+        execute("DROP TABLE tmp_event_rollup")
 
 # ============ LEGACY DATA HELPERS ============
 
-def has_legacy_data() -> bool:
-    """Check if there is any data with NULL user_id (legacy data)."""
+# Tables whose legacy rows follow their course's owner
+_LEGACY_CHILD_TABLES = ("topics", "exams", "scheduled_lectures", "timed_attempts", "assessments")
+_LEGACY_TABLES = ("courses",) + _LEGACY_CHILD_TABLES
+
+
+def _legacy_tables() -> list:
+    """Legacy-capable tables (allowlisted, present, with a user_id column)."""
     from security import validate_table_name
-    tables_to_check = ["courses", "topics", "exams", "scheduled_lectures", "timed_attempts", "assessments"]
-    for table in tables_to_check:
+    tables = []
+    for table in _LEGACY_TABLES:
         # Validate table name against allowlist before using in query
         try:
             validated_table = validate_table_name(table)
         except ValueError:
             continue  # Skip invalid table names
         if table_exists(validated_table) and column_exists(validated_table, "user_id"):
-            row = fetchone(f"SELECT COUNT(*) FROM {validated_table} WHERE user_id IS NULL")
-            if row and row[0] > 0:
-                return True
-    return False
+            tables.append(validated_table)
+    return tables
+
+def has_legacy_data() -> bool:
+    """Check if there is any data with NULL user_id (legacy data)."""
+    tables = _legacy_tables()
+    if not tables:
+        return False
+    # One round trip; each EXISTS is a seek on that table's user_id-leading index
+    probes = " OR ".join(f"EXISTS(SELECT 1 FROM {table} WHERE user_id IS NULL)" for table in tables)
+    row = fetchone(f"SELECT CASE WHEN {probes} THEN 1 ELSE 0 END")
+    return bool(row and row[0])
 
 def get_legacy_data_counts() -> dict:
     """Get counts of legacy data (NULL user_id) per table."""
-    from security import validate_table_name
     counts = {}
-    tables_to_check = ["courses", "topics", "exams", "scheduled_lectures", "timed_attempts", "assessments"]
-    for table in tables_to_check:
-        # Validate table name against allowlist before using in query
-        try:
-            validated_table = validate_table_name(table)
-        except ValueError:
-            continue  # Skip invalid table names
-        if table_exists(validated_table) and column_exists(validated_table, "user_id"):
-            row = fetchone(f"SELECT COUNT(*) FROM {validated_table} WHERE user_id IS NULL")
-            counts[validated_table] = row[0] if row else 0
+    for table in _legacy_tables():
+        row = fetchone(f"SELECT COUNT(*) FROM {table} WHERE user_id IS NULL")
+        counts[table] = row[0] if row else 0
     return counts
 
 def claim_legacy_data(user_id: int) -> dict:
@@ -1057,60 +1665,25 @@ def _admin_claim_legacy_data(user_id: int) -> dict:
     Returns counts of claimed rows per table.
     """
     claimed = {}
-
-    # First claim courses - only those with NULL user_id
-    if table_exists("courses") and column_exists("courses", "user_id"):
-        execute("UPDATE courses SET user_id=? WHERE user_id IS NULL", (user_id,))
-        row = fetchone("SELECT changes()")  # SQLite specific
-        claimed["courses"] = row[0] if row else 0
-
-    # Get claimed course IDs to update related tables
-    course_rows = fetchall("SELECT id FROM courses WHERE user_id=?", (user_id,))
-    course_ids = [r[0] for r in course_rows] if course_rows else []
-
-    if not course_ids:
-        return claimed
-
-    # Build parameterized IN clause safely
-    placeholders = ",".join("?" * len(course_ids))
-
-    # Claim topics for these courses
-    if table_exists("topics") and column_exists("topics", "user_id"):
-        execute(f"UPDATE topics SET user_id=? WHERE user_id IS NULL AND course_id IN ({placeholders})",
-                (user_id, *course_ids))
-        claimed["topics"] = len(fetchall(f"SELECT id FROM topics WHERE user_id=? AND course_id IN ({placeholders})",
-                                         (user_id, *course_ids)))
-
-    # Claim exams
-    if table_exists("exams") and column_exists("exams", "user_id"):
-        execute(f"UPDATE exams SET user_id=? WHERE user_id IS NULL AND course_id IN ({placeholders})",
-                (user_id, *course_ids))
-        claimed["exams"] = len(fetchall(f"SELECT id FROM exams WHERE user_id=? AND course_id IN ({placeholders})",
-                                        (user_id, *course_ids)))
-
-    # Claim scheduled_lectures
-    if table_exists("scheduled_lectures") and column_exists("scheduled_lectures", "user_id"):
-        execute(f"UPDATE scheduled_lectures SET user_id=? WHERE user_id IS NULL AND course_id IN ({placeholders})",
-                (user_id, *course_ids))
-        claimed["scheduled_lectures"] = len(fetchall(
-            f"SELECT id FROM scheduled_lectures WHERE user_id=? AND course_id IN ({placeholders})",
-            (user_id, *course_ids)))
-
-    # Claim timed_attempts
-    if table_exists("timed_attempts") and column_exists("timed_attempts", "user_id"):
-        execute(f"UPDATE timed_attempts SET user_id=? WHERE user_id IS NULL AND course_id IN ({placeholders})",
-                (user_id, *course_ids))
-        claimed["timed_attempts"] = len(fetchall(
-            f"SELECT id FROM timed_attempts WHERE user_id=? AND course_id IN ({placeholders})",
-            (user_id, *course_ids)))
-
-    # Claim assessments
-    if table_exists("assessments") and column_exists("assessments", "user_id"):
-        execute(f"UPDATE assessments SET user_id=? WHERE user_id IS NULL AND course_id IN ({placeholders})",
-                (user_id, *course_ids))
-        claimed["assessments"] = len(fetchall(
-            f"SELECT id FROM assessments WHERE user_id=? AND course_id IN ({placeholders})",
-            (user_id, *course_ids)))
+    tables = _legacy_tables()
+
+    # One transaction (one commit) for the whole claim; a failure claims nothing
+    with transaction():
+        # First claim courses - only those with NULL user_id
+        if "courses" in tables:
+            cur = execute("UPDATE courses SET user_id=? WHERE user_id IS NULL", (user_id,))
+            claimed["courses"] = cur.rowcount
+
+        # Claim child rows of this user's courses. The course list stays in SQL
+        # (no IN-list of ids, so no placeholder limit) and rowcount gives the count.
+        for table in _LEGACY_CHILD_TABLES:
+            if table in tables:
+                cur = execute(
+                    f"UPDATE {table} SET user_id=? WHERE user_id IS NULL "
+                    "AND course_id IN (SELECT id FROM courses WHERE user_id=?)",
+                    (user_id, user_id)
+                )
+                claimed[table] = cur.rowcount
 
     return claimed
 
@@ -1122,7 +1695,7 @@ def get_or_create_course(user_id: int, course_name: str) -> int:
     else:
         course_id = execute_returning("INSERT INTO courses(user_id, course_name) VALUES(?,?)", (user_id, course_name))
         # Log course creation event for analytics
-        log_event(user_id, "course_created", f'{{"course_name": "{course_name}", "course_id": {course_id}}}')
+        log_event(user_id, "course_created", {"course_name": course_name, "course_id": course_id})
         return course_id
 
 # ============ ASSESSMENT HELPERS ============
@@ -1135,15 +1708,21 @@ def get_course_total_marks(user_id: int, course_id: int) -> int:
     )
     return int(row[0]) if row and row[0] else 0
 
+def parse_db_date(value) -> date:
+    """DATE column value as a date: Postgres returns date objects, SQLite ISO strings."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
 def get_next_due_date(user_id: int, course_id: int, today) -> tuple:
     """
     Get the next upcoming assessment due date for a course.
     Returns (due_date, assessment_name, is_timed) or (None, None, None) if none found.
     """
-    from datetime import date as date_type
     if isinstance(today, str):
-        from datetime import datetime
-        today = datetime.strptime(today[:10], "%Y-%m-%d").date()
+        today = parse_db_date(today)
     
     row = fetchone(
         """SELECT due_date, assessment_name, is_timed 
@@ -1153,10 +1732,7 @@ def get_next_due_date(user_id: int, course_id: int, today) -> tuple:
         (user_id, course_id, str(today))
     )
     if row and row[0]:
-        from datetime import datetime
-        import pandas as pd
-        due = pd.to_datetime(row[0]).date()
-        return due, row[1], bool(row[2])
+        return parse_db_date(row[0]), row[1], bool(row[2])
     return None, None, None
 
 def ensure_default_assessment(user_id: int, course_id: int) -> bool:
@@ -1168,10 +1744,10 @@ def ensure_default_assessment(user_id: int, course_id: int) -> bool:
     """
     # Check if any assessments exist
     row = fetchone(
-        "SELECT COUNT(*) FROM assessments WHERE user_id=? AND course_id=?",
+        "SELECT 1 FROM assessments WHERE user_id=? AND course_id=? LIMIT 1",
         (user_id, course_id)
     )
-    if row and row[0] > 0:
+    if row:
         return False  # Assessments already exist
     
     # Try to get existing exam date from exams table (backward compatibility)
@@ -3,10 +3,10 @@ DEPRECATED: This module is now a backwards-compatibility shim.
 All business logic has been moved to services/metrics.py
 
 Import from services instead:
-    from services import compute_mastery, decay_factor, compute_readiness
+    from services import compute_mastery, compute_mastery_bulk, decay_factor, compute_readiness
 """
 
 # Re-export from services for backwards compatibility
-from services.metrics import compute_mastery, decay_factor, compute_readiness
+from services.metrics import compute_mastery, compute_mastery_bulk, decay_factor, compute_readiness
 
-__all__ = ["compute_mastery", "decay_factor", "compute_readiness"]
+__all__ = ["compute_mastery", "compute_mastery_bulk", "decay_factor", "compute_readiness"]
@@ -24,7 +24,7 @@ import sys
 # Try to import required modules
 try:
     import psycopg2
-    from psycopg2.extras import execute_batch
+    from psycopg2.extras import execute_values
 except ImportError:
     print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary")
     sys.exit(1)
@@ -38,6 +38,8 @@ except ImportError:
 # ============ CONFIGURATION ============
 
 SQLITE_PATH = "grade_predictor.db"
+PAGE_SIZE = 1000  # rows per multi-row INSERT
+FETCH_SIZE = 5000  # rows read from SQLite and committed to Postgres per batch
 TABLES_TO_MIGRATE = [
     "users",
     "courses",
@@ -124,19 +126,18 @@ def migrate_table(sqlite_conn, pg_conn, table_name):
         print(f"  ⚠ Table '{table_name}' has no columns, skipping")
         return 0
 
-    # Read all data from SQLite
     sqlite_cur = sqlite_conn.cursor()
-    sqlite_cur.execute(f"SELECT * FROM {table_name}")
-    rows = sqlite_cur.fetchall()
+    sqlite_cur.execute(f"SELECT COUNT(*) FROM {table_name}")
+    total = sqlite_cur.fetchone()[0]
 
-    if not rows:
+    if not total:
         print(f"  ℹ Table '{table_name}' is empty, skipping")
         return 0
 
     # Prepare INSERT statement for Postgres
     # Use ON CONFLICT DO NOTHING to skip duplicates
     columns_str = ", ".join(columns)
-    placeholders = ", ".join(["%s"] * len(columns))
+    template = "(" + ", ".join(["%s"] * len(columns)) + ")"
 
     # Handle different conflict resolution based on table
     if "id" in columns:
@@ -146,27 +147,41 @@ def migrate_table(sqlite_conn, pg_conn, table_name):
     else:
         conflict_clause = "ON CONFLICT DO NOTHING"
 
+    # RETURNING yields one row per inserted (not skipped) row, across all pages
     insert_query = f"""
         INSERT INTO {table_name} ({columns_str})
-        VALUES ({placeholders})
+        VALUES %s
         {conflict_clause}
+        RETURNING 1
     """
 
-    # Insert data in batches
+    # Stream rows from SQLite in FETCH_SIZE batches, committing each batch,
+    # so memory stays constant regardless of table size
+    sqlite_cur.arraysize = FETCH_SIZE
+    sqlite_cur.execute(f"SELECT * FROM {table_name}")
     pg_cur = pg_conn.cursor()
+    inserted = 0
+    read = 0
     try:
-        execute_batch(pg_cur, insert_query, rows, page_size=100)
-        pg_conn.commit()
+        while True:
+            batch = sqlite_cur.fetchmany()
+            if not batch:
+                break
+            inserted += len(execute_values(
+                pg_cur, insert_query, batch,
+                template=template, page_size=PAGE_SIZE, fetch=True,
+            ))
+            pg_conn.commit()
+            read += len(batch)
+            print(f"  … {table_name}: {read}/{total} rows", end="\r", flush=True)
 
-        # Get count of rows inserted (approximate, since ON CONFLICT skips duplicates)
-        inserted = pg_cur.rowcount if pg_cur.rowcount != -1 else len(rows)
-        print(f"  ✓ Migrated {inserted}/{len(rows)} rows to '{table_name}'")
+        print(f"  ✓ Migrated {inserted}/{total} rows to '{table_name}'")
         return inserted
 
     except psycopg2.Error as e:
         pg_conn.rollback()
-        print(f"  ✗ ERROR migrating '{table_name}': {e}")
-        return 0
+        print(f"  ✗ ERROR migrating '{table_name}' after {inserted} rows: {e}")
+        return inserted
 
 def reset_sequences(pg_conn, table_name):
     """
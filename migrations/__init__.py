@@ -26,4 +26,9 @@ from .runner import (
     SchemaError,
     MigrationError,
     EXPECTED_SCHEMA,
+    EXPECTED_SCHEMA_ORDER,
+    COLUMNS,
+    EXPECTED_FINGERPRINT,
+    schema_is_current,
+    record_schema_fingerprint,
 )
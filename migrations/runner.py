@@ -8,321 +8,247 @@ Provides:
 - Safe auto-repair for old/legacy databases
 """
 
-import os
+import hashlib
+import heapq
+import re
 import sys
-from datetime import datetime
-from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+import textwrap
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import List, Dict, FrozenSet, Optional, Tuple
 
 # Expected schema definition - single source of truth
-# Format: {table_name: [column_names]}
+# Every table's columns, in DDL order, with their type per dialect and any
+# column constraints. Both the validation columns (EXPECTED_SCHEMA) and the
+# CREATE TABLE statements repair_schema uses are generated from it.
 # This prevents "missing column" bugs by validating at startup
-EXPECTED_SCHEMA: Dict[str, List[str]] = {
-    "users": ["id", "email", "username", "password_hash", "created_at", "last_login_at"],
-    "courses": ["id", "user_id", "course_name", "total_marks", "target_marks"],
-    "exams": ["id", "user_id", "course_id", "exam_name", "exam_date", "marks", "actual_marks", "is_retake"],
-    "topics": ["id", "user_id", "course_id", "topic_name", "weight_points", "notes"],
-    "study_sessions": ["id", "topic_id", "session_date", "duration_mins", "quality", "notes"],
-    "exercises": ["id", "topic_id", "exercise_date", "total_questions", "correct_answers", "source", "notes"],
-    "scheduled_lectures": ["id", "user_id", "course_id", "lecture_date", "lecture_time", "topics_planned", "attended", "notes"],
-    "timed_attempts": ["id", "user_id", "course_id", "attempt_date", "source", "minutes", "score_pct", "topics", "notes"],
-    "assessments": ["id", "user_id", "course_id", "assessment_name", "assessment_type", "marks", "actual_marks", "progress_pct", "due_date", "is_timed", "notes"],
-    "assignment_work": ["id", "user_id", "assessment_id", "work_date", "duration_mins", "work_type", "description", "progress_added"],
-    "sessions": ["id", "user_id", "session_id", "created_at", "last_seen_at"],
-    "events": ["id", "user_id", "event_name", "event_time", "metadata"],
-    "auth_tokens": ["id", "user_id", "token_hash", "created_at", "expires_at", "last_used_at", "user_agent", "revoked_at"],
-}
+Column = namedtuple("Column", "name sqlite_type pg_type constraints")
+
+
+def _col(name: str, sql_type: str, constraints: str = "") -> Column:
+    """Column whose type is spelled the same on both dialects."""
+    return Column(name, sql_type, sql_type, constraints)
+
 
-# SQL to create each table if missing (safe CREATE TABLE IF NOT EXISTS)
-# Used by repair_schema to handle old databases that never had certain tables
-TABLE_CREATE_SQL: Dict[str, Tuple[str, str]] = {
-    # (sqlite_sql, postgres_sql)
+_ID = Column("id", "INTEGER PRIMARY KEY AUTOINCREMENT", "SERIAL PRIMARY KEY", "")
+_USER_ID = _col("user_id", "INTEGER", "REFERENCES users(id)")
+_COURSE_ID = _col("course_id", "INTEGER", "NOT NULL REFERENCES courses(id)")
+_TOPIC_ID = _col("topic_id", "INTEGER", "NOT NULL REFERENCES topics(id)")
+
+# Tables are listed parents-first: repair_schema creates them in this order
+COLUMNS: Dict[str, Tuple[Column, ...]] = {
     "users": (
-        """CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE,
-            password_hash TEXT NOT NULL DEFAULT '',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login_at TIMESTAMP
-        )""",
-        """CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE,
-            password_hash TEXT NOT NULL DEFAULT '',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login_at TIMESTAMP
-        )"""
+        _ID,
+        _col("email", "TEXT", "UNIQUE NOT NULL"),
+        _col("username", "TEXT", "UNIQUE"),
+        _col("password_hash", "TEXT", "NOT NULL DEFAULT ''"),
+        _col("created_at", "TIMESTAMP", "DEFAULT CURRENT_TIMESTAMP"),
+        _col("last_login_at", "TIMESTAMP"),
+        _col("created_at_epoch", "BIGINT"),
+        _col("last_login_epoch", "BIGINT"),
     ),
     "courses": (
-        """CREATE TABLE IF NOT EXISTS courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_name TEXT NOT NULL,
-            total_marks INTEGER NOT NULL DEFAULT 120,
-            target_marks INTEGER NOT NULL DEFAULT 90,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS courses (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_name TEXT NOT NULL,
-            total_marks INTEGER NOT NULL DEFAULT 120,
-            target_marks INTEGER NOT NULL DEFAULT 90
-        )"""
+        _ID,
+        _USER_ID,
+        _col("course_name", "TEXT", "NOT NULL"),
+        _col("total_marks", "INTEGER", "NOT NULL DEFAULT 120"),
+        _col("target_marks", "INTEGER", "NOT NULL DEFAULT 90"),
     ),
     "exams": (
-        """CREATE TABLE IF NOT EXISTS exams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_id INTEGER NOT NULL,
-            exam_name TEXT NOT NULL,
-            exam_date DATE NOT NULL,
-            marks INTEGER NOT NULL DEFAULT 100,
-            actual_marks INTEGER DEFAULT NULL,
-            is_retake INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS exams (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_id INTEGER NOT NULL REFERENCES courses(id),
-            exam_name TEXT NOT NULL,
-            exam_date DATE NOT NULL,
-            marks INTEGER NOT NULL DEFAULT 100,
-            actual_marks INTEGER DEFAULT NULL,
-            is_retake INTEGER NOT NULL DEFAULT 0
-        )"""
+        _ID,
+        _USER_ID,
+        _COURSE_ID,
+        _col("exam_name", "TEXT", "NOT NULL"),
+        _col("exam_date", "DATE", "NOT NULL"),
+        _col("marks", "INTEGER", "NOT NULL DEFAULT 100"),
+        _col("actual_marks", "INTEGER", "DEFAULT NULL"),
+        _col("is_retake", "INTEGER", "NOT NULL DEFAULT 0"),
     ),
     "topics": (
-        """CREATE TABLE IF NOT EXISTS topics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_id INTEGER NOT NULL,
-            topic_name TEXT NOT NULL,
-            weight_points REAL NOT NULL DEFAULT 0,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS topics (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_id INTEGER NOT NULL REFERENCES courses(id),
-            topic_name TEXT NOT NULL,
-            weight_points REAL NOT NULL DEFAULT 0,
-            notes TEXT
-        )"""
+        _ID,
+        _USER_ID,
+        _COURSE_ID,
+        _col("topic_name", "TEXT", "NOT NULL"),
+        _col("weight_points", "REAL", "NOT NULL DEFAULT 0"),
+        _col("notes", "TEXT"),
     ),
     "study_sessions": (
-        """CREATE TABLE IF NOT EXISTS study_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic_id INTEGER NOT NULL,
-            session_date DATE NOT NULL,
-            duration_mins INTEGER NOT NULL DEFAULT 30,
-            quality INTEGER NOT NULL DEFAULT 3,
-            notes TEXT,
-            FOREIGN KEY (topic_id) REFERENCES topics(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS study_sessions (
-            id SERIAL PRIMARY KEY,
-            topic_id INTEGER NOT NULL REFERENCES topics(id),
-            session_date DATE NOT NULL,
-            duration_mins INTEGER NOT NULL DEFAULT 30,
-            quality INTEGER NOT NULL DEFAULT 3,
-            notes TEXT
-        )"""
+        _ID,
+        _TOPIC_ID,
+        _col("session_date", "DATE", "NOT NULL"),
+        _col("duration_mins", "INTEGER", "NOT NULL DEFAULT 30"),
+        _col("quality", "INTEGER", "NOT NULL DEFAULT 3"),
+        _col("notes", "TEXT"),
     ),
     "exercises": (
-        """CREATE TABLE IF NOT EXISTS exercises (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic_id INTEGER NOT NULL,
-            exercise_date DATE NOT NULL,
-            total_questions INTEGER NOT NULL,
-            correct_answers INTEGER NOT NULL,
-            source TEXT,
-            notes TEXT,
-            FOREIGN KEY (topic_id) REFERENCES topics(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS exercises (
-            id SERIAL PRIMARY KEY,
-            topic_id INTEGER NOT NULL REFERENCES topics(id),
-            exercise_date DATE NOT NULL,
-            total_questions INTEGER NOT NULL,
-            correct_answers INTEGER NOT NULL,
-            source TEXT,
-            notes TEXT
-        )"""
+        _ID,
+        _TOPIC_ID,
+        _col("exercise_date", "DATE", "NOT NULL"),
+        _col("total_questions", "INTEGER", "NOT NULL"),
+        _col("correct_answers", "INTEGER", "NOT NULL"),
+        _col("source", "TEXT"),
+        _col("notes", "TEXT"),
     ),
     "scheduled_lectures": (
-        """CREATE TABLE IF NOT EXISTS scheduled_lectures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_id INTEGER NOT NULL,
-            lecture_date DATE NOT NULL,
-            lecture_time TEXT,
-            topics_planned TEXT,
-            attended INTEGER DEFAULT NULL,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS scheduled_lectures (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_id INTEGER NOT NULL REFERENCES courses(id),
-            lecture_date DATE NOT NULL,
-            lecture_time TEXT,
-            topics_planned TEXT,
-            attended INTEGER DEFAULT NULL,
-            notes TEXT
-        )"""
+        _ID,
+        _USER_ID,
+        _COURSE_ID,
+        _col("lecture_date", "DATE", "NOT NULL"),
+        _col("lecture_time", "TEXT"),
+        _col("topics_planned", "TEXT"),
+        _col("attended", "INTEGER", "DEFAULT NULL"),
+        _col("notes", "TEXT"),
     ),
     "timed_attempts": (
-        """CREATE TABLE IF NOT EXISTS timed_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_id INTEGER NOT NULL,
-            attempt_date DATE NOT NULL,
-            source TEXT,
-            minutes INTEGER NOT NULL,
-            score_pct REAL NOT NULL,
-            topics TEXT,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS timed_attempts (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_id INTEGER NOT NULL REFERENCES courses(id),
-            attempt_date DATE NOT NULL,
-            source TEXT,
-            minutes INTEGER NOT NULL,
-            score_pct REAL NOT NULL,
-            topics TEXT,
-            notes TEXT
-        )"""
+        _ID,
+        _USER_ID,
+        _COURSE_ID,
+        _col("attempt_date", "DATE", "NOT NULL"),
+        _col("source", "TEXT"),
+        _col("minutes", "INTEGER", "NOT NULL"),
+        _col("score_pct", "REAL", "NOT NULL"),
+        _col("topics", "TEXT"),
+        _col("notes", "TEXT"),
     ),
     "assessments": (
-        """CREATE TABLE IF NOT EXISTS assessments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            course_id INTEGER NOT NULL,
-            assessment_name TEXT NOT NULL,
-            assessment_type TEXT NOT NULL,
-            marks INTEGER NOT NULL,
-            actual_marks INTEGER DEFAULT NULL,
-            progress_pct INTEGER DEFAULT 0,
-            due_date DATE,
-            is_timed INTEGER NOT NULL DEFAULT 1,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS assessments (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            course_id INTEGER NOT NULL REFERENCES courses(id),
-            assessment_name TEXT NOT NULL,
-            assessment_type TEXT NOT NULL,
-            marks INTEGER NOT NULL,
-            actual_marks INTEGER DEFAULT NULL,
-            progress_pct INTEGER DEFAULT 0,
-            due_date DATE,
-            is_timed INTEGER NOT NULL DEFAULT 1,
-            notes TEXT
-        )"""
+        _ID,
+        _USER_ID,
+        _COURSE_ID,
+        _col("assessment_name", "TEXT", "NOT NULL"),
+        _col("assessment_type", "TEXT", "NOT NULL"),
+        _col("marks", "INTEGER", "NOT NULL"),
+        _col("actual_marks", "INTEGER", "DEFAULT NULL"),
+        _col("progress_pct", "INTEGER", "DEFAULT 0"),
+        _col("due_date", "DATE"),
+        _col("is_timed", "INTEGER", "NOT NULL DEFAULT 1"),
+        _col("notes", "TEXT"),
     ),
     "assignment_work": (
-        """CREATE TABLE IF NOT EXISTS assignment_work (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            assessment_id INTEGER NOT NULL,
-            work_date DATE NOT NULL,
-            duration_mins INTEGER NOT NULL DEFAULT 30,
-            work_type TEXT NOT NULL DEFAULT 'research',
-            description TEXT,
-            progress_added INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (assessment_id) REFERENCES assessments(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS assignment_work (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            assessment_id INTEGER NOT NULL REFERENCES assessments(id),
-            work_date DATE NOT NULL,
-            duration_mins INTEGER NOT NULL DEFAULT 30,
-            work_type TEXT NOT NULL DEFAULT 'research',
-            description TEXT,
-            progress_added INTEGER DEFAULT 0
-        )"""
+        _ID,
+        _USER_ID,
+        _col("assessment_id", "INTEGER", "NOT NULL REFERENCES assessments(id)"),
+        _col("work_date", "DATE", "NOT NULL"),
+        _col("duration_mins", "INTEGER", "NOT NULL DEFAULT 30"),
+        _col("work_type", "TEXT", "NOT NULL DEFAULT 'research'"),
+        _col("description", "TEXT"),
+        _col("progress_added", "INTEGER", "DEFAULT 0"),
     ),
     "sessions": (
-        """CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            session_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS sessions (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            session_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-        )"""
+        _ID,
+        _USER_ID,
+        _col("session_id", "TEXT", "NOT NULL"),
+        _col("created_at", "TIMESTAMP", "DEFAULT CURRENT_TIMESTAMP"),
+        _col("last_seen_at", "TIMESTAMP", "NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+        _col("last_seen_epoch", "BIGINT"),
     ),
     "events": (
-        """CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            event_name TEXT NOT NULL,
-            event_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            metadata TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS events (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            event_name TEXT NOT NULL,
-            event_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            metadata TEXT
-        )"""
+        _ID,
+        _USER_ID,
+        _col("event_name", "TEXT", "NOT NULL"),
+        _col("event_time", "TIMESTAMP", "NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+        _col("metadata", "TEXT"),
+        _col("event_time_epoch", "BIGINT"),
     ),
     "auth_tokens": (
-        """CREATE TABLE IF NOT EXISTS auth_tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            last_used_at TIMESTAMP,
-            user_agent TEXT,
-            revoked_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )""",
-        """CREATE TABLE IF NOT EXISTS auth_tokens (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id),
-            token_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            last_used_at TIMESTAMP,
-            user_agent TEXT,
-            revoked_at TIMESTAMP
-        )"""
+        _ID,
+        _col("user_id", "INTEGER", "NOT NULL REFERENCES users(id)"),
+        _col("token_hash", "TEXT", "NOT NULL"),
+        _col("created_at", "TIMESTAMP", "DEFAULT CURRENT_TIMESTAMP"),
+        _col("expires_at", "TIMESTAMP", "NOT NULL"),
+        _col("last_used_at", "TIMESTAMP"),
+        _col("user_agent", "TEXT"),
+        _col("revoked_at", "TIMESTAMP"),
+    ),
+    "timed_attempt_topics": (
+        _col("attempt_id", "INTEGER", "NOT NULL REFERENCES timed_attempts(id) ON DELETE CASCADE"),
+        _col("topic_id", "INTEGER", "NOT NULL REFERENCES topics(id) ON DELETE CASCADE"),
+    ),
+    "lecture_topics": (
+        _col("lecture_id", "INTEGER", "NOT NULL REFERENCES scheduled_lectures(id) ON DELETE CASCADE"),
+        _col("topic_id", "INTEGER", "NOT NULL REFERENCES topics(id) ON DELETE CASCADE"),
+    ),
+    "stats_daily_events": (
+        _col("day", "INTEGER", "NOT NULL"),
+        _col("event_name", "TEXT", "NOT NULL"),
+        _col("event_count", "INTEGER", "NOT NULL DEFAULT 0"),
     ),
+    "stats_daily_event_users": (
+        _col("day", "INTEGER", "NOT NULL"),
+        _col("event_name", "TEXT", "NOT NULL"),
+        _col("user_id", "INTEGER", "NOT NULL"),
+    ),
+    "stats_daily_signups": (
+        _col("day", "INTEGER", "PRIMARY KEY"),
+        _col("new_users", "INTEGER", "NOT NULL DEFAULT 0"),
+    ),
+}
+
+# Composite primary keys. SQLite stores these tables WITHOUT ROWID: they are
+# looked up by their key only, so the clustered key saves a second b-tree
+COMPOSITE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "timed_attempt_topics": ("attempt_id", "topic_id"),
+    "lecture_topics": ("lecture_id", "topic_id"),
+    "stats_daily_events": ("event_name", "day"),
+    "stats_daily_event_users": ("event_name", "day", "user_id"),
 }
 
+# Format: {table_name: (column_names, ...)} in DDL order
+EXPECTED_SCHEMA_ORDER: Dict[str, Tuple[str, ...]] = {
+    table: tuple(c.name for c in columns) for table, columns in COLUMNS.items()
+}
+
+# The same columns as frozensets: O(1) membership, and set difference against
+# the live schema in one operation
+EXPECTED_SCHEMA: Dict[str, FrozenSet[str]] = {
+    table: frozenset(columns) for table, columns in EXPECTED_SCHEMA_ORDER.items()
+}
+
+# Every expected (table, column) pair: validation is one set difference
+# against the live snapshot's pairs
+EXPECTED_PAIRS: FrozenSet[Tuple[str, str]] = frozenset(
+    (table, column) for table, columns in EXPECTED_SCHEMA_ORDER.items() for column in columns
+)
+
+
+def _build_ddl(table: str, dialect: int) -> str:
+    """CREATE TABLE IF NOT EXISTS for one table (see _dialect_index)."""
+    parts = [
+        " ".join(filter(None, (c.name, c.pg_type if dialect else c.sqlite_type, c.constraints)))
+        for c in COLUMNS[table]
+    ]
+    key = COMPOSITE_KEYS.get(table)
+    if key:
+        parts.append(f"PRIMARY KEY ({', '.join(key)})")
+    body = ",\n    ".join(parts)
+    suffix = " WITHOUT ROWID" if key and not dialect else ""
+    return f"CREATE TABLE IF NOT EXISTS {table} (\n    {body}\n){suffix}"
+
 
 class SchemaError(Exception):
-    """Raised when schema validation fails."""
-    pass
+    """
+    Raised when schema validation fails.
+    Carries the {table: [missing] | ["TABLE_MISSING"]} issues; the
+    human-readable message is only built when the error is printed.
+    """
+
+    def __init__(self, issues: Dict[str, List[str]]):
+        super().__init__(issues)
+        self.issues = issues
+
+    def __str__(self) -> str:
+        error_parts = ["Schema validation failed after auto-repair attempt:"]
+        for table, cols in self.issues.items():
+            if cols == ["TABLE_MISSING"]:
+                error_parts.append(f"  - Missing table: {table}")
+            else:
+                error_parts.append(f"  - Table '{table}' missing columns: {cols}")
+
+        error_parts.append("")
+        error_parts.append("To fix manually:")
+        error_parts.append("  1. Delete the database file and restart (loses all data)")
+        error_parts.append("  2. Or run: python -c 'from migrations.runner import repair_schema; repair_schema(verbose=True)'")
+        return "\n".join(error_parts)
 
 
 class MigrationError(Exception):
@@ -722,18 +648,10 @@ MIGRATIONS: List[Tuple[str, str, str]] = [
         """,
         """
         -- Postgres: Add columns if they don't exist
-        DO $$
-        BEGIN
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='username') THEN
-                ALTER TABLE users ADD COLUMN username TEXT UNIQUE;
-            END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='password_hash') THEN
-                ALTER TABLE users ADD COLUMN password_hash TEXT NOT NULL DEFAULT '';
-            END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='last_login_at') THEN
-                ALTER TABLE users ADD COLUMN last_login_at TIMESTAMP;
-            END IF;
-        END $$;
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS username TEXT UNIQUE,
+            ADD COLUMN IF NOT EXISTS password_hash TEXT NOT NULL DEFAULT '',
+            ADD COLUMN IF NOT EXISTS last_login_at TIMESTAMP;
         """
     ),
     # Migration 016: Add user_id to legacy tables (upgrade path)
@@ -745,111 +663,691 @@ MIGRATIONS: List[Tuple[str, str, str]] = [
         """,
         """
         -- Postgres: Add user_id to tables if missing
-        DO $$
+        ALTER TABLE courses ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+        ALTER TABLE exams ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+        ALTER TABLE topics ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+        ALTER TABLE scheduled_lectures ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+        ALTER TABLE timed_attempts ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+        """
+    ),
+    # Migration 017: Add actual_marks and progress_pct to assessments
+    (
+        "017_assessments_add_tracking_columns",
+        """
+        SELECT 1;
+        """,
+        """
+        ALTER TABLE assessments
+            ADD COLUMN IF NOT EXISTS actual_marks INTEGER DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS progress_pct INTEGER DEFAULT 0;
+        """
+    ),
+    # Migration 018: One row per (user_id, session_id) so upsert_session can use ON CONFLICT
+    (
+        "018_sessions_unique_user_session",
+        """
+        DELETE FROM sessions WHERE id NOT IN (
+            SELECT MAX(id) FROM sessions GROUP BY user_id, session_id
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_user_session ON sessions(user_id, session_id);
+        """,
+        """
+        DELETE FROM sessions WHERE id NOT IN (
+            SELECT MAX(id) FROM sessions GROUP BY user_id, session_id
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_user_session ON sessions(user_id, session_id);
+        """
+    ),
+    # Migration 019: Indexes for hot lookups (users.email/username are already UNIQUE)
+    (
+        "019_add_lookup_indexes",
+        """
+        CREATE INDEX IF NOT EXISTS idx_courses_user ON courses(user_id);
+        CREATE INDEX IF NOT EXISTS idx_exams_user_course ON exams(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_topics_user_course ON topics(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_scheduled_lectures_user_course ON scheduled_lectures(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_timed_attempts_user_course ON timed_attempts(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_assessments_user_course ON assessments(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_study_sessions_topic ON study_sessions(topic_id);
+        CREATE INDEX IF NOT EXISTS idx_exercises_topic ON exercises(topic_id);
+        CREATE INDEX IF NOT EXISTS idx_assignment_work_assessment ON assignment_work(assessment_id);
+        CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens(user_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_courses_user ON courses(user_id);
+        CREATE INDEX IF NOT EXISTS idx_exams_user_course ON exams(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_topics_user_course ON topics(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_scheduled_lectures_user_course ON scheduled_lectures(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_timed_attempts_user_course ON timed_attempts(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_assessments_user_course ON assessments(user_id, course_id);
+        CREATE INDEX IF NOT EXISTS idx_study_sessions_topic ON study_sessions(topic_id);
+        CREATE INDEX IF NOT EXISTS idx_exercises_topic ON exercises(topic_id);
+        CREATE INDEX IF NOT EXISTS idx_assignment_work_assessment ON assignment_work(assessment_id);
+        CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens(user_id);
+        """
+    ),
+    # Migration 020: Numeric last-seen time so live-user counts are integer range scans
+    # last_seen_at holds the app server's local time (datetime.now().isoformat()):
+    # SQLite's 'utc' modifier converts it from the process's local zone, Postgres
+    # reads it in the session TimeZone, so the epoch is exact when that zone is
+    # the app server's (otherwise off by the difference until the next refresh).
+    (
+        "020_sessions_last_seen_epoch",
+        """
+        ALTER TABLE sessions ADD COLUMN last_seen_epoch BIGINT;
+        UPDATE sessions SET last_seen_epoch = CAST(strftime('%s', last_seen_at, 'utc') AS INTEGER)
+            WHERE last_seen_epoch IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_seen_epoch ON sessions(last_seen_epoch);
+        """,
+        """
+        ALTER TABLE sessions ADD COLUMN IF NOT EXISTS last_seen_epoch BIGINT;
+        UPDATE sessions SET last_seen_epoch = EXTRACT(EPOCH FROM last_seen_at::timestamptz)::BIGINT
+            WHERE last_seen_epoch IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_seen_epoch ON sessions(last_seen_epoch);
+        """
+    ),
+    # Migration 021: Superseded by 022's epoch-column indexes (kept so the order is unchanged)
+    (
+        "021_add_admin_stats_indexes",
+        """
+        SELECT 1;
+        """,
+        """
+        SELECT 1;
+        """
+    ),
+    # Migration 022: Numeric event/user-creation times; the admin windows compare these.
+    # The application writes them on insert (SQLite can't ALTER in a non-constant default).
+    # event_time / created_at come from CURRENT_TIMESTAMP defaults: UTC on SQLite,
+    # the session TimeZone on Postgres (a TIMESTAMP without time zone), hence
+    # ::timestamptz there; EXTRACT on the bare column would read it as UTC.
+    (
+        "022_events_users_epoch_columns",
+        """
+        ALTER TABLE events ADD COLUMN event_time_epoch BIGINT;
+        UPDATE events SET event_time_epoch = CAST(strftime('%s', event_time) AS INTEGER)
+            WHERE event_time_epoch IS NULL;
+        ALTER TABLE users ADD COLUMN created_at_epoch BIGINT;
+        UPDATE users SET created_at_epoch = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE created_at_epoch IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_events_name_epoch ON events(event_name, event_time_epoch);
+        CREATE INDEX IF NOT EXISTS idx_events_name_user_epoch ON events(event_name, user_id, event_time_epoch);
+        CREATE INDEX IF NOT EXISTS idx_users_created_at_epoch ON users(created_at_epoch);
+        """,
+        """
+        ALTER TABLE events ADD COLUMN IF NOT EXISTS event_time_epoch BIGINT;
+        UPDATE events SET event_time_epoch = EXTRACT(EPOCH FROM event_time::timestamptz)::BIGINT
+            WHERE event_time_epoch IS NULL;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at_epoch BIGINT;
+        UPDATE users SET created_at_epoch = EXTRACT(EPOCH FROM created_at::timestamptz)::BIGINT
+            WHERE created_at_epoch IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_events_name_epoch ON events(event_name, event_time_epoch);
+        CREATE INDEX IF NOT EXISTS idx_events_name_user_epoch ON events(event_name, user_id, event_time_epoch);
+        CREATE INDEX IF NOT EXISTS idx_users_created_at_epoch ON users(created_at_epoch);
+        """
+    ),
+    # Migration 023: Topic links for timed attempts and lectures (matched by name)
+    # Topics are tagged as free text; triggers resolve "topic name appears in the
+    # text" (case-insensitive) at write time so mastery reads are indexed joins.
+    (
+        "023_topic_link_tables",
+        """
+        CREATE TABLE IF NOT EXISTS timed_attempt_topics (
+            attempt_id INTEGER NOT NULL REFERENCES timed_attempts(id) ON DELETE CASCADE,
+            topic_id INTEGER NOT NULL REFERENCES topics(id) ON DELETE CASCADE,
+            PRIMARY KEY (attempt_id, topic_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_timed_attempt_topics_topic ON timed_attempt_topics(topic_id, attempt_id);
+        CREATE TABLE IF NOT EXISTS lecture_topics (
+            lecture_id INTEGER NOT NULL REFERENCES scheduled_lectures(id) ON DELETE CASCADE,
+            topic_id INTEGER NOT NULL REFERENCES topics(id) ON DELETE CASCADE,
+            PRIMARY KEY (lecture_id, topic_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_lecture_topics_topic ON lecture_topics(topic_id, lecture_id);
+        INSERT OR IGNORE INTO timed_attempt_topics(attempt_id, topic_id)
+            SELECT a.id, t.id FROM timed_attempts a JOIN topics t ON t.course_id = a.course_id
+            WHERE instr(lower(a.topics), lower(t.topic_name)) > 0;
+        INSERT OR IGNORE INTO lecture_topics(lecture_id, topic_id)
+            SELECT l.id, t.id FROM scheduled_lectures l JOIN topics t ON t.course_id = l.course_id
+            WHERE instr(lower(l.topics_planned), lower(t.topic_name)) > 0;
+        CREATE TRIGGER IF NOT EXISTS trg_timed_attempts_link_insert AFTER INSERT ON timed_attempts BEGIN
+            INSERT OR IGNORE INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND instr(lower(NEW.topics), lower(t.topic_name)) > 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_timed_attempts_link_update AFTER UPDATE OF topics, course_id ON timed_attempts BEGIN
+            DELETE FROM timed_attempt_topics WHERE attempt_id = NEW.id;
+            INSERT OR IGNORE INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND instr(lower(NEW.topics), lower(t.topic_name)) > 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_scheduled_lectures_link_insert AFTER INSERT ON scheduled_lectures BEGIN
+            INSERT OR IGNORE INTO lecture_topics(lecture_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND instr(lower(NEW.topics_planned), lower(t.topic_name)) > 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_scheduled_lectures_link_update AFTER UPDATE OF topics_planned, course_id ON scheduled_lectures BEGIN
+            DELETE FROM lecture_topics WHERE lecture_id = NEW.id;
+            INSERT OR IGNORE INTO lecture_topics(lecture_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND instr(lower(NEW.topics_planned), lower(t.topic_name)) > 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_topics_link_insert AFTER INSERT ON topics BEGIN
+            INSERT OR IGNORE INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT a.id, NEW.id FROM timed_attempts a
+                WHERE a.course_id = NEW.course_id AND instr(lower(a.topics), lower(NEW.topic_name)) > 0;
+            INSERT OR IGNORE INTO lecture_topics(lecture_id, topic_id)
+                SELECT l.id, NEW.id FROM scheduled_lectures l
+                WHERE l.course_id = NEW.course_id AND instr(lower(l.topics_planned), lower(NEW.topic_name)) > 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_topics_link_update AFTER UPDATE OF topic_name, course_id ON topics BEGIN
+            DELETE FROM timed_attempt_topics WHERE topic_id = NEW.id;
+            DELETE FROM lecture_topics WHERE topic_id = NEW.id;
+            INSERT OR IGNORE INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT a.id, NEW.id FROM timed_attempts a
+                WHERE a.course_id = NEW.course_id AND instr(lower(a.topics), lower(NEW.topic_name)) > 0;
+            INSERT OR IGNORE INTO lecture_topics(lecture_id, topic_id)
+                SELECT l.id, NEW.id FROM scheduled_lectures l
+                WHERE l.course_id = NEW.course_id AND instr(lower(l.topics_planned), lower(NEW.topic_name)) > 0;
+        END;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS timed_attempt_topics (
+            attempt_id INTEGER NOT NULL REFERENCES timed_attempts(id) ON DELETE CASCADE,
+            topic_id INTEGER NOT NULL REFERENCES topics(id) ON DELETE CASCADE,
+            PRIMARY KEY (attempt_id, topic_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_timed_attempt_topics_topic ON timed_attempt_topics(topic_id, attempt_id);
+        CREATE TABLE IF NOT EXISTS lecture_topics (
+            lecture_id INTEGER NOT NULL REFERENCES scheduled_lectures(id) ON DELETE CASCADE,
+            topic_id INTEGER NOT NULL REFERENCES topics(id) ON DELETE CASCADE,
+            PRIMARY KEY (lecture_id, topic_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_lecture_topics_topic ON lecture_topics(topic_id, lecture_id);
+        INSERT INTO timed_attempt_topics(attempt_id, topic_id)
+            SELECT a.id, t.id FROM timed_attempts a JOIN topics t ON t.course_id = a.course_id
+            WHERE strpos(lower(a.topics), lower(t.topic_name)) > 0
+            ON CONFLICT DO NOTHING;
+        INSERT INTO lecture_topics(lecture_id, topic_id)
+            SELECT l.id, t.id FROM scheduled_lectures l JOIN topics t ON t.course_id = l.course_id
+            WHERE strpos(lower(l.topics_planned), lower(t.topic_name)) > 0
+            ON CONFLICT DO NOTHING;
+        CREATE OR REPLACE FUNCTION link_timed_attempt_topics() RETURNS trigger AS $$
         BEGIN
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='courses' AND column_name='user_id') THEN
-                ALTER TABLE courses ADD COLUMN user_id INTEGER REFERENCES users(id);
+            IF TG_OP = 'UPDATE' THEN
+                DELETE FROM timed_attempt_topics WHERE attempt_id = NEW.id;
             END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='exams' AND column_name='user_id') THEN
-                ALTER TABLE exams ADD COLUMN user_id INTEGER REFERENCES users(id);
+            INSERT INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND strpos(lower(NEW.topics), lower(t.topic_name)) > 0
+                ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE OR REPLACE FUNCTION link_lecture_topics() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                DELETE FROM lecture_topics WHERE lecture_id = NEW.id;
             END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='topics' AND column_name='user_id') THEN
-                ALTER TABLE topics ADD COLUMN user_id INTEGER REFERENCES users(id);
+            INSERT INTO lecture_topics(lecture_id, topic_id)
+                SELECT NEW.id, t.id FROM topics t
+                WHERE t.course_id = NEW.course_id AND strpos(lower(NEW.topics_planned), lower(t.topic_name)) > 0
+                ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE OR REPLACE FUNCTION link_topic() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                DELETE FROM timed_attempt_topics WHERE topic_id = NEW.id;
+                DELETE FROM lecture_topics WHERE topic_id = NEW.id;
             END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scheduled_lectures' AND column_name='user_id') THEN
-                ALTER TABLE scheduled_lectures ADD COLUMN user_id INTEGER REFERENCES users(id);
+            INSERT INTO timed_attempt_topics(attempt_id, topic_id)
+                SELECT a.id, NEW.id FROM timed_attempts a
+                WHERE a.course_id = NEW.course_id AND strpos(lower(a.topics), lower(NEW.topic_name)) > 0
+                ON CONFLICT DO NOTHING;
+            INSERT INTO lecture_topics(lecture_id, topic_id)
+                SELECT l.id, NEW.id FROM scheduled_lectures l
+                WHERE l.course_id = NEW.course_id AND strpos(lower(l.topics_planned), lower(NEW.topic_name)) > 0
+                ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS trg_timed_attempts_link ON timed_attempts;
+        CREATE TRIGGER trg_timed_attempts_link AFTER INSERT OR UPDATE OF topics, course_id ON timed_attempts
+            FOR EACH ROW EXECUTE PROCEDURE link_timed_attempt_topics();
+        DROP TRIGGER IF EXISTS trg_scheduled_lectures_link ON scheduled_lectures;
+        CREATE TRIGGER trg_scheduled_lectures_link AFTER INSERT OR UPDATE OF topics_planned, course_id ON scheduled_lectures
+            FOR EACH ROW EXECUTE PROCEDURE link_lecture_topics();
+        DROP TRIGGER IF EXISTS trg_topics_link ON topics;
+        CREATE TRIGGER trg_topics_link AFTER INSERT OR UPDATE OF topic_name, course_id ON topics
+            FOR EACH ROW EXECUTE PROCEDURE link_topic();
+        """
+    ),
+    # Migration 024: Daily rollups for the admin dashboard, kept current by insert
+    # triggers (day = epoch seconds // 86400, UTC). The per-user table keeps
+    # distinct-user counts exact across multi-day windows. Existing rows are
+    # rolled up by 026 once it has backfilled their epoch columns.
+    (
+        "024_stats_daily_rollups",
+        """
+        CREATE TABLE IF NOT EXISTS stats_daily_events (
+            day INTEGER NOT NULL,
+            event_name TEXT NOT NULL,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_name, day)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS stats_daily_event_users (
+            day INTEGER NOT NULL,
+            event_name TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (event_name, day, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS stats_daily_signups (
+            day INTEGER PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TRIGGER IF NOT EXISTS trg_events_stats_daily AFTER INSERT ON events
+        WHEN NEW.event_time_epoch IS NOT NULL BEGIN
+            INSERT INTO stats_daily_events(day, event_name, event_count)
+                VALUES (NEW.event_time_epoch / 86400, NEW.event_name, 1)
+                ON CONFLICT(event_name, day) DO UPDATE SET event_count = event_count + 1;
+            INSERT OR IGNORE INTO stats_daily_event_users(day, event_name, user_id)
+                SELECT NEW.event_time_epoch / 86400, NEW.event_name, NEW.user_id
+                WHERE NEW.user_id IS NOT NULL;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_stats_daily AFTER INSERT ON users
+        WHEN NEW.created_at_epoch IS NOT NULL BEGIN
+            INSERT INTO stats_daily_signups(day, new_users)
+                VALUES (NEW.created_at_epoch / 86400, 1)
+                ON CONFLICT(day) DO UPDATE SET new_users = new_users + 1;
+        END;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_daily_events (
+            day INTEGER NOT NULL,
+            event_name TEXT NOT NULL,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_name, day)
+        );
+        CREATE TABLE IF NOT EXISTS stats_daily_event_users (
+            day INTEGER NOT NULL,
+            event_name TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (event_name, day, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS stats_daily_signups (
+            day INTEGER PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE OR REPLACE FUNCTION stats_daily_event() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.event_time_epoch IS NOT NULL THEN
+                INSERT INTO stats_daily_events(day, event_name, event_count)
+                    VALUES (NEW.event_time_epoch / 86400, NEW.event_name, 1)
+                    ON CONFLICT (event_name, day)
+                    DO UPDATE SET event_count = stats_daily_events.event_count + 1;
+                IF NEW.user_id IS NOT NULL THEN
+                    INSERT INTO stats_daily_event_users(day, event_name, user_id)
+                        VALUES (NEW.event_time_epoch / 86400, NEW.event_name, NEW.user_id)
+                        ON CONFLICT DO NOTHING;
+                END IF;
             END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='timed_attempts' AND column_name='user_id') THEN
-                ALTER TABLE timed_attempts ADD COLUMN user_id INTEGER REFERENCES users(id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE OR REPLACE FUNCTION stats_daily_signup() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.created_at_epoch IS NOT NULL THEN
+                INSERT INTO stats_daily_signups(day, new_users)
+                    VALUES (NEW.created_at_epoch / 86400, 1)
+                    ON CONFLICT (day)
+                    DO UPDATE SET new_users = stats_daily_signups.new_users + 1;
             END IF;
-        END $$;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS trg_events_stats_daily ON events;
+        CREATE TRIGGER trg_events_stats_daily AFTER INSERT ON events
+            FOR EACH ROW EXECUTE PROCEDURE stats_daily_event();
+        DROP TRIGGER IF EXISTS trg_users_stats_daily ON users;
+        CREATE TRIGGER trg_users_stats_daily AFTER INSERT ON users
+            FOR EACH ROW EXECUTE PROCEDURE stats_daily_signup();
         """
     ),
-    # Migration 017: Add actual_marks and progress_pct to assessments
+    # Migration 025: Next-due lookup is an index seek; supersedes idx_assessments_user_course
     (
-        "017_assessments_add_tracking_columns",
+        "025_assessments_user_course_due_index",
         """
-        SELECT 1;
+        CREATE INDEX IF NOT EXISTS idx_assessments_user_course_due ON assessments(user_id, course_id, due_date);
+        DROP INDEX IF EXISTS idx_assessments_user_course;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_assessments_user_course_due ON assessments(user_id, course_id, due_date);
+        DROP INDEX IF EXISTS idx_assessments_user_course;
+        """
+    ),
+    # Migration 026: Fill event_time_epoch / created_at_epoch for inserts that omit them
+    # (raw SQL, migrate_sqlite_to_postgres from a pre-022 file) from the row's own
+    # timestamp, so admin windows and the daily rollups no longer skip those rows.
+    # Rows missed so far are backfilled and the rollups rebuilt once. Same time
+    # zone reading as 022.
+    (
+        "026_epoch_column_defaults",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_events_fill_epoch AFTER INSERT ON events
+        WHEN NEW.event_time_epoch IS NULL BEGIN
+            UPDATE events SET event_time_epoch = CAST(strftime('%s', NEW.event_time) AS INTEGER)
+                WHERE id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_fill_epoch AFTER INSERT ON users
+        WHEN NEW.created_at_epoch IS NULL BEGIN
+            UPDATE users SET created_at_epoch = CAST(strftime('%s', NEW.created_at) AS INTEGER)
+                WHERE id = NEW.id;
+        END;
+        DROP TRIGGER IF EXISTS trg_events_stats_daily;
+        CREATE TRIGGER trg_events_stats_daily AFTER INSERT ON events
+        WHEN COALESCE(NEW.event_time_epoch, CAST(strftime('%s', NEW.event_time) AS INTEGER)) IS NOT NULL BEGIN
+            INSERT INTO stats_daily_events(day, event_name, event_count)
+                VALUES (COALESCE(NEW.event_time_epoch, CAST(strftime('%s', NEW.event_time) AS INTEGER)) / 86400,
+                        NEW.event_name, 1)
+                ON CONFLICT(event_name, day) DO UPDATE SET event_count = event_count + 1;
+            INSERT OR IGNORE INTO stats_daily_event_users(day, event_name, user_id)
+                SELECT COALESCE(NEW.event_time_epoch, CAST(strftime('%s', NEW.event_time) AS INTEGER)) / 86400,
+                       NEW.event_name, NEW.user_id
+                WHERE NEW.user_id IS NOT NULL;
+        END;
+        DROP TRIGGER IF EXISTS trg_users_stats_daily;
+        CREATE TRIGGER trg_users_stats_daily AFTER INSERT ON users
+        WHEN COALESCE(NEW.created_at_epoch, CAST(strftime('%s', NEW.created_at) AS INTEGER)) IS NOT NULL BEGIN
+            INSERT INTO stats_daily_signups(day, new_users)
+                VALUES (COALESCE(NEW.created_at_epoch, CAST(strftime('%s', NEW.created_at) AS INTEGER)) / 86400, 1)
+                ON CONFLICT(day) DO UPDATE SET new_users = new_users + 1;
+        END;
+        UPDATE events SET event_time_epoch = CAST(strftime('%s', event_time) AS INTEGER)
+            WHERE event_time_epoch IS NULL;
+        UPDATE users SET created_at_epoch = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE created_at_epoch IS NULL;
+        DELETE FROM stats_daily_events;
+        DELETE FROM stats_daily_event_users;
+        DELETE FROM stats_daily_signups;
+        INSERT INTO stats_daily_events(day, event_name, event_count)
+            SELECT event_time_epoch / 86400, event_name, COUNT(*) FROM events
+            WHERE event_time_epoch IS NOT NULL GROUP BY event_time_epoch / 86400, event_name;
+        INSERT INTO stats_daily_event_users(day, event_name, user_id)
+            SELECT DISTINCT event_time_epoch / 86400, event_name, user_id FROM events
+            WHERE event_time_epoch IS NOT NULL AND user_id IS NOT NULL;
+        INSERT INTO stats_daily_signups(day, new_users)
+            SELECT created_at_epoch / 86400, COUNT(*) FROM users
+            WHERE created_at_epoch IS NOT NULL GROUP BY created_at_epoch / 86400;
         """,
         """
-        DO $$
+        CREATE OR REPLACE FUNCTION fill_event_time_epoch() RETURNS trigger AS $$
         BEGIN
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='assessments' AND column_name='actual_marks') THEN
-                ALTER TABLE assessments ADD COLUMN actual_marks INTEGER DEFAULT NULL;
+            IF NEW.event_time_epoch IS NULL THEN
+                NEW.event_time_epoch := EXTRACT(EPOCH FROM COALESCE(NEW.event_time::timestamptz, now()))::BIGINT;
             END IF;
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='assessments' AND column_name='progress_pct') THEN
-                ALTER TABLE assessments ADD COLUMN progress_pct INTEGER DEFAULT 0;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE OR REPLACE FUNCTION fill_created_at_epoch() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.created_at_epoch IS NULL THEN
+                NEW.created_at_epoch := EXTRACT(EPOCH FROM COALESCE(NEW.created_at::timestamptz, now()))::BIGINT;
             END IF;
-        END $$;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS trg_events_fill_epoch ON events;
+        CREATE TRIGGER trg_events_fill_epoch BEFORE INSERT ON events
+            FOR EACH ROW EXECUTE PROCEDURE fill_event_time_epoch();
+        DROP TRIGGER IF EXISTS trg_users_fill_epoch ON users;
+        CREATE TRIGGER trg_users_fill_epoch BEFORE INSERT ON users
+            FOR EACH ROW EXECUTE PROCEDURE fill_created_at_epoch();
+        UPDATE events SET event_time_epoch = EXTRACT(EPOCH FROM event_time::timestamptz)::BIGINT
+            WHERE event_time_epoch IS NULL;
+        UPDATE users SET created_at_epoch = EXTRACT(EPOCH FROM created_at::timestamptz)::BIGINT
+            WHERE created_at_epoch IS NULL;
+        DELETE FROM stats_daily_events;
+        DELETE FROM stats_daily_event_users;
+        DELETE FROM stats_daily_signups;
+        INSERT INTO stats_daily_events(day, event_name, event_count)
+            SELECT event_time_epoch / 86400, event_name, COUNT(*) FROM events
+            WHERE event_time_epoch IS NOT NULL GROUP BY event_time_epoch / 86400, event_name;
+        INSERT INTO stats_daily_event_users(day, event_name, user_id)
+            SELECT DISTINCT event_time_epoch / 86400, event_name, user_id FROM events
+            WHERE event_time_epoch IS NOT NULL AND user_id IS NOT NULL;
+        INSERT INTO stats_daily_signups(day, new_users)
+            SELECT created_at_epoch / 86400, COUNT(*) FROM users
+            WHERE created_at_epoch IS NOT NULL GROUP BY created_at_epoch / 86400;
+        """
+    ),
+    # Migration 027: Numeric last-login time, written with last_login_at from one
+    # clock reading. last_login_at holds the app server's local time; the
+    # backfill reads it the way 020 reads sessions.last_seen_at.
+    (
+        "027_users_last_login_epoch",
+        """
+        ALTER TABLE users ADD COLUMN last_login_epoch BIGINT;
+        UPDATE users SET last_login_epoch = CAST(strftime('%s', last_login_at, 'utc') AS INTEGER)
+            WHERE last_login_epoch IS NULL;
+        """,
+        """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login_epoch BIGINT;
+        UPDATE users SET last_login_epoch = EXTRACT(EPOCH FROM last_login_at::timestamptz)::BIGINT
+            WHERE last_login_epoch IS NULL;
         """
     ),
 ]
 
+# Drop the source indentation once: the SQL is kept (and split per dialect)
+# for the life of the process
+MIGRATIONS = [
+    (name, textwrap.dedent(sqlite_sql).strip(), textwrap.dedent(postgres_sql).strip())
+    for name, sqlite_sql, postgres_sql in MIGRATIONS
+]
+
+# Migrations that must run after others (beyond creating the tables they
+# touch, this is what 016's legacy backfill or 019's indexes rely on).
+# Registry position breaks ties, so with no conflicting entries the applied
+# order is simply the list order above.
+MIGRATION_DEPENDS: Dict[str, Tuple[str, ...]] = {
+    "003_create_courses": ("002_create_users",),
+    "004_create_exams": ("002_create_users", "003_create_courses"),
+    "005_create_topics": ("002_create_users", "003_create_courses"),
+    "006_create_study_sessions": ("005_create_topics",),
+    "007_create_exercises": ("005_create_topics",),
+    "008_create_scheduled_lectures": ("002_create_users", "003_create_courses"),
+    "009_create_timed_attempts": ("002_create_users", "003_create_courses"),
+    "010_create_assessments": ("002_create_users", "003_create_courses"),
+    "011_create_assignment_work": ("002_create_users", "010_create_assessments"),
+    "012_create_sessions": ("002_create_users",),
+    "013_create_events": ("002_create_users",),
+    "014_create_auth_tokens": ("002_create_users",),
+    "015_users_add_auth_columns": ("002_create_users",),
+    "016_add_user_id_to_legacy_tables": (
+        "003_create_courses", "004_create_exams", "005_create_topics",
+        "008_create_scheduled_lectures", "009_create_timed_attempts",
+    ),
+    "017_assessments_add_tracking_columns": ("010_create_assessments",),
+    "018_sessions_unique_user_session": ("012_create_sessions",),
+    "019_add_lookup_indexes": (
+        "006_create_study_sessions", "007_create_exercises", "011_create_assignment_work",
+        "013_create_events", "014_create_auth_tokens", "016_add_user_id_to_legacy_tables",
+    ),
+    "020_sessions_last_seen_epoch": ("012_create_sessions",),
+    "021_add_admin_stats_indexes": ("013_create_events", "015_users_add_auth_columns"),
+    "022_events_users_epoch_columns": ("013_create_events", "015_users_add_auth_columns"),
+    "023_topic_link_tables": ("008_create_scheduled_lectures", "009_create_timed_attempts"),
+    "024_stats_daily_rollups": ("022_events_users_epoch_columns",),
+    "025_assessments_user_course_due_index": ("017_assessments_add_tracking_columns", "019_add_lookup_indexes"),
+    "026_epoch_column_defaults": ("022_events_users_epoch_columns", "024_stats_daily_rollups"),
+    "027_users_last_login_epoch": ("015_users_add_auth_columns",),
+}
+
+
+def _topological_order(names: List[str], depends: Dict[str, Tuple[str, ...]]) -> Tuple[str, ...]:
+    """
+    Kahn's algorithm over the dependency graph, always taking the ready
+    migration with the lowest registry position next.
+    Raises MigrationError for unknown dependencies or cycles.
+    """
+    position = {name: i for i, name in enumerate(names)}
+    indegree = dict.fromkeys(names, 0)
+    children: Dict[str, List[str]] = {name: [] for name in names}
+    for name, deps in depends.items():
+        for dep in (name, *deps):
+            if dep not in position:
+                raise MigrationError(f"Unknown migration in dependencies: {dep}")
+        for dep in deps:
+            children[dep].append(name)
+            indegree[name] += 1
+
+    ready = [(position[name], name) for name, degree in indegree.items() if degree == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, name = heapq.heappop(ready)
+        order.append(name)
+        for child in children[name]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                heapq.heappush(ready, (position[child], child))
+
+    if len(order) != len(names):
+        stuck = sorted(name for name, degree in indegree.items() if degree)
+        raise MigrationError(f"Migration dependency cycle among: {', '.join(stuck)}")
+    return tuple(order)
+
+
+# pg_advisory_xact_lock key held while a migration batch applies, so only
+# one process at a time migrates a shared Postgres database
+MIGRATION_LOCK_KEY = 0x67726164655F6D67  # "grade_mg"
+
+# Order migrations are applied in; computed once at import
+MIGRATION_ORDER = _topological_order([name for name, _, _ in MIGRATIONS], MIGRATION_DEPENDS)
+
+# Identifies this build's schema: expected tables/columns plus the migration list.
+# Stored after a clean migrate + validate; a match on the next start means
+# neither needs to run again (see schema_is_current).
+EXPECTED_FINGERPRINT = hashlib.sha256(
+    repr(sorted((table, sorted(columns)) for table, columns in EXPECTED_SCHEMA.items())).encode()
+    + b"|"
+    + ";".join(name for name, _, _ in MIGRATIONS).encode()
+).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _db():
+    """The db module, imported on first use (db imports this package)."""
+    import db
+    return db
+
 
 def _get_db_connection():
     """Get database connection using db module's get_conn."""
-    # Import here to avoid circular imports
-    import db
-    return db.get_conn()
+    return _db().get_conn()
 
 
-def _is_postgres():
-    """Check if using PostgreSQL."""
-    import db
-    return db.is_postgres()
+def _shared_connection(func):
+    """Run func with every db.get_conn() inside it sharing one (probed) connection."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _db().shared_connection():
+            return func(*args, **kwargs)
+    return wrapper
 
 
-def _table_exists(table: str) -> bool:
-    """Check if a table exists."""
-    import db
-    return db.table_exists(table)
+@lru_cache(maxsize=1)
+def _is_postgres():
+    """Check if using PostgreSQL (resolved once; db._specialize_backend clears it)."""
+    return _db().is_postgres()
 
 
-def _column_exists(table: str, column: str) -> bool:
-    """Check if a column exists in a table."""
-    import db
-    return db.column_exists(table, column)
+def _dialect_index() -> int:
+    """Position of this dialect's SQL in (sqlite_sql, postgres_sql) pairs."""
+    return 1 if _is_postgres() else 0
 
 
-def _add_column_if_missing(table: str, column: str, column_def: str) -> bool:
+@lru_cache(maxsize=None)
+def _migrations_for_dialect(dialect: int) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
     """
-    Add a column to a table if it doesn't exist (SQLite-safe).
-    Returns True if column was added, False if it already existed.
+    (name, statements) for every migration in MIGRATION_ORDER, for one dialect
+    (see _dialect_index).
+    SQL is split once here; placeholder-only migrations ('SELECT 1'
+    sentinels) come out with no statements and are only recorded as applied.
     """
-    if _column_exists(table, column):
-        return False
+    sql_by_name = {name: dialect_sql[dialect] for name, *dialect_sql in MIGRATIONS}
+    return tuple(
+        (name, _migration_statements(sql_by_name[name]))
+        for name in MIGRATION_ORDER
+    )
 
-    if not _table_exists(table):
-        return False
 
-    with _get_db_connection() as conn:
-        cur = conn.cursor()
-        try:
-            if _is_postgres():
-                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_def}")
-            else:
-                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_def}")
-            conn.commit()
-            return True
-        except Exception as e:
-            # Column might already exist (race condition) or other error
-            conn.rollback()
-            return False
+@lru_cache(maxsize=None)
+def _table_create_sql(dialect: int) -> Dict[str, str]:
+    """{table: CREATE TABLE sql} for one dialect (see _dialect_index), in COLUMNS order."""
+    return {table: _build_ddl(table, dialect) for table in COLUMNS}
+
+
+def _invalidate_schema_cache():
+    """Drop db's schema snapshot after DDL so later checks see the change."""
+    _db().invalidate_schema_cache()
+
+
+def _actual_schema() -> Dict[str, frozenset]:
+    """{table: columns} for the live database (db's one-query snapshot)."""
+    return _db().get_schema()
+
+
+def _schema_issues() -> Dict[str, List[str]]:
+    """Diff EXPECTED_SCHEMA against the live schema: {table: [missing_columns] or ["TABLE_MISSING"]}."""
+    missing = EXPECTED_PAIRS - _db().get_schema_pairs()
+    if not missing:
+        return {}
+    actual = _actual_schema()
+    issues: Dict[str, List[str]] = {}
+    # Report in DDL order so messages and repairs are deterministic
+    for table, columns in EXPECTED_SCHEMA_ORDER.items():
+        if table not in actual:
+            issues[table] = ["TABLE_MISSING"]
+            continue
+        table_missing = [col for col in columns if (table, col) in missing]
+        if table_missing:
+            issues[table] = table_missing
+    return issues
 
 
-def _create_table_if_missing(table: str) -> bool:
+def _add_columns(table: str, col_defs: List[Tuple[str, str]]) -> bool:
     """
-    Create a table if it doesn't exist using TABLE_CREATE_SQL.
-    Returns True if table was created, False if it already existed.
+    Add (column, column_def) pairs to a table, all or nothing; the caller has
+    checked the schema snapshot. Postgres gets one multi-clause ALTER TABLE
+    (one lock window); SQLite, which allows one ADD COLUMN per statement,
+    runs them in one transaction. Returns True if the columns were added.
     """
-    if _table_exists(table):
+    try:
+        with _db().transaction() as conn:
+            cur = conn.cursor()
+            if _is_postgres():
+                clauses = ", ".join(f"ADD COLUMN IF NOT EXISTS {col} {col_def}" for col, col_def in col_defs)
+                cur.execute(f"ALTER TABLE {table} {clauses}")
+            else:
+                for col, col_def in col_defs:
+                    cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_def}")
+        return True
+    except Exception as e:
+        print(f"[migrations] Failed to add columns to {table}: {e}", file=sys.stderr)
         return False
 
-    if table not in TABLE_CREATE_SQL:
-        return False
 
-    sqlite_sql, postgres_sql = TABLE_CREATE_SQL[table]
-    sql = postgres_sql if _is_postgres() else sqlite_sql
+def _create_table(table: str) -> bool:
+    """
+    Create a table using the DDL generated from COLUMNS (CREATE TABLE IF NOT EXISTS).
+    Returns True if the statement succeeded.
+    """
+    sql = _table_create_sql(_dialect_index()).get(table)
+    if sql is None:
+        return False
 
     with _get_db_connection() as conn:
         cur = conn.cursor()
@@ -863,7 +1361,98 @@ def _create_table_if_missing(table: str) -> bool:
             return False
 
 
-def repair_schema(verbose: bool = False) -> Dict[str, List[str]]:
+def _create_tables(tables: List[str]) -> List[str]:
+    """
+    Create several tables (parents first) in one transaction; on Postgres the
+    statements go to the server as one script. If the batch fails, each table
+    is retried on its own so one bad table does not block the rest.
+    Returns the tables created.
+    """
+    create_sql = _table_create_sql(_dialect_index())
+    tables = [table for table in tables if table in create_sql]
+    if not tables:
+        return []
+    try:
+        with _db().transaction() as conn:
+            cur = conn.cursor()
+            if _is_postgres():
+                cur.execute(";\n".join(create_sql[table] for table in tables))
+            else:
+                for table in tables:
+                    cur.execute(create_sql[table])
+        return tables
+    except Exception:
+        return [table for table in tables if _create_table(table)]
+
+
+# Column definitions for repair (column_name: sql_type_with_default), for
+# columns old databases may lack. ALTER TABLE ADD COLUMN cannot take every
+# constraint the CREATE TABLE DDL has, so these are looser than COLUMNS.
+COLUMN_DEFS: Dict[str, Dict[str, str]] = {
+    "users": {
+        "username": "TEXT",  # Removed UNIQUE constraint for ALTER TABLE compatibility
+        "password_hash": "TEXT DEFAULT ''",
+        "last_login_at": "TIMESTAMP",
+        "created_at_epoch": "BIGINT",
+        "last_login_epoch": "BIGINT",
+    },
+    "courses": {
+        "user_id": "INTEGER",
+        "total_marks": "INTEGER DEFAULT 120",
+        "target_marks": "INTEGER DEFAULT 90",
+    },
+    "exams": {
+        "user_id": "INTEGER",
+        "actual_marks": "INTEGER",
+        "is_retake": "INTEGER DEFAULT 0",
+    },
+    "topics": {
+        "user_id": "INTEGER",
+        "notes": "TEXT",
+    },
+    "study_sessions": {
+        "notes": "TEXT",
+    },
+    "exercises": {
+        "source": "TEXT",
+        "notes": "TEXT",
+    },
+    "scheduled_lectures": {
+        "user_id": "INTEGER",
+        "notes": "TEXT",
+    },
+    "timed_attempts": {
+        "user_id": "INTEGER",
+        "notes": "TEXT",
+    },
+    "assessments": {
+        "user_id": "INTEGER",
+        "actual_marks": "INTEGER",
+        "progress_pct": "INTEGER DEFAULT 0",
+        "notes": "TEXT",
+    },
+    "assignment_work": {
+        "user_id": "INTEGER",
+        "description": "TEXT",
+    },
+    "sessions": {
+        "user_id": "INTEGER",
+        "last_seen_epoch": "BIGINT",
+    },
+    "events": {
+        "user_id": "INTEGER",
+        "metadata": "TEXT",
+        "event_time_epoch": "BIGINT",
+    },
+    "auth_tokens": {
+        "user_agent": "TEXT",
+        "revoked_at": "TIMESTAMP",
+    },
+}
+
+
+@_shared_connection
+def repair_schema(verbose: bool = False, issues: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
     """
     Attempt to repair schema by creating missing tables and adding missing columns.
     This is a safety net for old databases or when migrations didn't properly apply.
@@ -872,113 +1461,68 @@ def repair_schema(verbose: bool = False) -> Dict[str, List[str]]:
     - CREATE TABLE IF NOT EXISTS for missing tables
     - ALTER TABLE ADD COLUMN for missing columns
 
+    issues: a diff the caller already computed with _schema_issues(); read
+    from the live schema when omitted.
+
     Returns dict of {table: [columns_added_or_"TABLE_CREATED"]}
     """
-    # Column definitions for repair (column_name: sql_type_with_default)
-    COLUMN_DEFS = {
-        "users": {
-            "username": "TEXT",  # Removed UNIQUE constraint for ALTER TABLE compatibility
-            "password_hash": "TEXT DEFAULT ''",
-            "last_login_at": "TIMESTAMP",
-        },
-        "courses": {
-            "user_id": "INTEGER",
-            "total_marks": "INTEGER DEFAULT 120",
-            "target_marks": "INTEGER DEFAULT 90",
-        },
-        "exams": {
-            "user_id": "INTEGER",
-            "actual_marks": "INTEGER",
-            "is_retake": "INTEGER DEFAULT 0",
-        },
-        "topics": {
-            "user_id": "INTEGER",
-            "notes": "TEXT",
-        },
-        "study_sessions": {
-            "notes": "TEXT",
-        },
-        "exercises": {
-            "source": "TEXT",
-            "notes": "TEXT",
-        },
-        "scheduled_lectures": {
-            "user_id": "INTEGER",
-            "notes": "TEXT",
-        },
-        "timed_attempts": {
-            "user_id": "INTEGER",
-            "notes": "TEXT",
-        },
-        "assessments": {
-            "user_id": "INTEGER",
-            "actual_marks": "INTEGER",
-            "progress_pct": "INTEGER DEFAULT 0",
-            "notes": "TEXT",
-        },
-        "assignment_work": {
-            "user_id": "INTEGER",
-            "description": "TEXT",
-        },
-        "sessions": {
-            "user_id": "INTEGER",
-        },
-        "events": {
-            "user_id": "INTEGER",
-            "metadata": "TEXT",
-        },
-        "auth_tokens": {
-            "user_agent": "TEXT",
-            "revoked_at": "TIMESTAMP",
-        },
-    }
-
     repaired: Dict[str, List[str]] = {}
 
-    # PHASE 1: Create any missing tables
-    # Tables must be created in order due to foreign key dependencies
-    table_order = [
-        "users", "courses", "exams", "topics", "study_sessions", "exercises",
-        "scheduled_lectures", "timed_attempts", "assessments", "assignment_work",
-        "sessions", "events", "auth_tokens"
-    ]
-
-    for table in table_order:
-        if table not in EXPECTED_SCHEMA:
-            continue
-        if not _table_exists(table):
-            if verbose:
+    # One snapshot read decides everything below; the DDL invalidates it once at the end
+    if issues is None:
+        issues = _schema_issues()
+    if not issues:
+        return repaired
+
+    try:
+        # PHASE 1: Create any missing tables
+        # Tables must be created in order due to foreign key dependencies;
+        # COLUMNS lists them parents-first
+        to_create = [
+            table for table in _table_create_sql(_dialect_index())
+            if issues.get(table) == ["TABLE_MISSING"]
+        ]
+        if verbose:
+            for table in to_create:
                 print(f"[migrations] Repairing: Creating table {table}", file=sys.stderr)
-            if _create_table_if_missing(table):
-                repaired[table] = ["TABLE_CREATED"]
-                if verbose:
-                    print(f"[migrations] Created table: {table}", file=sys.stderr)
+        for table in _create_tables(to_create):
+            repaired[table] = ["TABLE_CREATED"]
+            if verbose:
+                print(f"[migrations] Created table: {table}", file=sys.stderr)
 
-    # PHASE 2: Add missing columns to existing tables
-    for table, expected_columns in EXPECTED_SCHEMA.items():
-        if not _table_exists(table):
-            # Table still doesn't exist (creation failed or no SQL defined)
-            continue
+        # PHASE 2: Add missing columns to existing tables
+        for table, missing in issues.items():
+            if missing == ["TABLE_MISSING"]:
+                # Created with all its columns above (or creation failed)
+                continue
 
-        added = repaired.get(table, [])
-        # Skip column check if we just created the table (it has all columns)
-        if "TABLE_CREATED" in added:
-            continue
+            # Columns with a repair definition, added in one batch per table
+            col_defs = [
+                (col, COLUMN_DEFS[table][col]) for col in missing
+                if col in COLUMN_DEFS.get(table, {})
+            ]
+            if not col_defs:
+                continue
+            if verbose:
+                for col, _ in col_defs:
+                    print(f"[migrations] Repairing: Adding {table}.{col}", file=sys.stderr)
+            if _add_columns(table, col_defs):
+                repaired[table] = [col for col, _ in col_defs]
+    finally:
+        _invalidate_schema_cache()
 
-        for col in expected_columns:
-            if not _column_exists(table, col):
-                # Get column definition
-                col_def = COLUMN_DEFS.get(table, {}).get(col)
-                if col_def:
-                    if verbose:
-                        print(f"[migrations] Repairing: Adding {table}.{col}", file=sys.stderr)
-                    if _add_column_if_missing(table, col, col_def):
-                        added.append(col)
+    return repaired
 
-        if added and table not in repaired:
-            repaired[table] = added
 
-    return repaired
+# (sqlite_sql, postgres_sql), picked with _dialect_index()
+_MIGRATIONS_TABLE_SQL = tuple(
+    f"""CREATE TABLE IF NOT EXISTS _migrations (
+    id {id_type},
+    name TEXT UNIQUE NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+    for id_type in ("INTEGER PRIMARY KEY AUTOINCREMENT", "SERIAL PRIMARY KEY")
+)
 
 
 def _ensure_migrations_table():
@@ -986,21 +1530,9 @@ def _ensure_migrations_table():
     with _get_db_connection() as conn:
         cur = conn.cursor()
         if _is_postgres():
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS _migrations (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT UNIQUE NOT NULL,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-        else:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS _migrations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
+            # Concurrent CREATE TABLE IF NOT EXISTS can still collide on Postgres
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.execute(_MIGRATIONS_TABLE_SQL[_dialect_index()])
         conn.commit()
 
 
@@ -1016,29 +1548,190 @@ def get_applied_migrations() -> List[str]:
 
 
 def get_pending_migrations() -> List[Tuple[str, str, str]]:
-    """Get list of migrations that haven't been applied yet."""
+    """Get list of migrations that haven't been applied yet, in MIGRATION_ORDER."""
     applied = set(get_applied_migrations())
-    return [m for m in MIGRATIONS if m[0] not in applied]
+    by_name = {m[0]: m for m in MIGRATIONS}
+    return [by_name[name] for name in MIGRATION_ORDER if name not in applied]
+
+
+def schema_is_current() -> bool:
+    """True if the stored fingerprint matches EXPECTED_FINGERPRINT (one row read)."""
+    with _get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT fp FROM _migrations_fingerprint")
+            rows = cur.fetchall()
+        except Exception:
+            # No fingerprint table yet; clear the aborted transaction on Postgres
+            conn.rollback()
+            return False
+    return len(rows) == 1 and rows[0][0] == EXPECTED_FINGERPRINT
 
 
-def _mark_migration_applied(name: str, conn):
-    """Record that a migration has been applied."""
+def record_schema_fingerprint():
+    """Store EXPECTED_FINGERPRINT; call only after migrations applied and the schema validated clean."""
+    with _get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS _migrations_fingerprint (fp TEXT NOT NULL)")
+        cur.execute("DELETE FROM _migrations_fingerprint")
+        placeholder = "%s" if _is_postgres() else "?"
+        cur.execute(f"INSERT INTO _migrations_fingerprint(fp) VALUES({placeholder})", (EXPECTED_FINGERPRINT,))
+        conn.commit()
+
+
+def _mark_migrations_applied(names: List[str], conn):
+    """Record that migrations have been applied (one batched INSERT)."""
+    rows = [(name,) for name in names]
     cur = conn.cursor()
     if _is_postgres():
-        cur.execute(
-            "INSERT INTO _migrations(name) VALUES(%s) ON CONFLICT (name) DO NOTHING",
-            (name,)
+        from psycopg2.extras import execute_values
+        execute_values(
+            cur,
+            "INSERT INTO _migrations(name) VALUES %s ON CONFLICT (name) DO NOTHING",
+            rows,
         )
     else:
-        cur.execute(
-            "INSERT OR IGNORE INTO _migrations(name) VALUES(?)",
-            (name,)
-        )
+        cur.executemany("INSERT OR IGNORE INTO _migrations(name) VALUES(?)", rows)
 
 
+_LEADING_COMMENTS = re.compile(r'\A(?:\s+|--[^\n]*|/\*.*?\*/)*', re.DOTALL)
+
+
+def _strip_leading_comments(stmt: str) -> str:
+    """Drop leading '-- ...' and '/* ... */' comments so a commented statement is still executed."""
+    return _LEADING_COMMENTS.sub('', stmt).strip()
+
+
+_TRIGGER_HEAD = re.compile(r'CREATE\s+(?:TEMP(?:ORARY)?\s+)?TRIGGER\b', re.IGNORECASE)
+
+
+# ';'-splitting tokens. Dollar-quoted bodies ($$ or $tag$, Postgres functions
+# and DO blocks), string literals, quoted identifiers and comments are kept
+# whole, so a ';' inside them does not end the statement. Words are separate
+# tokens so BEGIN/CASE/END nesting can be tracked.
+_STATEMENT_TOKEN = re.compile(r"""
+      \$((?:[A-Za-z_]\w*)?)\$.*?\$\1\$
+    | '(?:[^']|'')*'
+    | "(?:[^"]|"")*"
+    | --[^\n]*
+    | /\*.*?\*/
+    | \w+
+    | ;
+    | [^;'"$/\w-]+
+    | .
+""", re.DOTALL | re.VERBOSE)
+
+
+def _split_statements(sql: str) -> List[str]:
+    """
+    Split migration SQL on ';' outside dollar-quoted bodies, string literals,
+    quoted identifiers and comments.
+    Leading comments are removed from each statement. A ';' is also kept
+    while a CASE ... END, or a SQLite trigger's BEGIN ... END body, is open.
+    """
+    statements = []
+    current = []
+    depth = 0
+    for match in _STATEMENT_TOKEN.finditer(sql):
+        token = match.group(0)
+        if token == ';' and depth == 0:
+            statements.append(_strip_leading_comments(''.join(current)))
+            current = []
+            continue
+        word = token.upper()
+        if word == 'CASE' or (word == 'BEGIN' and _TRIGGER_HEAD.match(_strip_leading_comments(''.join(current)))):
+            depth += 1
+        elif word == 'END' and depth:
+            depth -= 1
+        current.append(token)
+    statements.append(_strip_leading_comments(''.join(current)))
+    return statements
+
+
+def _migration_statements(sql: str) -> Tuple[str, ...]:
+    """Executable statements of one migration (no blanks, comments or 'SELECT 1' placeholders)."""
+    statements = []
+    for stmt in _split_statements(sql.strip()):
+        stmt = stmt.strip()
+        if stmt and not stmt.startswith('--') and stmt.upper() != 'SELECT 1':
+            statements.append(stmt)
+    return tuple(statements)
+
+
+def _apply_migration(name: str, statements: Tuple[str, ...]):
+    """
+    Execute one migration's statements.
+    Does not commit or record it: _apply_migrations does both for the whole batch.
+    """
+    with _get_db_connection() as conn:
+        cur = conn.cursor()
+        for stmt in statements:
+            try:
+                cur.execute(stmt)
+            except Exception as e:
+                # SQLite has no ADD COLUMN IF NOT EXISTS; a column that
+                # repair_schema already added is not a failure
+                if "duplicate column name" in str(e).lower():
+                    continue
+                raise
+
+
+@contextmanager
+def _relaxed_sqlite_sync():
+    """
+    Run the block with PRAGMA synchronous=OFF on SQLite, restoring it after.
+    Migrations are idempotent and applied in one transaction, so a crash
+    only means they run again; no-op on Postgres.
+    """
+    if _is_postgres():
+        yield
+        return
+    with _get_db_connection() as conn:
+        previous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous=OFF")
+        try:
+            yield
+        finally:
+            conn.execute(f"PRAGMA synchronous={int(previous)}")
+
+
+def _apply_migrations(pending: List[Tuple[str, Tuple[str, ...]]], verbose: bool) -> List[str]:
+    """
+    Apply pending (name, statements) migrations in one transaction: one commit, all or nothing.
+
+    Concurrent starters (several workers booting at once) are serialized:
+    Postgres takes a transaction-scoped advisory lock, SQLite's BEGIN
+    IMMEDIATE holds the write lock. Once inside, migrations another process
+    applied meanwhile are dropped from the batch.
+    Returns the names actually applied.
+    """
+    try:
+        with _relaxed_sqlite_sync(), _db().transaction() as conn:
+            cur = conn.cursor()
+            if _is_postgres():
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cur.execute("SELECT name FROM _migrations")
+            done = {row[0] for row in cur.fetchall()}
+            pending = [(name, statements) for name, statements in pending if name not in done]
+
+            for name, statements in pending:
+                if verbose:
+                    print(f"[migrations] Applying: {name}")
+                try:
+                    _apply_migration(name, statements)
+                except Exception as e:
+                    raise MigrationError(f"Migration {name} failed: {e}")
+            if pending:
+                _mark_migrations_applied([name for name, _ in pending], conn)
+    finally:
+        _invalidate_schema_cache()
+    return [name for name, _ in pending]
+
+
+@_shared_connection
 def run_migrations(verbose: bool = True, auto_repair: bool = True) -> List[str]:
     """
-    Apply all pending migrations in order.
+    Apply all pending migrations in order, in a single transaction.
 
     Args:
         verbose: Print progress messages
@@ -1047,33 +1740,24 @@ def run_migrations(verbose: bool = True, auto_repair: bool = True) -> List[str]:
     Returns list of applied migration names.
     """
     _ensure_migrations_table()
-    applied = []
-    is_pg = _is_postgres()
-
-    for name, sql_sqlite, sql_postgres in get_pending_migrations():
-        sql = sql_postgres if is_pg else sql_sqlite
-
-        if verbose:
-            print(f"[migrations] Applying: {name}")
+    already_applied = set(get_applied_migrations())
+    pending = [
+        (name, statements) for name, statements in _migrations_for_dialect(_dialect_index())
+        if name not in already_applied
+    ]
+    applied: List[str] = []
 
+    if pending:
         try:
-            with _get_db_connection() as conn:
-                cur = conn.cursor()
-                # Execute migration SQL (may contain multiple statements)
-                for stmt in sql.strip().split(';'):
-                    stmt = stmt.strip()
-                    if stmt and not stmt.startswith('--'):
-                        # Skip placeholder statements
-                        if stmt.upper() == 'SELECT 1':
-                            continue
-                        cur.execute(stmt)
-
-                _mark_migration_applied(name, conn)
-                conn.commit()
-                applied.append(name)
-
-        except Exception as e:
-            raise MigrationError(f"Migration {name} failed: {e}")
+            applied = _apply_migrations(pending, verbose)
+        except MigrationError:
+            # Legacy SQLite databases may lack columns (e.g. user_id) that later
+            # migrations index; those are only added by repair_schema, so repair
+            # once and retry the (rolled back) batch before giving up.
+            if not auto_repair:
+                raise
+            repair_schema(verbose=verbose)
+            applied = _apply_migrations(pending, verbose)
 
     if verbose and applied:
         print(f"[migrations] Applied {len(applied)} migration(s)")
@@ -1091,6 +1775,7 @@ def run_migrations(verbose: bool = True, auto_repair: bool = True) -> List[str]:
     return applied
 
 
+@_shared_connection
 def validate_schema(raise_on_error: bool = True, auto_repair: bool = True) -> Dict[str, List[str]]:
     """
     Validate that all expected tables and columns exist.
@@ -1108,48 +1793,27 @@ def validate_schema(raise_on_error: bool = True, auto_repair: bool = True) -> Di
     Raises:
         SchemaError: If raise_on_error=True and schema is invalid after repair
     """
-    issues: Dict[str, List[str]] = {}
-
     # Log to stderr so it shows in Streamlit Cloud logs
     print("[migrations] Validating schema...", file=sys.stderr)
 
-    for table, expected_columns in EXPECTED_SCHEMA.items():
-        if not _table_exists(table):
-            issues[table] = ["TABLE_MISSING"]
+    # One schema read, then a set difference against EXPECTED_PAIRS
+    issues = _schema_issues()
+    for table, missing in issues.items():
+        if missing == ["TABLE_MISSING"]:
             print(f"[migrations] ISSUE: Table '{table}' is missing", file=sys.stderr)
-            continue
-
-        missing = []
-        for col in expected_columns:
-            if not _column_exists(table, col):
-                missing.append(col)
-
-        if missing:
-            issues[table] = missing
+        else:
             print(f"[migrations] ISSUE: Table '{table}' missing columns: {missing}", file=sys.stderr)
 
     # If there are issues and auto_repair is enabled, try to fix them
     if issues and auto_repair:
         print(f"[migrations] Found {len(issues)} schema issue(s), attempting auto-repair...", file=sys.stderr)
-        repaired = repair_schema(verbose=True)
+        repaired = repair_schema(verbose=True, issues=issues)
 
         if repaired:
             print(f"[migrations] Auto-repair applied changes: {repaired}", file=sys.stderr)
 
-        # Re-check after repair
-        issues_after = {}
-        for table, expected_columns in EXPECTED_SCHEMA.items():
-            if not _table_exists(table):
-                issues_after[table] = ["TABLE_MISSING"]
-                continue
-
-            missing = []
-            for col in expected_columns:
-                if not _column_exists(table, col):
-                    missing.append(col)
-
-            if missing:
-                issues_after[table] = missing
+        # Re-check after repair (repairs invalidate the snapshot, so this re-reads it)
+        issues_after = _schema_issues()
 
         # Log what was fixed vs what remains
         if issues_after:
@@ -1161,25 +1825,10 @@ def validate_schema(raise_on_error: bool = True, auto_repair: bool = True) -> Di
 
     # Raise error if still have issues
     if issues and raise_on_error:
-        # Build helpful error message - also log to stderr
-        error_parts = ["Schema validation failed after auto-repair attempt:"]
-        for table, cols in issues.items():
-            if cols == ["TABLE_MISSING"]:
-                error_parts.append(f"  - Missing table: {table}")
-            else:
-                error_parts.append(f"  - Table '{table}' missing columns: {cols}")
-
-        error_parts.append("")
-        error_parts.append("To fix manually:")
-        error_parts.append("  1. Delete the database file and restart (loses all data)")
-        error_parts.append("  2. Or run: python -c 'from migrations.runner import repair_schema; repair_schema(verbose=True)'")
-
-        error_message = "\n".join(error_parts)
-
+        error = SchemaError(issues)
         # Log to stderr BEFORE raising so it appears in Streamlit Cloud logs
-        print(f"[migrations] FATAL: {error_message}", file=sys.stderr)
-
-        raise SchemaError(error_message)
+        print(f"[migrations] FATAL: {error}", file=sys.stderr)
+        raise error
 
     if not issues:
         print("[migrations] Schema validation passed", file=sys.stderr)
@@ -1187,6 +1836,7 @@ def validate_schema(raise_on_error: bool = True, auto_repair: bool = True) -> Di
     return issues
 
 
+@_shared_connection
 def init_db_with_migrations(validate: bool = True, verbose: bool = False):
     """
     Initialize database with migrations and optional validation.
@@ -1197,12 +1847,16 @@ def init_db_with_migrations(validate: bool = True, verbose: bool = False):
         validate: If True, validate schema after migrations
         verbose: If True, print migration progress
     """
+    if schema_is_current():
+        return
+
     # Run pending migrations
     run_migrations(verbose=verbose)
 
     # Validate schema to catch issues early
     if validate:
         validate_schema(raise_on_error=True)
+        record_schema_fingerprint()
 
 
 # CLI interface for running migrations directly
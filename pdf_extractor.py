@@ -4,9 +4,15 @@ Extracts ONLY high-quality, course-level topics from PDF lecture slides.
 Designed to output 8-25 topics per deck, not hundreds.
 """
 
+import bisect
+import heapq
+import os
 import re
 import math
-from typing import List, Dict, Tuple
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Set, Tuple
 from collections import Counter, defaultdict
 
 # Try to import optional dependencies
@@ -17,18 +23,99 @@ except ImportError:
     HAS_PYMUPDF = False
 
 try:
-    from rapidfuzz import fuzz
+    import numpy as np
+    from rapidfuzz import fuzz, process
     HAS_RAPIDFUZZ = True
 except ImportError:
     HAS_RAPIDFUZZ = False
 
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
 
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_WS_RE = re.compile(r'\s+')
+# Same deletions as _PUNCT_RE, restricted to ASCII for the str.translate fast path
+_PUNCT_TABLE = str.maketrans({chr(i): None for i in range(128) if _PUNCT_RE.match(chr(i))})
+
+
+@lru_cache(maxsize=16384)
 def normalize_text(text: str) -> str:
     """Normalize text for comparison: lowercase, remove punctuation, collapse whitespace."""
     text = text.lower()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    if text.isascii():
+        text = text.translate(_PUNCT_TABLE)
+    else:
+        text = _PUNCT_RE.sub('', text)
+    return _WS_RE.sub(' ', text).strip()
+
+
+BOILERPLATE_PATTERNS = [
+    # Generic structural markers
+    r'^slide\s*\d*$',
+    r'^page\s*\d*$',
+    r'^chapter\s*\d*$',
+    r'^section\s*\d*$',
+    r'^lecture\s*\d*$',
+    r'^part\s*\d*$',
+    r'^unit\s*\d*$',
+
+    # Table of contents / navigation
+    r'^contents?$',
+    r'^table\s*of\s*contents$',
+    r'^outline$',
+    r'^agenda$',
+    r'^overview$',
+    r'^roadmap$',
+    r'^todays?\s*(lecture|class|agenda|topic)s?$',
+
+    # Intro/conclusion markers
+    r'^introduction$',
+    r'^intro$',
+    r'^conclusion$',
+    r'^conclusions?$',
+    r'^summary$',
+    r'^recap$',
+    r'^review$',
+
+    # Q&A and ending
+    r'^questions?\??$',
+    r'^q\s*a\s*$',
+    r'^thank\s*you.*$',
+    r'^thanks.*$',
+    r'^the\s*end$',
+
+    # References
+    r'^references?$',
+    r'^bibliography$',
+    r'^further\s*reading$',
+    r'^resources?$',
+
+    # Frankfurt School specific (as mentioned in requirements)
+    r'.*frankfurt\s*school.*',
+    r'.*fs\s*frankfurt.*',
+
+    # Generic course markers
+    r'.*university.*',
+    r'.*professor.*',
+    r'.*instructor.*',
+    r'.*dr\s*\w+.*',
+    r'.*ph\.?d\.?.*',
+    r'.*department\s*of.*',
+    r'.*course\s*code.*',
+    r'.*course\s*number.*',
+    r'.*semester.*',
+    r'.*spring\s*\d{4}.*',
+    r'.*fall\s*\d{4}.*',
+    r'.*winter\s*\d{4}.*',
+    r'.*academic\s*year.*',
+]
+
+# One alternation so a candidate costs a single match() instead of one per pattern
+_BOILERPLATE_RE = re.compile('|'.join(f'(?:{p})' for p in BOILERPLATE_PATTERNS))
 
 
 def is_boilerplate(text: str) -> bool:
@@ -36,74 +123,7 @@ def is_boilerplate(text: str) -> bool:
     Check if text is boilerplate (course name, professor, university, etc.).
     REQUIREMENT A: Reject common boilerplate patterns.
     """
-    boilerplate_patterns = [
-        # Generic structural markers
-        r'^slide\s*\d*$',
-        r'^page\s*\d*$',
-        r'^chapter\s*\d*$',
-        r'^section\s*\d*$',
-        r'^lecture\s*\d*$',
-        r'^part\s*\d*$',
-        r'^unit\s*\d*$',
-
-        # Table of contents / navigation
-        r'^contents?$',
-        r'^table\s*of\s*contents$',
-        r'^outline$',
-        r'^agenda$',
-        r'^overview$',
-        r'^roadmap$',
-        r'^todays?\s*(lecture|class|agenda|topic)s?$',
-
-        # Intro/conclusion markers
-        r'^introduction$',
-        r'^intro$',
-        r'^conclusion$',
-        r'^conclusions?$',
-        r'^summary$',
-        r'^recap$',
-        r'^review$',
-
-        # Q&A and ending
-        r'^questions?\??$',
-        r'^q\s*a\s*$',
-        r'^thank\s*you.*$',
-        r'^thanks.*$',
-        r'^the\s*end$',
-
-        # References
-        r'^references?$',
-        r'^bibliography$',
-        r'^further\s*reading$',
-        r'^resources?$',
-
-        # Frankfurt School specific (as mentioned in requirements)
-        r'.*frankfurt\s*school.*',
-        r'.*fs\s*frankfurt.*',
-
-        # Generic course markers
-        r'.*university.*',
-        r'.*professor.*',
-        r'.*instructor.*',
-        r'.*dr\s*\w+.*',
-        r'.*ph\.?d\.?.*',
-        r'.*department\s*of.*',
-        r'.*course\s*code.*',
-        r'.*course\s*number.*',
-        r'.*semester.*',
-        r'.*spring\s*\d{4}.*',
-        r'.*fall\s*\d{4}.*',
-        r'.*winter\s*\d{4}.*',
-        r'.*academic\s*year.*',
-    ]
-
-    normalized = normalize_text(text)
-
-    for pattern in boilerplate_patterns:
-        if re.match(pattern, normalized):
-            return True
-
-    return False
+    return _BOILERPLATE_RE.match(normalize_text(text)) is not None
 
 
 def is_valid_candidate_line(text: str) -> bool:
@@ -136,66 +156,55 @@ def is_valid_candidate_line(text: str) -> bool:
     return True
 
 
+# Pages scanned per PDF; some documents get pathologically slow to parse past a few hundred pages
+MAX_PAGES = 500
+
+
+def _page_lines(blocks):
+    """Yield (text, max_font_size, y_pos) for each text line worth considering."""
+    for block in blocks:
+        if "lines" not in block:
+            continue
+        for line in block["lines"]:
+            spans = line["spans"]
+            line_text = "".join(span["text"] for span in spans).strip()
+            if line_text and len(line_text) > 2:
+                max_font_size = max((span["size"] for span in spans), default=0)
+                yield line_text, max_font_size, line["bbox"][1]  # Top position
+
+
 def extract_page_candidates(page, page_num: int) -> List[Dict]:
     """
     Extract high-signal topic candidates from a single PDF page.
     REQUIREMENT A: Only consider lines with MAX font size on the page.
 
+    Walks the page's lines twice (once for the max font size, once to emit
+    candidates) instead of building an intermediate list of every line.
+
     Returns list of dicts with: text, font_size, page_num
     """
-    candidates = []
-
     # Get text blocks with font information
     blocks = page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)["blocks"]
 
-    # Collect all spans with their font sizes
-    all_spans = []
-    for block in blocks:
-        if "lines" not in block:
-            continue
-        for line in block["lines"]:
-            line_text = ""
-            max_font_size = 0
-            for span in line["spans"]:
-                line_text += span["text"]
-                max_font_size = max(max_font_size, span["size"])
-
-            line_text = line_text.strip()
-            if line_text and len(line_text) > 2:
-                all_spans.append({
-                    "text": line_text,
-                    "font_size": max_font_size,
-                    "y_pos": line["bbox"][1]  # Top position
-                })
-
-    if not all_spans:
-        return []
-
     # Find the MAXIMUM font size on this page
-    max_font = max(s["font_size"] for s in all_spans)
+    max_font = max((size for _, size, _ in _page_lines(blocks)), default=None)
+    if max_font is None:
+        return []
 
     # REQUIREMENT A: Only take lines with the MAX font size (within 5% tolerance)
     # This is key to reducing noise - we only want the biggest titles
-    max_font_candidates = [
-        s for s in all_spans
-        if s["font_size"] >= max_font * 0.95  # Within 5% of max
-    ]
+    min_font = max_font * 0.95
 
     # Filter footer/header by position (skip bottom 10% and top 5% of page)
     page_height = page.rect.height
-    max_font_candidates = [
-        s for s in max_font_candidates
-        if page_height * 0.05 < s["y_pos"] < page_height * 0.90
-    ]
+    y_top, y_bottom = page_height * 0.05, page_height * 0.90
 
-    for span in max_font_candidates:
-        text = span["text"]
-
-        # Validate the candidate
-        if is_valid_candidate_line(text):
+    candidates = []
+    for text, font_size, y_pos in _page_lines(blocks):
+        if font_size >= min_font and y_top < y_pos < y_bottom and is_valid_candidate_line(text):
             candidates.append({
                 "text": text,
-                "font_size": span["font_size"],
+                "font_size": font_size,
                 "page_num": page_num
             })
 
@@ -206,30 +215,78 @@ def extract_all_candidates(pdf_bytes: bytes, filename: str) -> Tuple[List[Dict],
     """
     Extract all candidate topics from a PDF file.
 
+    Only the first MAX_PAGES pages are scanned; the returned page count is
+    the number actually scanned, since the frequency thresholds downstream
+    are relative to it.
+
     Returns:
-        Tuple of (candidates, num_pages)
+        Tuple of (candidates, pages_processed)
     """
     if not HAS_PYMUPDF:
         raise ImportError("PyMuPDF (fitz) is required. Install with: pip install pymupdf")
 
     candidates = []
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    num_pages = len(doc)
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pages_processed = min(len(doc), MAX_PAGES)
+
+        for page_num in range(pages_processed):
+            page = doc[page_num]
+            page_candidates = extract_page_candidates(page, page_num + 1)
+            page = None  # let MuPDF drop the page before loading the next one
+
+            for cand in page_candidates:
+                candidates.append({
+                    "topic_name": cand["text"],
+                    "source_file": filename,
+                    "font_size": cand["font_size"],
+                    "page_num": cand["page_num"]
+                })
 
-    for page_num in range(num_pages):
-        page = doc[page_num]
-        page_candidates = extract_page_candidates(page, page_num + 1)
+    return candidates, pages_processed
 
-        for cand in page_candidates:
-            candidates.append({
-                "topic_name": cand["text"],
-                "source_file": filename,
-                "font_size": cand["font_size"],
-                "page_num": cand["page_num"]
-            })
 
-    doc.close()
-    return candidates, num_pages
+MAX_EXTRACT_WORKERS = 6
+
+
+def _extract_files(pdf_files: List[Tuple[bytes, str]]) -> List[Tuple[str, object]]:
+    """
+    Run extract_all_candidates over every file, one process per PDF.
+
+    MuPDF parsing is CPU-bound and holds the GIL, so several decks are parsed
+    in a process pool. A single file is parsed inline to skip the pool's
+    startup cost. Workers are spawned rather than forked: the app process
+    runs Streamlit and DB pool threads, and forking a threaded process can
+    deadlock the child on a lock held by another thread. Results come back
+    in input order so the downstream clustering stays deterministic; a
+    failing file yields its exception instead of aborting the batch.
+
+    Returns:
+        List of (filename, (candidates, num_pages) or Exception)
+    """
+    if len(pdf_files) <= 1:
+        results = []
+        for pdf_bytes, filename in pdf_files:
+            try:
+                results.append((filename, extract_all_candidates(pdf_bytes, filename)))
+            except Exception as e:
+                results.append((filename, e))
+        return results
+
+    max_workers = min(os.cpu_count() or 1, len(pdf_files), MAX_EXTRACT_WORKERS)
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as ex:
+        futures = [
+            (filename, ex.submit(extract_all_candidates, pdf_bytes, filename))
+            for pdf_bytes, filename in pdf_files
+        ]
+        for filename, future in futures:
+            try:
+                results.append((filename, future.result()))
+            except Exception as e:
+                results.append((filename, e))
+    return results
 
 
 def filter_repeated_headers(candidates: List[Dict], total_pages: int) -> List[Dict]:
@@ -301,11 +358,50 @@ def filter_by_frequency(candidates: List[Dict], total_pages: int) -> List[Dict]:
     return filtered
 
 
+def filter_headers_and_frequency(candidates: List[Dict], total_pages: int) -> Tuple[List[Dict], int]:
+    """
+    filter_repeated_headers followed by filter_by_frequency, in one grouping pass.
+
+    Both stages group by normalized text and count distinct pages, so the
+    groups are built once and both thresholds applied to them.
+
+    Returns:
+        Tuple of (filtered, after_header_filter_count)
+    """
+    if not candidates:
+        return [], 0
+
+    groups = defaultdict(list)
+    page_sets = defaultdict(set)
+    for cand in candidates:
+        normalized = normalize_text(cand["topic_name"])
+        groups[normalized].append(cand)
+        page_sets[normalized].add(cand["page_num"])
+
+    max_pages = max(1, int(total_pages * 0.10))
+    min_occurrences = max(2, math.ceil(total_pages * 0.03))
+
+    filtered = []
+    header_kept = 0
+    for normalized, group in groups.items():
+        occurrence_count = len(page_sets[normalized])
+        if occurrence_count > max_pages:
+            continue
+        header_kept += len(group)
+
+        if occurrence_count >= min_occurrences:
+            best = max(group, key=lambda c: (c.get("font_size", 0), len(c["topic_name"]))).copy()
+            best["occurrence_count"] = occurrence_count
+            filtered.append(best)
+
+    return filtered, header_kept
+
+
 def cluster_similar_topics(candidates: List[Dict], similarity_threshold: float = 90.0) -> List[Dict]:
     """
     REQUIREMENT C: Cluster and merge similar candidates using rapidfuzz.
     - Normalize strings (lowercase, remove punctuation, collapse spaces)
-    - Cluster candidates with similarity >= 90
+    - Cluster candidates with similarity >= 90 (transitively: A~B and B~C puts A, B, C together)
     - For each cluster, choose the longest informative string (but <= 80 chars)
     - Remove candidates that are strict substrings of another topic
     """
@@ -313,29 +409,33 @@ def cluster_similar_topics(candidates: List[Dict], similarity_threshold: float =
         return candidates
 
     merged = []
-    used_indices = set()
-
-    for i, cand1 in enumerate(candidates):
-        if i in used_indices:
-            continue
+    norms = [normalize_text(c["topic_name"]) for c in candidates]
 
-        cluster = [cand1]
-        used_indices.add(i)
+    # All pairwise similarities in one C call; scores below the threshold come back as 0
+    similar = process.cdist(
+        norms, norms, scorer=fuzz.ratio, score_cutoff=similarity_threshold, workers=-1
+    ) >= similarity_threshold
 
-        # Find all similar candidates
-        for j, cand2 in enumerate(candidates[i+1:], start=i+1):
-            if j in used_indices:
-                continue
+    # Union-find over similar pairs, so similarity is transitive within a cluster
+    parent = list(range(len(candidates)))
 
-            norm1 = normalize_text(cand1["topic_name"])
-            norm2 = normalize_text(cand2["topic_name"])
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
 
-            similarity = fuzz.ratio(norm1, norm2)
+    for i, j in np.argwhere(np.triu(similar, k=1)):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
 
-            if similarity >= similarity_threshold:
-                cluster.append(cand2)
-                used_indices.add(j)
+    # Clusters in order of their first member
+    clusters = defaultdict(list)
+    for i, cand in enumerate(candidates):
+        clusters[find(i)].append(cand)
 
+    for cluster in clusters.values():
         # Choose best representative from cluster
         # Prefer: most frequent, then longest (up to 80 chars), then highest font size
         best = max(cluster, key=lambda c: (
@@ -351,25 +451,53 @@ def cluster_similar_topics(candidates: List[Dict], similarity_threshold: float =
         merged.append(best)
 
     # REQUIREMENT C: Remove strict substrings
-    final = []
-    for i, cand1 in enumerate(merged):
-        is_substring = False
-        norm1 = normalize_text(cand1["topic_name"])
+    merged_norms = [normalize_text(c["topic_name"]) for c in merged]
+    contained = _strict_substrings(merged_norms)
+
+    return [cand for cand, norm in zip(merged, merged_norms) if norm not in contained]
+
 
-        for j, cand2 in enumerate(merged):
-            if i == j:
-                continue
-            norm2 = normalize_text(cand2["topic_name"])
+def _strict_substrings(norms: List[str]) -> Set[str]:
+    """
+    Return the strings in norms that occur inside a different, longer string in norms.
+
+    Uses an Aho-Corasick automaton when pyahocorasick is installed, so each
+    string is scanned once for every shorter topic it contains; otherwise
+    falls back to checking each string against the strictly longer ones.
+    """
+    distinct = set(norms)
+    contained = set()
 
-            # Check if norm1 is a strict substring of norm2
-            if norm1 in norm2 and norm1 != norm2:
-                is_substring = True
-                break
+    # The empty string is inside anything non-empty; the automaton can't hold it
+    if "" in distinct and len(distinct) > 1:
+        contained.add("")
+    distinct.discard("")
 
-        if not is_substring:
-            final.append(cand1)
+    if not HAS_AHOCORASICK:
+        # Only a strictly longer string can contain a different one
+        by_length = sorted(distinct, key=len)
+        lengths = [len(norm) for norm in by_length]
+        for i, norm1 in enumerate(by_length):
+            longer = by_length[bisect.bisect_right(lengths, lengths[i], lo=i):]
+            if any(norm1 in norm2 for norm2 in longer):
+                contained.add(norm1)
+        return contained
 
-    return final
+    automaton = ahocorasick.Automaton()
+    for norm in distinct:
+        automaton.add_word(norm, norm)
+    automaton.make_automaton()
+
+    for norm2 in distinct:
+        for _, norm1 in automaton.iter(norm2):
+            if norm1 != norm2:
+                contained.add(norm1)
+
+    return contained
+
+
+# Pattern: "ParentTopic [Roman/Number/Letter]: Subtitle"
+_HIERARCHICAL_RE = re.compile(r'^(.+?)\s+(?:[IVXivx]+|\d+|[A-Za-z])[\s:.\-]+(.+)$')
 
 
 def merge_hierarchical_topics(candidates: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
@@ -383,18 +511,12 @@ def merge_hierarchical_topics(candidates: List[Dict]) -> Tuple[List[Dict], List[
     Returns:
         Tuple of (main_topics, subtopics)
     """
-    # Pattern: "ParentTopic [Roman/Number]: Subtitle"
-    hierarchical_pattern = re.compile(
-        r'^(.+?)\s+(?:I{1,3}|IV|V|VI{0,3}|\d+|[A-Z])[\s:.\-]+(.+)$',
-        re.IGNORECASE
-    )
-
     parent_groups = defaultdict(list)
     standalone = []
 
     for cand in candidates:
         text = cand["topic_name"].strip()
-        match = hierarchical_pattern.match(text)
+        match = _HIERARCHICAL_RE.match(text)
 
         if match:
             parent_name = match.group(1).strip()
@@ -451,6 +573,19 @@ def merge_hierarchical_topics(candidates: List[Dict]) -> Tuple[List[Dict], List[
     return main_topics, all_subtopics
 
 
+def adaptive_cap(total_pages: int) -> int:
+    """Output cap for rank_and_cap_topics: N = min(25, max(8, round(sqrt(num_pages) * 3)))."""
+    return min(25, max(8, round(math.sqrt(total_pages) * 3)))
+
+
+def _rank_key(c: Dict) -> Tuple:
+    """Frequency (descending), then average font size (descending)."""
+    return (
+        -c.get("occurrence_count", 1),
+        -c.get("avg_font_size", c.get("font_size", 0))
+    )
+
+
 def rank_and_cap_topics(candidates: List[Dict], total_pages: int) -> List[Dict]:
     """
     REQUIREMENT D: Rank topics by importance and cap output.
@@ -465,19 +600,8 @@ def rank_and_cap_topics(candidates: List[Dict], total_pages: int) -> List[Dict]:
     if not candidates:
         return []
 
-    # Sort by frequency (descending), then by font size (descending)
-    ranked = sorted(
-        candidates,
-        key=lambda c: (
-            -c.get("occurrence_count", 1),
-            -c.get("avg_font_size", c.get("font_size", 0))
-        )
-    )
-
-    # Calculate adaptive cap
-    cap = min(25, max(8, round(math.sqrt(total_pages) * 3)))
-
-    return ranked[:cap]
+    # Same result as sorted(...)[:cap] (ties keep input order), but O(N log cap)
+    return heapq.nsmallest(adaptive_cap(total_pages), candidates, key=_rank_key)
 
 
 def extract_topic_candidates(pdf_files: List[Tuple[bytes, str]]) -> Tuple[List[Dict], Dict]:
@@ -501,23 +625,19 @@ def extract_topic_candidates(pdf_files: List[Tuple[bytes, str]]) -> Tuple[List[D
     total_pages = 0
 
     # Extract candidates from all PDFs
-    for pdf_bytes, filename in pdf_files:
-        try:
-            candidates, num_pages = extract_all_candidates(pdf_bytes, filename)
-            all_candidates.extend(candidates)
-            total_pages += num_pages
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+    for filename, result in _extract_files(pdf_files):
+        if isinstance(result, Exception):
+            print(f"Error processing {filename}: {result}")
             continue
+        candidates, num_pages = result
+        all_candidates.extend(candidates)
+        total_pages += num_pages
 
     raw_count = len(all_candidates)
 
     # REQUIREMENT A: Filter repeated headers (> 10% of pages)
-    after_header_filter = filter_repeated_headers(all_candidates, total_pages)
-    header_filter_count = len(after_header_filter)
-
     # REQUIREMENT B: Filter by frequency (section-level topics)
-    after_frequency_filter = filter_by_frequency(after_header_filter, total_pages)
+    after_frequency_filter, header_filter_count = filter_headers_and_frequency(all_candidates, total_pages)
     frequency_filter_count = len(after_frequency_filter)
 
     # REQUIREMENT C: Cluster similar topics
@@ -543,7 +663,7 @@ def extract_topic_candidates(pdf_files: List[Tuple[bytes, str]]) -> Tuple[List[D
         "after_hierarchical_merge": hierarchical_count,
         "final_topics": final_count,
         "subtopics": subtopics,  # Store for optional display
-        "adaptive_cap": min(25, max(8, round(math.sqrt(total_pages) * 3)))
+        "adaptive_cap": adaptive_cap(total_pages)
     }
 
     return final_topics, stats
@@ -6,6 +6,7 @@ Provides input validation, sanitization, and rate limiting helpers.
 import re
 import html
 import time
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Optional, Any, Set
 from functools import wraps
@@ -26,6 +27,11 @@ ALLOWED_TABLES: Set[str] = frozenset({
     "sessions",
     "auth_tokens",
     "events",
+    "timed_attempt_topics",
+    "lecture_topics",
+    "stats_daily_events",
+    "stats_daily_event_users",
+    "stats_daily_signups",
 })
 
 # Allowed column names for dynamic queries
@@ -57,6 +63,10 @@ def validate_table_name(table: str) -> str:
     if not table or not isinstance(table, str):
         raise ValueError("Table name must be a non-empty string")
 
+    # Fast path: already canonical, no need to build a cleaned copy
+    if table in ALLOWED_TABLES:
+        return table
+
     table_clean = table.strip().lower()
 
     if table_clean not in ALLOWED_TABLES:
@@ -73,6 +83,10 @@ def validate_column_name(column: str) -> str:
     if not column or not isinstance(column, str):
         raise ValueError("Column name must be a non-empty string")
 
+    # Fast path: already canonical, no need to build a cleaned copy
+    if column in ALLOWED_COLUMNS:
+        return column
+
     column_clean = column.strip().lower()
 
     if column_clean not in ALLOWED_COLUMNS:
@@ -108,6 +122,9 @@ def validate_identifier(name: str, identifier_type: str = "identifier") -> str:
 
 # ============ INPUT SANITIZATION ============
 
+_NEWLINES_RE = re.compile(r'[\r\n]+')
+
+
 def sanitize_string(value: str, max_length: int = 1000, allow_newlines: bool = False) -> str:
     """
     Sanitize a string input by stripping whitespace and limiting length.
@@ -125,8 +142,8 @@ def sanitize_string(value: str, max_length: int = 1000, allow_newlines: bool = F
 
     result = value.strip()
 
-    if not allow_newlines:
-        result = re.sub(r'[\r\n]+', ' ', result)
+    if not allow_newlines and ('\n' in result or '\r' in result):
+        result = _NEWLINES_RE.sub(' ', result)
 
     # Limit length
     if len(result) > max_length:
@@ -194,6 +211,9 @@ def validate_numeric_range(value: Any, min_val: Optional[float] = None,
     return True
 
 
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^a-zA-Z0-9._-]')
+
+
 def sanitize_filename(filename: str) -> str:
     """
     Sanitize a filename to prevent path traversal attacks.
@@ -214,7 +234,8 @@ def sanitize_filename(filename: str) -> str:
     filename = filename.lstrip('.')
 
     # Only keep alphanumeric, dots, hyphens, underscores
-    filename = re.sub(r'[^a-zA-Z0-9._-]', '_', filename)
+    if _UNSAFE_FILENAME_CHARS_RE.search(filename):
+        filename = _UNSAFE_FILENAME_CHARS_RE.sub('_', filename)
 
     # Limit length
     if len(filename) > 255:
@@ -236,7 +257,7 @@ class RateLimiter:
     """
 
     def __init__(self):
-        self._requests: dict = {}  # key -> list of timestamps
+        self._requests: dict = {}  # key -> deque of timestamps, oldest first
 
     def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
         """
@@ -254,18 +275,18 @@ class RateLimiter:
         cutoff = now - window_seconds
 
         # Get existing requests for this key
-        if key not in self._requests:
-            self._requests[key] = []
+        requests = self._requests.setdefault(key, deque())
 
-        # Remove old requests outside window
-        self._requests[key] = [t for t in self._requests[key] if t > cutoff]
+        # Remove old requests outside window (they sit at the left end)
+        while requests and requests[0] <= cutoff:
+            requests.popleft()
 
         # Check if under limit
-        if len(self._requests[key]) >= max_requests:
+        if len(requests) >= max_requests:
             return False
 
         # Record this request
-        self._requests[key].append(now)
+        requests.append(now)
         return True
 
     def get_retry_after(self, key: str, window_seconds: int) -> int:
@@ -278,7 +299,7 @@ class RateLimiter:
         if key not in self._requests or not self._requests[key]:
             return 0
 
-        oldest = min(self._requests[key])
+        oldest = self._requests[key][0]
         retry_after = int(oldest + window_seconds - time.time())
         return max(0, retry_after)
 
@@ -289,9 +310,10 @@ class RateLimiter:
 
         for key, timestamps in self._requests.items():
             # Remove old timestamps
-            self._requests[key] = [t for t in timestamps if t > cutoff]
+            while timestamps and timestamps[0] <= cutoff:
+                timestamps.popleft()
             # Mark empty keys for removal
-            if not self._requests[key]:
+            if not timestamps:
                 keys_to_remove.append(key)
 
         for key in keys_to_remove:
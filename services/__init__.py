@@ -47,6 +47,7 @@ from services.core import (
 # Metrics functions
 from services.metrics import (
     compute_mastery,
+    compute_mastery_bulk,
     decay_factor,
     compute_readiness,
 )
@@ -99,6 +100,7 @@ __all__ = [
     "get_onboarding_status",
     # Metrics
     "compute_mastery",
+    "compute_mastery_bulk",
     "decay_factor",
     "compute_readiness",
     # Dashboard
@@ -20,7 +20,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db import (
     execute, execute_returning, read_sql, fetchone, fetchall,
-    get_conn, is_postgres, log_event
+    get_conn, is_postgres, log_event, transaction
 )
 
 
@@ -66,7 +66,7 @@ def create_course(
     )
 
     # Log event for analytics
-    log_event(user_id, "course_created", f'{{"course_name": "{name.strip()}", "course_id": {course_id}}}')
+    log_event(user_id, "course_created", {"course_name": name.strip(), "course_id": course_id})
 
     return {
         "course_id": course_id,
@@ -495,6 +495,11 @@ def list_topics(
         (user_id, course_id)
     )
 
+    mastery_by_topic = {}
+    if include_mastery and rows:
+        from services.metrics import compute_mastery_bulk
+        mastery_by_topic = compute_mastery_bulk(course_id, date.today(), False)
+
     topics = []
     for r in (rows or []):
         topic = {
@@ -505,9 +510,7 @@ def list_topics(
         }
 
         if include_mastery:
-            from services.metrics import compute_mastery
-            today = date.today()
-            m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = compute_mastery(r[0], today, False)
+            m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = mastery_by_topic[r[0]]
             topic.update({
                 "mastery": round(m, 2),
                 "last_activity": str(last_act) if last_act else None,
@@ -752,7 +755,7 @@ def compute_course_readiness(
         - topics: list of topic readiness data
     """
     import pandas as pd
-    from services.metrics import compute_mastery, compute_readiness
+    from services.metrics import compute_mastery_bulk, compute_readiness
 
     today = date.fromisoformat(as_of_date) if as_of_date else date.today()
 
@@ -785,11 +788,12 @@ def compute_course_readiness(
             "topics": []
         }
 
-    # Compute mastery for each topic
+    # Compute mastery for every topic in one pass
+    mastery_by_topic = compute_mastery_bulk(course_id, today, False)
     mastery_data = []
     for row in topics_rows:
         topic_id = row[0]
-        m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = compute_mastery(topic_id, today, False)
+        m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = mastery_by_topic[topic_id]
         mastery_data.append({
             "id": topic_id,
             "topic_name": row[1],
@@ -1034,10 +1038,10 @@ def has_demo_data(user_id: int) -> bool:
     # Check for demo course (notes contains DEMO_MARKER)
     # Note: courses don't have notes, so we check assessments
     row = fetchone(
-        f"SELECT COUNT(*) FROM assessments WHERE user_id=? AND notes LIKE '%{DEMO_MARKER}%'",
-        (user_id,)
+        "SELECT 1 FROM assessments WHERE user_id=? AND notes LIKE ? LIMIT 1",
+        (user_id, f"%{DEMO_MARKER}%")
     )
-    return (row[0] if row else 0) > 0
+    return row is not None
 
 
 def load_demo_data(user_id: int) -> Dict[str, Any]:
@@ -1143,7 +1147,7 @@ def load_demo_data(user_id: int) -> Dict[str, Any]:
             notes=f"{DEMO_MARKER} Sample study session"
         )
 
-    log_event(user_id, "demo_data_loaded", f'{{"course_id": {course_id}}}')
+    log_event(user_id, "demo_data_loaded", {"course_id": course_id})
 
     return created
 
@@ -1168,49 +1172,26 @@ def delete_demo_data(user_id: int) -> Dict[str, Any]:
         "deleted": True
     }
 
-    # Find demo topics (by notes marker)
-    topic_rows = fetchall(
-        f"SELECT id FROM topics WHERE user_id=? AND notes LIKE '%{DEMO_MARKER}%'",
-        (user_id,)
-    )
-    topic_ids = [r[0] for r in (topic_rows or [])]
-
-    if topic_ids:
-        # Delete study sessions for demo topics
-        with get_conn() as conn:
-            cur = conn.cursor()
-            placeholder = "%s" if is_postgres() else "?"
-            placeholders = ",".join([placeholder] * len(topic_ids))
-
-            # Delete study sessions
-            cur.execute(f"DELETE FROM study_sessions WHERE topic_id IN ({placeholders})", topic_ids)
-            deleted["study_sessions"] = cur.rowcount if hasattr(cur, 'rowcount') else len(topic_ids)
-
-            # Delete exercises
-            cur.execute(f"DELETE FROM exercises WHERE topic_id IN ({placeholders})", topic_ids)
-            deleted["exercises"] = cur.rowcount if hasattr(cur, 'rowcount') else len(topic_ids)
-
-            conn.commit()
-
-        # Delete topics
-        for topic_id in topic_ids:
-            execute("DELETE FROM topics WHERE id=? AND user_id=?", (topic_id, user_id))
-        deleted["topics"] = len(topic_ids)
-
-    # Delete demo assessments
-    execute(
-        f"DELETE FROM assessments WHERE user_id=? AND notes LIKE '%{DEMO_MARKER}%'",
-        (user_id,)
-    )
-    # Count deleted (approximation since we can't get rowcount reliably)
-    deleted["assessments"] = 1 if topic_ids else 0
-
-    # Delete demo course (by name pattern)
-    execute(
-        "DELETE FROM courses WHERE user_id=? AND course_name LIKE 'Demo:%'",
-        (user_id,)
-    )
-    deleted["courses"] = 1 if topic_ids else 0
+    demo_notes = f"%{DEMO_MARKER}%"
+    demo_topics = "SELECT id FROM topics WHERE user_id=? AND notes LIKE ?"
+
+    # One transaction; each DELETE's rowcount is the count, no re-SELECT needed
+    with transaction():
+        # Activity for demo topics first, then the topics themselves
+        cur = execute(f"DELETE FROM study_sessions WHERE topic_id IN ({demo_topics})", (user_id, demo_notes))
+        deleted["study_sessions"] = cur.rowcount
+        cur = execute(f"DELETE FROM exercises WHERE topic_id IN ({demo_topics})", (user_id, demo_notes))
+        deleted["exercises"] = cur.rowcount
+        cur = execute("DELETE FROM topics WHERE user_id=? AND notes LIKE ?", (user_id, demo_notes))
+        deleted["topics"] = cur.rowcount
+
+        # Delete demo assessments
+        cur = execute("DELETE FROM assessments WHERE user_id=? AND notes LIKE ?", (user_id, demo_notes))
+        deleted["assessments"] = cur.rowcount
+
+        # Delete demo course (by name pattern)
+        cur = execute("DELETE FROM courses WHERE user_id=? AND course_name LIKE ?", (user_id, "Demo:%"))
+        deleted["courses"] = cur.rowcount
 
     log_event(user_id, "demo_data_deleted", None)
 
@@ -13,7 +13,7 @@ import os
 
 # Add parent directory to path for db import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db import read_sql, fetchone, fetchall
+from db import read_sql, fetchone, fetchall, parse_db_date
 
 # ============ DEBUG FLAG ============
 # Set to True to print diagnostic info for prediction consistency debugging.
@@ -228,7 +228,7 @@ def get_last_timed_attempt_date(user_id: int, course_id: int) -> Optional[date]:
         (user_id, course_id)
     )
     if row and row[0]:
-        return pd.to_datetime(row[0]).date()
+        return parse_db_date(row[0])
     return None
 
 
@@ -283,7 +283,7 @@ def compute_course_snapshot(
     }
     """
     from db import get_next_due_date
-    from services.metrics import compute_mastery, compute_readiness
+    from services.metrics import compute_mastery_bulk, compute_readiness
 
     # Get course details
     course_row = fetchone(
@@ -323,10 +323,11 @@ def compute_course_snapshot(
                 (user_id, course_id)
             )
             if not topics_df.empty:
+                mastery_by_topic = compute_mastery_bulk(course_id, today, is_retake)
                 mastery_data = []
                 for _, row in topics_df.iterrows():
                     topic_id = int(row['id'])
-                    m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = compute_mastery(topic_id, today, is_retake)
+                    m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = mastery_by_topic[topic_id]
                     mastery_data.append({
                         'id': topic_id,
                         'topic_name': row['topic_name'],
@@ -641,14 +642,15 @@ def generate_recommended_tasks(
         )
 
         if not topics_df.empty:
-            # Import compute_mastery and compute_readiness
-            from services.metrics import compute_mastery, compute_readiness
+            # Import compute_mastery_bulk and compute_readiness
+            from services.metrics import compute_mastery_bulk, compute_readiness
 
             # Calculate mastery and readiness for each topic
+            mastery_by_topic = compute_mastery_bulk(cid, today, False)
             mastery_data = []
             for _, row in topics_df.iterrows():
                 topic_id = int(row['id'])
-                m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = compute_mastery(topic_id, today, False)
+                m, last_act, ex_cnt, st_cnt, lec_cnt, timed_sig, timed_cnt = mastery_by_topic[topic_id]
                 mastery_data.append({
                     'id': topic_id,
                     'topic_name': row['topic_name'],
@@ -3,132 +3,190 @@ Metric computation functions for topic mastery and readiness.
 These are pure computation functions with NO Streamlit UI dependencies.
 """
 
+from bisect import bisect_left
 from datetime import date
+import numpy as np
 import pandas as pd
 import sys
 import os
 
 # Add parent directory to path for db import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db import fetchone, fetchall
+from db import fetchall, read_sql, read_sql_bulk
 
 
-def compute_mastery(topic_id: int, today: date, is_retake: bool = False) -> tuple:
+# Recency tiers (<= 7, <= 14, <= 30, older days) and the decay for each tier
+_DECAY_BREAKS = (7, 14, 30)
+_READINESS_DECAY = np.array([1.0, 0.85, 0.70, 0.55])
+_ATTEMPT_DECAY = np.array([1.0, 0.9, 0.7, 0.5])
+_SESSION_DECAY = np.array([1.0, 0.8, 0.6, 0.4])
+
+
+def _decay(days: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Per-element decay from a tier table (days at a break fall in the lower tier)."""
+    return values[np.digitize(days, _DECAY_BREAKS, right=True)]
+
+
+def _days_ago(today: date, dates: pd.Series) -> np.ndarray:
+    """Whole days between each date and today (time of day ignored)."""
+    if dates.empty:
+        return np.zeros(0, dtype=np.int64)
+    return (pd.Timestamp(today) - pd.to_datetime(dates).dt.normalize()).dt.days.to_numpy()
+
+
+def _mastery_from_frames(topic_ids, exercises: pd.DataFrame, sessions: pd.DataFrame,
+                         attempts: pd.DataFrame, lectures: pd.DataFrame,
+                         today: date, is_retake: bool) -> dict:
     """
-    Compute mastery (0-5) based on:
-    - Exercises: 50% weight (60% if retake)
-    - Study sessions: 35% weight (40% if retake)
-    - Lectures: 15% weight (0% if retake - no lectures for retakes)
-    - Timed attempts: boost exercise_score by up to 20% based on timed performance
+    Vectorized mastery for every id in topic_ids. Each frame carries topic_id:
+    exercises/sessions directly, attempts/lectures via the topic link tables
+    (lectures holds attended lectures only). Returns {topic_id: compute_mastery tuple}.
     """
-    exercises = fetchall("""
-        SELECT exercise_date, total_questions, correct_answers
-        FROM exercises WHERE topic_id=? ORDER BY exercise_date DESC
-    """, (topic_id,))
-
-    exercise_score = 0.0
-    exercise_count = len(exercises)
-    if exercises:
-        total_q = sum(e[1] for e in exercises)
-        total_correct = sum(e[2] for e in exercises)
-        if total_q > 0:
-            success_rate = total_correct / total_q
-            recent_exercises = [e for e in exercises if (today - pd.to_datetime(e[0]).date()).days <= 14]
-            recency_bonus = min(len(recent_exercises) * 0.2, 1.0)
-            exercise_score = success_rate * (0.7 + 0.3 * recency_bonus)
-
-    # Boost exercise_score based on timed attempts that include this topic
-    topic_row = fetchone("SELECT course_id, topic_name FROM topics WHERE id=?", (topic_id,))
-    timed_boost = 0.0
-    timed_signal = 0.0  # Average score from timed attempts for this topic
-    timed_count = 0
-
-    if topic_row:
-        course_id_topic, topic_name = topic_row
-        timed_attempts = fetchall("""
-            SELECT attempt_date, score_pct, topics
-            FROM timed_attempts WHERE course_id=? ORDER BY attempt_date DESC
-        """, (course_id_topic,))
-
-        topic_timed_scores = []
-        for ta in timed_attempts:
-            topics_in_attempt = ta[2] or ""
-            if topic_name.lower() in topics_in_attempt.lower():
-                score_pct = float(ta[1])
-                days_ago = (today - pd.to_datetime(ta[0]).date()).days
-                # Apply decay: recent attempts matter more
-                decay = 1.0 if days_ago <= 7 else (0.9 if days_ago <= 14 else (0.7 if days_ago <= 30 else 0.5))
-                topic_timed_scores.append(score_pct * decay)
-                timed_count += 1
-
-        if topic_timed_scores:
-            avg_timed_score = sum(topic_timed_scores) / len(topic_timed_scores)
-            timed_signal = avg_timed_score  # Store for later blending
-            # Boost up to +20% of exercise_score based on timed performance
-            timed_boost = min(avg_timed_score * 0.2, 0.2)
-            exercise_score = min(exercise_score + timed_boost, 1.0)
-
-    sessions = fetchall("""
-        SELECT session_date, duration_mins, quality
-        FROM study_sessions WHERE topic_id=? ORDER BY session_date DESC
-    """, (topic_id,))
+    index = pd.Index([int(t) for t in topic_ids], name="topic_id")
+
+    # Exercises: success rate with a bonus for recent practice
+    ex_days = _days_ago(today, exercises["exercise_date"])
+    ex = exercises.assign(recent=ex_days <= 14).groupby("topic_id").agg(
+        total_q=("total_questions", "sum"),
+        total_correct=("correct_answers", "sum"),
+        recent=("recent", "sum"),
+        exercise_count=("total_questions", "size"),
+    ).reindex(index, fill_value=0)
+    has_q = (ex["total_q"] > 0).to_numpy()
+    success_rate = ex["total_correct"].to_numpy() / np.where(has_q, ex["total_q"].to_numpy(), 1)
+    recency_bonus = np.minimum(ex["recent"].to_numpy() * 0.2, 1.0)
+    exercise_score = np.where(has_q, success_rate * (0.7 + 0.3 * recency_bonus), 0.0)
+
+    # Timed attempts that include the topic: decayed average boosts exercise_score by up to 20%
+    ta_days = _days_ago(today, attempts["attempt_date"])
+    ta = attempts.assign(
+        decayed=attempts["score_pct"].astype(float).to_numpy() * _decay(ta_days, _ATTEMPT_DECAY)
+    ).groupby("topic_id")["decayed"].agg(["mean", "size"]).reindex(index)
+    timed_count = ta["size"].fillna(0).to_numpy().astype(int)
+    timed_signal = ta["mean"].fillna(0.0).to_numpy()
+    exercise_score = np.where(
+        timed_count > 0,
+        np.minimum(exercise_score + np.minimum(timed_signal * 0.2, 0.2), 1.0),
+        exercise_score,
+    )
+
+    # Study sessions: quality x duration with recency decay
+    ss_days = _days_ago(today, sessions["session_date"])
+    ss_decay = _decay(ss_days, _SESSION_DECAY)
+    ss = sessions.assign(
+        weighted=(sessions["quality"] / 5.0) * np.minimum(sessions["duration_mins"] / 60.0, 1.5) * ss_decay
+    ).groupby("topic_id")["weighted"].agg(["sum", "size"]).reindex(index, fill_value=0)
+    study_score = np.minimum(ss["sum"].to_numpy() / 3.0, 1.0)
+
+    # Attended lectures covering the topic (not counted for retakes)
+    if is_retake:
+        lecture_count = np.zeros(len(index), dtype=int)
+    else:
+        lecture_count = lectures.groupby("topic_id").size().reindex(index, fill_value=0).to_numpy()
+    lecture_score = np.minimum(lecture_count * 0.4, 1.0)
 
-    study_score = 0.0
-    study_count = len(sessions)
-    if sessions:
-        weighted_sessions = 0.0
-        for s in sessions:
-            days_ago = (today - pd.to_datetime(s[0]).date()).days
-            quality = s[2] / 5.0
-            duration_factor = min(s[1] / 60.0, 1.5)
-            decay = 1.0 if days_ago <= 7 else (0.8 if days_ago <= 14 else (0.6 if days_ago <= 30 else 0.4))
-            weighted_sessions += quality * duration_factor * decay
-        study_score = min(weighted_sessions / 3.0, 1.0)
-
-    lecture_score = 0.0
-    lecture_count = 0
-
-    # Only count lectures if not a retake
-    if not is_retake:
-        if topic_row:
-            lectures = fetchall("""
-                SELECT lecture_date, attended, topics_planned
-                FROM scheduled_lectures WHERE course_id=? AND attended=1
-            """, (course_id_topic,))
-
-            for lec in lectures:
-                topics_covered = lec[2] or ""
-                if topic_name.lower() in topics_covered.lower():
-                    lecture_count += 1
-            lecture_score = min(lecture_count * 0.4, 1.0)
-
-    # Adjust weights based on retake status
     if is_retake:
         mastery = (exercise_score * 3.0) + (study_score * 2.0)
     else:
         mastery = (exercise_score * 2.5) + (study_score * 1.75) + (lecture_score * 0.75)
+    mastery = np.minimum(mastery, 5.0)
+
+    # Last activity across exercises and study sessions
+    activity = pd.concat([
+        pd.DataFrame({"topic_id": exercises["topic_id"], "day": pd.to_datetime(exercises["exercise_date"]).dt.normalize()}),
+        pd.DataFrame({"topic_id": sessions["topic_id"], "day": pd.to_datetime(sessions["session_date"]).dt.normalize()}),
+    ])
+    last_activity = activity.groupby("topic_id")["day"].max().reindex(index)
+
+    return {
+        topic_id: (
+            float(mastery[i]),
+            last_activity.iat[i].date() if pd.notna(last_activity.iat[i]) else None,
+            int(ex["exercise_count"].iat[i]), int(ss["size"].iat[i]), int(lecture_count[i]),
+            float(timed_signal[i]), int(timed_count[i]),
+        )
+        for i, topic_id in enumerate(index)
+    }
+
+
+def compute_mastery_bulk(course_id: int, today: date, is_retake: bool = False) -> dict:
+    """
+    compute_mastery() for every topic of a course in five queries total.
+    Returns {topic_id: (mastery, last_activity, exercise_count, study_count,
+    lecture_count, timed_signal, timed_count)}.
+    Reads through read_sql_bulk(): dates are normalized by _days_ago and the
+    integer columns are NOT NULL, so PG_READ_CONNECTORX gives the same result.
+    """
+    topics = fetchall("SELECT id FROM topics WHERE course_id=?", (course_id,))
+    if not topics:
+        return {}
+    exercises = read_sql_bulk("""
+        SELECT e.topic_id, e.exercise_date, e.total_questions, e.correct_answers
+        FROM exercises e JOIN topics t ON t.id = e.topic_id WHERE t.course_id=?
+    """, (course_id,))
+    sessions = read_sql_bulk("""
+        SELECT s.topic_id, s.session_date, s.duration_mins, s.quality
+        FROM study_sessions s JOIN topics t ON t.id = s.topic_id WHERE t.course_id=?
+    """, (course_id,))
+    attempts = read_sql_bulk("""
+        SELECT x.topic_id, a.attempt_date, a.score_pct
+        FROM timed_attempt_topics x
+        JOIN topics t ON t.id = x.topic_id
+        JOIN timed_attempts a ON a.id = x.attempt_id
+        WHERE t.course_id=?
+    """, (course_id,))
+    lectures = read_sql_bulk("""
+        SELECT x.topic_id
+        FROM lecture_topics x
+        JOIN topics t ON t.id = x.topic_id
+        JOIN scheduled_lectures l ON l.id = x.lecture_id
+        WHERE t.course_id=? AND l.attended=1
+    """, (course_id,))
+    return _mastery_from_frames(
+        [r[0] for r in topics], exercises, sessions, attempts, lectures, today, is_retake
+    )
 
-    mastery = min(mastery, 5.0)
 
-    all_dates = []
-    for e in exercises:
-        all_dates.append(pd.to_datetime(e[0]).date())
-    for s in sessions:
-        all_dates.append(pd.to_datetime(s[0]).date())
-    last_activity = max(all_dates) if all_dates else None
+def compute_mastery(topic_id: int, today: date, is_retake: bool = False) -> tuple:
+    """
+    Compute mastery (0-5) based on:
+    - Exercises: 50% weight (60% if retake)
+    - Study sessions: 35% weight (40% if retake)
+    - Lectures: 15% weight (0% if retake - no lectures for retakes)
+    - Timed attempts: boost exercise_score by up to 20% based on timed performance
 
-    return mastery, last_activity, exercise_count, study_count, lecture_count, timed_signal, timed_count
+    For every topic of a course at once, use compute_mastery_bulk().
+    """
+    exercises = read_sql(
+        "SELECT topic_id, exercise_date, total_questions, correct_answers FROM exercises WHERE topic_id=?",
+        (topic_id,)
+    )
+    sessions = read_sql(
+        "SELECT topic_id, session_date, duration_mins, quality FROM study_sessions WHERE topic_id=?",
+        (topic_id,)
+    )
+    attempts = read_sql("""
+        SELECT x.topic_id, a.attempt_date, a.score_pct
+        FROM timed_attempt_topics x JOIN timed_attempts a ON a.id = x.attempt_id
+        WHERE x.topic_id=?
+    """, (topic_id,))
+    lectures = read_sql("""
+        SELECT x.topic_id
+        FROM lecture_topics x JOIN scheduled_lectures l ON l.id = x.lecture_id
+        WHERE x.topic_id=? AND l.attended=1
+    """, (topic_id,))
+    return _mastery_from_frames(
+        [topic_id], exercises, sessions, attempts, lectures, today, is_retake
+    )[int(topic_id)]
 
 
 def decay_factor(days_since: int) -> float:
     """Calculate decay factor based on days since last activity."""
-    if days_since <= 7:
-        return 1.0
-    if days_since <= 14:
-        return 0.85
-    if days_since <= 30:
-        return 0.70
-    return 0.55
+    if days_since != days_since:
+        # NaN (no activity) fails every <= comparison, so it belongs to the
+        # oldest tier; bisect would put it in the newest
+        return 0.55
+    return float(_READINESS_DECAY[bisect_left(_DECAY_BREAKS, days_since)])
 
 
 def compute_readiness(topics_with_mastery: pd.DataFrame, today: date):
@@ -145,14 +203,9 @@ def compute_readiness(topics_with_mastery: pd.DataFrame, today: date):
     """
     df = topics_with_mastery.copy()
 
-    # Readiness = mastery / 5.0 (mastery percentage)
-    readiness_vals = []
-    for _, r in df.iterrows():
-        m = float(r["mastery"]) if pd.notna(r["mastery"]) else 0
-        # Readiness = mastery as percentage of 5
-        readiness_vals.append(m / 5.0)
-
-    df["readiness"] = readiness_vals
+    # Readiness = mastery / 5.0 (mastery percentage); missing mastery counts as 0
+    mastery = pd.to_numeric(df["mastery"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    df["readiness"] = mastery / 5.0
     df["expected_points"] = df["weight_points"] * df["readiness"]
 
     total_weight = float(df["weight_points"].sum()) if not df.empty else 0.0
@@ -0,0 +1,110 @@
+"""
+Unit Tests for the migration runner helpers
+(statement splitting, dependency ordering).
+"""
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+from migrations.runner import (
+    MIGRATIONS,
+    MIGRATION_DEPENDS,
+    MIGRATION_ORDER,
+    MigrationError,
+    _split_statements,
+    _topological_order,
+)
+
+
+class TestSplitStatements:
+    """';' only ends a statement outside quotes, comments and BEGIN/CASE ... END"""
+
+    def test_plain_statements(self):
+        assert _split_statements("SELECT 1; SELECT 2") == ["SELECT 1", "SELECT 2"]
+
+    def test_semicolon_in_string_literal(self):
+        assert _split_statements("SELECT 'a;b'; SELECT 2") == ["SELECT 'a;b'", "SELECT 2"]
+
+    def test_semicolon_in_line_comment(self):
+        stmts = _split_statements("-- note; more\nSELECT 1; SELECT 2")
+        assert stmts == ["SELECT 1", "SELECT 2"]
+
+    def test_semicolon_in_block_comment(self):
+        stmts = _split_statements("SELECT 1 /* a; b */ + 1; /* lead; */ SELECT 2")
+        assert stmts == ["SELECT 1 /* a; b */ + 1", "SELECT 2"]
+
+    def test_semicolon_in_quoted_identifier(self):
+        stmts = _split_statements('CREATE TABLE "a;b" (x INTEGER); SELECT 2')
+        assert stmts == ['CREATE TABLE "a;b" (x INTEGER)', "SELECT 2"]
+
+    def test_semicolon_in_plain_dollar_quote(self):
+        sql = "DO $$ BEGIN PERFORM 1; END $$; SELECT 2"
+        assert _split_statements(sql) == ["DO $$ BEGIN PERFORM 1; END $$", "SELECT 2"]
+
+    def test_semicolon_in_tagged_dollar_quote(self):
+        sql = (
+            "CREATE FUNCTION f() RETURNS trigger AS $body$ BEGIN RETURN $$x;$$; END; $body$ LANGUAGE plpgsql;"
+            " SELECT 2"
+        )
+        stmts = _split_statements(sql)
+        assert len(stmts) == 2
+        assert stmts[0].endswith("$body$ LANGUAGE plpgsql")
+        assert stmts[1] == "SELECT 2"
+
+    def test_sqlite_trigger_body(self):
+        sql = (
+            "CREATE TRIGGER t AFTER INSERT ON a BEGIN\n"
+            "    INSERT INTO b VALUES (NEW.id);\n"
+            "    DELETE FROM c;\n"
+            "END;\n"
+            "SELECT 2"
+        )
+        stmts = _split_statements(sql)
+        assert len(stmts) == 2
+        assert stmts[0].startswith("CREATE TRIGGER t") and stmts[0].endswith("END")
+        assert stmts[1] == "SELECT 2"
+
+    def test_sqlite_trigger_body_with_case(self):
+        sql = (
+            "CREATE TRIGGER t AFTER INSERT ON a BEGIN\n"
+            "    UPDATE b SET x = CASE WHEN NEW.y > 0 THEN 1 ELSE 0 END;\n"
+            "    DELETE FROM c WHERE id = NEW.id;\n"
+            "END;\n"
+            "SELECT 2"
+        )
+        stmts = _split_statements(sql)
+        assert len(stmts) == 2
+        assert "DELETE FROM c" in stmts[0] and stmts[0].endswith("END")
+
+    def test_case_outside_trigger(self):
+        stmts = _split_statements("SELECT CASE WHEN 1 THEN 'a;' END; SELECT 2")
+        assert stmts == ["SELECT CASE WHEN 1 THEN 'a;' END", "SELECT 2"]
+
+    def test_transaction_begin_is_not_a_block(self):
+        assert _split_statements("BEGIN; SELECT 1; COMMIT") == ["BEGIN", "SELECT 1", "COMMIT"]
+
+
+class TestTopologicalOrder:
+    """Migrations run in registry order unless a declared dependency says otherwise"""
+
+    def test_registry_order_without_dependencies(self):
+        assert _topological_order(["a", "b", "c"], {}) == ("a", "b", "c")
+
+    def test_dependency_moves_migration_later(self):
+        assert _topological_order(["a", "b", "c"], {"a": ("c",)}) == ("b", "c", "a")
+
+    def test_cycle_raises(self):
+        with pytest.raises(MigrationError, match="cycle"):
+            _topological_order(["a", "b", "c"], {"a": ("b",), "b": ("a",)})
+
+    def test_unknown_dependency_raises(self):
+        with pytest.raises(MigrationError, match="Unknown"):
+            _topological_order(["a", "b"], {"a": ("missing",)})
+
+    def test_registry_order_is_valid(self):
+        assert sorted(MIGRATION_ORDER) == sorted(name for name, _, _ in MIGRATIONS)
+        position = {name: i for i, name in enumerate(MIGRATION_ORDER)}
+        for name, deps in MIGRATION_DEPENDS.items():
+            assert all(position[dep] < position[name] for dep in deps)
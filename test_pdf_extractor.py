@@ -13,11 +13,17 @@ from pdf_extractor import (
     is_valid_candidate_line,
     filter_repeated_headers,
     filter_by_frequency,
+    filter_headers_and_frequency,
     cluster_similar_topics,
     merge_hierarchical_topics,
     rank_and_cap_topics,
-    normalize_text
+    normalize_text,
+    extract_all_candidates,
+    HAS_PYMUPDF,
+    _extract_files,
+    _strict_substrings,
 )
+import pdf_extractor
 
 
 class TestBoilerplateDetection:
@@ -118,6 +124,39 @@ class TestFrequencyFilter:
         assert "Pair Topic" in topic_names
 
 
+class TestFusedHeaderFrequencyFilter:
+    """filter_headers_and_frequency equals the two filters run one after the other"""
+
+    def _candidates(self, total_pages):
+        candidates = [
+            {"topic_name": "Course Header", "page_num": i, "font_size": 12}
+            for i in range(1, total_pages + 1)
+        ]
+        for topic, pages in [
+            ("Supply and Demand", [2, 3, 4]),
+            ("supply  and demand", [5]),
+            ("Elasticity", [6, 7]),
+            ("One-off Slide", [8]),
+            ("Monopoly", [9, 9, 10]),
+        ]:
+            candidates.extend({"topic_name": topic, "page_num": p, "font_size": 24} for p in pages)
+        return candidates
+
+    def test_matches_sequential_filters(self):
+        for total_pages in (10, 40, 100):
+            candidates = self._candidates(total_pages)
+            after_headers = filter_repeated_headers(candidates, total_pages)
+            expected = filter_by_frequency(after_headers, total_pages)
+
+            fused, header_count = filter_headers_and_frequency(candidates, total_pages)
+
+            assert header_count == len(after_headers)
+            assert fused == expected
+
+    def test_empty(self):
+        assert filter_headers_and_frequency([], 10) == ([], 0)
+
+
 class TestSimilarityClustering:
     """Test Requirement C: Similarity clustering with rapidfuzz"""
 
@@ -138,6 +177,23 @@ class TestSimilarityClustering:
         assert any("Market Equilibri" in t for t in topic_names)
         assert any("Game Theor" in t for t in topic_names)
 
+    def test_transitive_chain_merges(self):
+        # A~B and B~C clear the threshold, A~C alone does not
+        candidates = [
+            {"topic_name": "Market Equilibrium", "occurrence_count": 3, "font_size": 24},
+            {"topic_name": "Market Equilibria", "occurrence_count": 2, "font_size": 22},
+            {"topic_name": "Markets Equilibria", "occurrence_count": 1, "font_size": 20},
+            {"topic_name": "Game Theory", "occurrence_count": 4, "font_size": 24},
+        ]
+
+        merged = cluster_similar_topics(candidates, similarity_threshold=90.0)
+
+        # The whole chain collapses into one topic
+        assert len(merged) == 2
+        assert merged[0]["topic_name"] == "Market Equilibrium"
+        assert merged[0]["occurrence_count"] == 6
+        assert merged[1]["topic_name"] == "Game Theory"
+
     def test_substring_removal(self):
         candidates = [
             {"topic_name": "Oligopoly", "occurrence_count": 5, "font_size": 24},
@@ -354,6 +410,63 @@ class TestEndToEndReduction:
             print(f"  {i}. {topic['topic_name']}{subtopics_marker} (freq: {topic.get('occurrence_count', 'N/A')})")
 
 
+class TestStrictSubstrings:
+    """Aho-Corasick and the length-sorted fallback prune the same topics"""
+
+    NORMS = [
+        "market", "market power", "market equilibrium", "equilibrium", "nash equilibrium",
+        "game", "game theory", "theory", "a", "", "supply and demand", "demand",
+        "market", "oligopoly i cournot", "oligopoly", "cournot", "überblick", "blick",
+    ]
+
+    def _brute_force(self, norms):
+        return {n1 for n1 in set(norms) for n2 in set(norms) if n1 != n2 and n1 in n2}
+
+    def test_fallback_matches_brute_force(self, monkeypatch):
+        monkeypatch.setattr(pdf_extractor, "HAS_AHOCORASICK", False)
+        assert _strict_substrings(self.NORMS) == self._brute_force(self.NORMS)
+
+    def test_automaton_matches_fallback(self, monkeypatch):
+        if not pdf_extractor.HAS_AHOCORASICK:
+            pytest.skip("pyahocorasick not installed")
+        with_automaton = _strict_substrings(self.NORMS)
+        monkeypatch.setattr(pdf_extractor, "HAS_AHOCORASICK", False)
+        assert with_automaton == _strict_substrings(self.NORMS) == self._brute_force(self.NORMS)
+
+
+def _make_pdf(titles):
+    """One page per title, the title set large enough to be a heading candidate."""
+    import fitz
+    doc = fitz.open()
+    for title in titles:
+        page = doc.new_page()
+        page.insert_text((72, 100), title, fontsize=24)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class TestExtractFiles:
+    """Test the per-file process pool used for multi-PDF uploads"""
+
+    def test_pool_matches_inline(self):
+        if not HAS_PYMUPDF:
+            pytest.skip("PyMuPDF not installed")
+        pdf_files = [
+            (_make_pdf(["Supply and Demand", "Market Equilibrium"]), "a.pdf"),
+            (_make_pdf(["Game Theory", "Nash Equilibrium", "Monopoly"]), "b.pdf"),
+            (b"not a pdf", "broken.pdf"),
+        ]
+        results = _extract_files(pdf_files)
+
+        assert [name for name, _ in results] == ["a.pdf", "b.pdf", "broken.pdf"]
+        for (pdf_bytes, filename), (_, result) in zip(pdf_files[:2], results):
+            assert result == extract_all_candidates(pdf_bytes, filename)
+        assert [c["topic_name"] for c in results[0][1][0]] == ["Supply and Demand", "Market Equilibrium"]
+        assert results[1][1][1] == 3
+        assert isinstance(results[2][1], Exception)
+
+
 if __name__ == "__main__":
     # Run the realistic scenario test
     test = TestEndToEndReduction()
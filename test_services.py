@@ -18,7 +18,8 @@ import sys
 import os
 import tempfile
 import json
-from datetime import date, timedelta
+import time
+from datetime import date, datetime, timedelta
 
 # Ensure we can import from the project root
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -43,9 +44,44 @@ from services import (
     add_study_session, add_exercise, add_timed_attempt,
     # Analytics
     compute_course_readiness, generate_week_plan, generate_recommended_tasks,
+    # Metrics
+    compute_mastery, compute_mastery_bulk, decay_factor,
 )
 
 
+def _pandas_links(course_id: int, table: str, text_col: str) -> set:
+    """(row id, topic id) pairs as the old pandas matcher found them: topic name in lowered text."""
+    topics = db.read_sql("SELECT id, topic_name FROM topics WHERE course_id=?", (course_id,))
+    rows = db.read_sql(f"SELECT id, {text_col} FROM {table} WHERE course_id=?", (course_id,))
+    text = rows[text_col].fillna("").str.lower()
+    return {
+        (int(row_id), int(topic_id))
+        for topic_id, name in zip(topics["id"], topics["topic_name"]) if name
+        for row_id in rows["id"][text.str.contains(name.lower(), regex=False)]
+    }
+
+
+def _linked(course_id: int, link_table: str, row_col: str) -> set:
+    """(row id, topic id) pairs currently stored in a topic link table for a course."""
+    rows = db.fetchall(
+        f"SELECT x.{row_col}, x.topic_id FROM {link_table} x JOIN topics t ON t.id = x.topic_id WHERE t.course_id=?",
+        (course_id,),
+    )
+    return {(int(a), int(b)) for a, b in rows}
+
+
+def _rollups() -> dict:
+    """{rollup table: sorted rows} for the daily admin-stats rollups."""
+    return {
+        table: sorted(db.fetchall(f"SELECT {cols} FROM {table}"))
+        for table, cols in (
+            ("stats_daily_events", "day, event_name, event_count"),
+            ("stats_daily_event_users", "day, event_name, user_id"),
+            ("stats_daily_signups", "day, new_users"),
+        )
+    }
+
+
 def test_passed(name: str):
     print(f"  [PASS] {name}")
 
@@ -83,6 +119,18 @@ def run_tests():
         all_passed = test_failed("create_course", str(result))
         return False
 
+    # Event metadata is real JSON, even for names with quotes/backslashes
+    quoted = create_course(test_user_id, 'Say "hi" \\ bye')
+    row = db.fetchone(
+        "SELECT metadata FROM events WHERE event_name='course_created' AND user_id=? ORDER BY id DESC LIMIT 1",
+        (test_user_id,),
+    )
+    if row and json.loads(row[0]) == {"course_name": 'Say "hi" \\ bye', "course_id": quoted["course_id"]}:
+        test_passed("course_created metadata")
+    else:
+        all_passed = test_failed("course_created metadata", str(row))
+    delete_course(test_user_id, quoted["course_id"])
+
     # List courses
     courses = list_courses(test_user_id)
     if len(courses) == 1 and courses[0]["name"] == "Test Economics":
@@ -216,6 +264,30 @@ def run_tests():
     # ========================================
     print("\n5. Analytics & Readiness")
 
+    # Bulk and per-topic mastery match the baseline per-topic implementation:
+    # (mastery, last_activity, exercises, sessions, lectures, timed_signal, timed_count)
+    expected = {
+        topic1["id"]: (2.37, today, 1, 1, 0, 72.5, 1),
+        topic2["id"]: (0.0, None, 0, 0, 0, 0.0, 0),
+        topic3["id"]: (0.5, None, 0, 0, 0, 72.5, 1),
+    }
+    bulk = compute_mastery_bulk(course_id, today)
+    single = {tid: compute_mastery(tid, today) for tid in expected}
+    for label, got in (("compute_mastery_bulk", bulk), ("compute_mastery", single)):
+        if got.keys() == expected.keys() and all(
+            abs(got[tid][0] - expected[tid][0]) < 1e-9 and got[tid][1:] == expected[tid][1:] for tid in expected
+        ):
+            test_passed(label)
+        else:
+            all_passed = test_failed(label, f"{got} != {expected}")
+
+    # Decay tiers, including the NaN days of a topic with no activity
+    got = [decay_factor(d) for d in (0, 7, 8, 14, 15, 30, 31, 365, float("nan"))]
+    if got == [1.0, 1.0, 0.85, 0.85, 0.70, 0.70, 0.55, 0.55, 0.55]:
+        test_passed("decay_factor")
+    else:
+        all_passed = test_failed("decay_factor", str(got))
+
     # Compute course readiness
     readiness = compute_course_readiness(test_user_id, course_id)
     if "predicted_marks" in readiness and "status" in readiness and "topics" in readiness:
@@ -268,6 +340,152 @@ def run_tests():
     else:
         all_passed = test_failed("verify deletion", f"Expected 0 courses, got {len(remaining)}")
 
+    # ========================================
+    # TEST: Topic links (non-ASCII names)
+    # ========================================
+    print("\n7. Topic Links")
+
+    def links_match(course_id):
+        return (
+            _linked(course_id, "timed_attempt_topics", "attempt_id") == _pandas_links(course_id, "timed_attempts", "topics")
+            and _linked(course_id, "lecture_topics", "lecture_id") == _pandas_links(course_id, "scheduled_lectures", "topics_planned")
+        )
+
+    vwl = create_course(test_user_id, "Volkswirtschaft")["course_id"]
+    oek = create_topic(test_user_id, vwl, "Ökonomie")["id"]
+    strasse = create_topic(test_user_id, vwl, "Straße")["id"]
+    a1 = add_timed_attempt(test_user_id, vwl, today.isoformat(), "Probeklausur", 60, 70.0, topics="ökonomie")["id"]
+    add_timed_attempt(test_user_id, vwl, today.isoformat(), "Altklausur", 60, 55.0, topics="ÖKONOMIE, Straße")
+    a3 = add_timed_attempt(test_user_id, vwl, today.isoformat(), "Übungsblatt", 30, 80.0, topics="ÜBUNG I")["id"]
+    lecture = db.execute_returning(
+        "INSERT INTO scheduled_lectures(user_id, course_id, lecture_date, topics_planned, attended) VALUES(?,?,?,?,1)",
+        (test_user_id, vwl, today.isoformat(), "ÖKONOMIE und STRAẞE"),
+    )
+    if links_match(vwl) and len(_linked(vwl, "timed_attempt_topics", "attempt_id")) == 3:
+        test_passed("topic links on insert")
+    else:
+        all_passed = test_failed("topic links on insert", str(_linked(vwl, "timed_attempt_topics", "attempt_id")))
+
+    db.execute("UPDATE timed_attempts SET topics=? WHERE id=?", ("STRAẞE", a1))
+    db.execute("UPDATE scheduled_lectures SET topics_planned=? WHERE id=?", ("Reise nach ÖSTERREICH", lecture))
+    update_topic(test_user_id, oek, name="Österreich")
+    if (
+        links_match(vwl)
+        and (a1, strasse) in _linked(vwl, "timed_attempt_topics", "attempt_id")
+        and _linked(vwl, "lecture_topics", "lecture_id") == {(lecture, oek)}
+    ):
+        test_passed("topic links on update")
+    else:
+        all_passed = test_failed("topic links on update", str(_linked(vwl, "timed_attempt_topics", "attempt_id")))
+
+    uebung = create_topic(test_user_id, vwl, "Übung")["id"]
+    if links_match(vwl) and (a3, uebung) in _linked(vwl, "timed_attempt_topics", "attempt_id"):
+        test_passed("topic links for a new topic")
+    else:
+        all_passed = test_failed("topic links for a new topic", str(_linked(vwl, "timed_attempt_topics", "attempt_id")))
+    delete_course(test_user_id, vwl)
+
+    # ========================================
+    # TEST: Epoch columns for raw inserts
+    # ========================================
+    print("\n8. Epoch Columns")
+
+    # The test user was inserted without created_at_epoch (see the top of run_tests)
+    user_epoch = db.fetchone("SELECT created_at_epoch FROM users WHERE id=?", (test_user_id,))[0]
+    db.execute("INSERT INTO events(user_id, event_name) VALUES(?,?)", (test_user_id, "manual_event"))
+    event_epoch = db.fetchone("SELECT event_time_epoch FROM events WHERE event_name='manual_event'")[0]
+    manual_count = db.fetchone("SELECT SUM(event_count) FROM stats_daily_events WHERE event_name='manual_event'")[0]
+    signups = db.fetchone("SELECT SUM(new_users) FROM stats_daily_signups")[0]
+    if user_epoch and event_epoch and manual_count == 1 and signups == 1:
+        test_passed("epoch filled and rolled up for raw inserts")
+    else:
+        all_passed = test_failed("epoch columns", str((user_epoch, event_epoch, manual_count, signups)))
+
+    # Text timestamps the app writes are local time from the same clock as the epoch
+    db.update_last_login(test_user_id)
+    db.upsert_session(test_user_id, "clock-check")
+    login_at, login_epoch = db.fetchone("SELECT last_login_at, last_login_epoch FROM users WHERE id=?", (test_user_id,))
+    seen_at, seen_epoch = db.fetchone(
+        "SELECT last_seen_at, last_seen_epoch FROM sessions WHERE session_id='clock-check'"
+    )
+    if all(
+        abs(datetime.fromisoformat(str(text)).timestamp() - epoch) < 1
+        for text, epoch in ((login_at, login_epoch), (seen_at, seen_epoch))
+    ):
+        test_passed("last_login / last_seen text and epoch agree")
+    else:
+        all_passed = test_failed("text vs epoch", str((login_at, login_epoch, seen_at, seen_epoch)))
+    db.end_session(test_user_id, "clock-check")
+
+    # ========================================
+    # TEST: Daily rollups
+    # ========================================
+    print("\n9. Daily Rollups")
+
+    # The insert triggers kept the rollups current through the run; a full
+    # rebuild from events and users must land on the same rows
+    incremental = _rollups()
+    db.rebuild_stats_daily()
+    rebuilt = _rollups()
+    if incremental == rebuilt and all(rebuilt.values()):
+        test_passed("trigger rollups match rebuild_stats_daily")
+    else:
+        all_passed = test_failed("trigger rollups", f"{incremental} != {rebuilt}")
+    # The rebuild stages one events scan in a temp table; it must equal
+    # grouping events and users directly, one query per rollup
+    direct = {
+        "stats_daily_events": sorted(db.fetchall(
+            "SELECT event_time_epoch / 86400, event_name, COUNT(*) FROM events "
+            "WHERE event_time_epoch IS NOT NULL GROUP BY event_time_epoch / 86400, event_name"
+        )),
+        "stats_daily_event_users": sorted(db.fetchall(
+            "SELECT DISTINCT event_time_epoch / 86400, event_name, user_id FROM events "
+            "WHERE event_time_epoch IS NOT NULL AND user_id IS NOT NULL"
+        )),
+        "stats_daily_signups": sorted(db.fetchall(
+            "SELECT created_at_epoch / 86400, COUNT(*) FROM users "
+            "WHERE created_at_epoch IS NOT NULL GROUP BY created_at_epoch / 86400"
+        )),
+    }
+    if rebuilt == direct:
+        test_passed("rebuild_stats_daily matches direct grouping")
+    else:
+        all_passed = test_failed("rebuild_stats_daily", f"{rebuilt} != {direct}")
+    # Windows are exact: rows just inside / outside each cutoff land correctly
+    now = int(time.time())
+    for i, offset in enumerate((86400, 7 * 86400, 30 * 86400)):
+        for side, delta in (("in", -120), ("out", 120)):
+            uid = db.execute_returning(
+                "INSERT INTO users(email, password_hash, created_at_epoch) VALUES(?,?,?)",
+                (f"window{i}{side}@example.com", "", now - offset - delta),
+            )
+            db.execute(
+                "INSERT INTO events(user_id, event_name, event_time_epoch) VALUES(?,?,?)",
+                (uid, "course_created", now - offset - delta),
+            )
+    got = db.get_admin_stats()
+    expected = {}
+    for label, days in (("day", 1), ("week", 7), ("month", 30)):
+        cutoff = int(time.time()) - days * 86400
+        expected[f"users_{label}"] = db.fetchone(
+            "SELECT COUNT(*) FROM users WHERE created_at_epoch >= ?", (cutoff,)
+        )[0]
+        expected[f"course_creators_{label}"] = db.fetchone(
+            "SELECT COUNT(DISTINCT user_id) FROM events WHERE event_name='course_created' AND event_time_epoch >= ?",
+            (cutoff,),
+        )[0]
+    if all(got[key] == value for key, value in expected.items()):
+        test_passed("get_admin_stats rolling windows")
+    else:
+        all_passed = test_failed("get_admin_stats windows", f"{got} != {expected}")
+    db.rebuild_stats_daily()
+    stats = got
+
+    if db.get_admin_stats() == stats and stats["total_courses_created"] >= 1:
+        test_passed("get_admin_stats unchanged by rebuild")
+    else:
+        all_passed = test_failed("get_admin_stats", f"{stats} != {db.get_admin_stats()}")
+
     # ========================================
     # SUMMARY
     # ========================================